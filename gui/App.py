@@ -212,7 +212,7 @@ class ShipRadarApp(flet.UserControl):
                 )
             )
         if troute.match("/plot"):
-            self.plot = Plot(self.page, self.page.session.get('filter'), "Plot")
+            self.plot = Plot(self.page, self.page.session.get('filter'), "Plot", self.page.session.get('refresh'))
             self.page.views.append(
                 flet.View(
                     "/plot",
@@ -10,6 +10,19 @@ from src.logger import ShipRadarLogger
 from src.reader import ShipRadarFilter
 
 
+def parse_bound(value: str, convert: type) -> Union[None, int, float]:
+    """
+    Parses one side of a range filter
+    :param value: text of the field
+    :param convert: int or float
+    :return: converted value, None if the field is empty (unbounded side)
+    :raises ValueError: if the text is not a number
+    """
+    # Allow a decimal comma, like in the CSV files
+    value = str(value).strip().replace(",", ".")
+    return convert(value) if value else None
+
+
 class NameFilter(flet.UserControl):
     """
     Filter by ship name
@@ -140,6 +153,8 @@ class LocationFilter(flet.UserControl):
                                  text_align=flet.TextAlign.CENTER)
         self.y2 = flet.TextField(label="To latitude", keyboard_type=flet.KeyboardType.NUMBER, width=100,
                                  text_align=flet.TextAlign.CENTER)
+        self.antimeridian = flet.Checkbox(label="Crosses antimeridian (eastwards from 'From' to 'To' longitude)",
+                                          value=False)
 
     def build(self) -> flet.Control:
         """
@@ -154,6 +169,7 @@ class LocationFilter(flet.UserControl):
                             self.x1, self.y1, self.x2, self.y2
                         ]
                     ),
+                self.antimeridian,
                 flet.ElevatedButton(text="Submit", on_click=self.submit)
             ]
         )
@@ -182,7 +198,8 @@ class LocationFilter(flet.UserControl):
                                       self.x1.value,
                                       self.y1.value,
                                       self.x2.value,
-                                      self.y2.value
+                                      self.y2.value,
+                                      self.antimeridian.value
                                       )
         self.page.session.set('location_filter', self.filter)
         self.page.go("/filters")
@@ -330,8 +347,10 @@ class HeadingFilter(flet.UserControl):
         self.logger = ShipRadarLogger("HeadingFilter")
         self.page = page
         self.page.title = "Filter: Heading"
-        self.text_field = flet.TextField(label="Heading", keyboard_type=flet.KeyboardType.NUMBER,
-                                         text_align=flet.TextAlign.CENTER)
+        self.min_field = flet.TextField(label="Min heading", keyboard_type=flet.KeyboardType.NUMBER, width=150,
+                                        text_align=flet.TextAlign.CENTER)
+        self.max_field = flet.TextField(label="Max heading", keyboard_type=flet.KeyboardType.NUMBER, width=150,
+                                        text_align=flet.TextAlign.CENTER)
 
     def build(self) -> flet.Control:
         """
@@ -340,8 +359,12 @@ class HeadingFilter(flet.UserControl):
         """
         self.layout = flet.Column(
             [
-                flet.Text("Filter by heading"),
-                self.text_field,
+                flet.Text("Filter by heading, leave a field empty for no limit (wraps around north if min > max)"),
+                flet.Row(
+                        [
+                            self.min_field, self.max_field
+                        ]
+                    ),
                 flet.ElevatedButton(text="Submit", on_click=self.submit)
             ]
         )
@@ -353,17 +376,20 @@ class HeadingFilter(flet.UserControl):
         :param e: Click event
         :return: None
         """
-        self.logger.debug(f"{self.text_field.value=}")
+        self.logger.debug(f"{self.min_field.value=} {self.max_field.value=}")
         try:
-            self.text_field.value = int(self.text_field.value)
+            low = parse_bound(self.min_field.value, int)
+            high = parse_bound(self.max_field.value, int)
+            if low is None and high is None:
+                raise ValueError("No bounds given")
         except ValueError:
             self.page.snack_bar = flet.SnackBar(
-                content=flet.Text("Invalid heading")
+                content=flet.Text("Invalid heading range")
             )
             self.page.snack_bar.open = True
             self.page.update()
             return None
-        self.filter = ShipRadarFilter('heading', self.text_field.value)
+        self.filter = ShipRadarFilter('heading', low, high)
         self.page.session.set('heading_filter', self.filter)
         self.page.go("/filters")
         return None
@@ -380,8 +406,10 @@ class DraughtFilter(flet.UserControl):
         self.logger = ShipRadarLogger("DraughtFilter")
         self.page = page
         self.page.title = "Filter: Draught"
-        self.text_field = flet.TextField(label="Draught", keyboard_type=flet.KeyboardType.NUMBER,
-                                         text_align=flet.TextAlign.CENTER)
+        self.min_field = flet.TextField(label="Min draught", keyboard_type=flet.KeyboardType.NUMBER, width=150,
+                                        text_align=flet.TextAlign.CENTER)
+        self.max_field = flet.TextField(label="Max draught", keyboard_type=flet.KeyboardType.NUMBER, width=150,
+                                        text_align=flet.TextAlign.CENTER)
 
     def build(self) -> flet.Control:
         """
@@ -390,8 +418,12 @@ class DraughtFilter(flet.UserControl):
         """
         self.layout = flet.Column(
             [
-                flet.Text("Filter by draught"),
-                self.text_field,
+                flet.Text("Filter by draught, leave a field empty for no limit"),
+                flet.Row(
+                        [
+                            self.min_field, self.max_field
+                        ]
+                    ),
                 flet.ElevatedButton(text="Submit", on_click=self.submit)
             ]
         )
@@ -403,15 +435,18 @@ class DraughtFilter(flet.UserControl):
         :param e: Click event
         :return: None
         """
-        self.logger.debug(f"{self.text_field.value=}")
+        self.logger.debug(f"{self.min_field.value=} {self.max_field.value=}")
         try:
-            self.text_field.value = float(self.text_field.value)
+            low = parse_bound(self.min_field.value, float)
+            high = parse_bound(self.max_field.value, float)
+            if low is None and high is None:
+                raise ValueError("No bounds given")
         except ValueError:
-            self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid draught"))
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid draught range"))
             self.page.snack_bar.open = True
             self.page.update()
             return None
-        self.filter = ShipRadarFilter('draught', self.text_field.value)
+        self.filter = ShipRadarFilter('draught', low, high)
         self.page.session.set('draught_filter', self.filter)
         self.page.go("/filters")
         return None
@@ -428,8 +463,10 @@ class SpeedFilter(flet.UserControl):
         self.logger = ShipRadarLogger("SpeedFilter")
         self.page = page
         self.page.title = "Filter: Speed"
-        self.text_field = flet.TextField(label="Speed", keyboard_type=flet.KeyboardType.NUMBER,
-                                         text_align=flet.TextAlign.CENTER)
+        self.min_field = flet.TextField(label="Min speed", keyboard_type=flet.KeyboardType.NUMBER, width=150,
+                                        text_align=flet.TextAlign.CENTER)
+        self.max_field = flet.TextField(label="Max speed", keyboard_type=flet.KeyboardType.NUMBER, width=150,
+                                        text_align=flet.TextAlign.CENTER)
 
     def build(self) -> flet.Control:
         """
@@ -438,8 +475,12 @@ class SpeedFilter(flet.UserControl):
         """
         self.layout = flet.Column(
             [
-                flet.Text("Filter by speed"),
-                self.text_field,
+                flet.Text("Filter by speed, leave a field empty for no limit"),
+                flet.Row(
+                        [
+                            self.min_field, self.max_field
+                        ]
+                    ),
                 flet.ElevatedButton(text="Submit", on_click=self.submit)
             ]
         )
@@ -451,15 +492,18 @@ class SpeedFilter(flet.UserControl):
         :param e: Click event
         :return: None
         """
-        self.logger.debug(f"{self.text_field.value=}")
+        self.logger.debug(f"{self.min_field.value=} {self.max_field.value=}")
         try:
-            self.text_field.value = float(self.text_field.value)
+            low = parse_bound(self.min_field.value, float)
+            high = parse_bound(self.max_field.value, float)
+            if low is None and high is None:
+                raise ValueError("No bounds given")
         except ValueError:
-            self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid speed"))
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid speed range"))
             self.page.snack_bar.open = True
             self.page.update()
             return None
-        self.filter = ShipRadarFilter('speed', self.text_field.value)
+        self.filter = ShipRadarFilter('speed', low, high)
         self.page.session.set('speed_filter', self.filter)
         self.page.go("/filters")
         return None
@@ -2,16 +2,31 @@
 Contains the MainWindow class, which is the main window of the app.
 """
 
+import os
+import threading
+from urllib.parse import urlsplit
 import flet
+import numpy as np
+from beartype.typing import Union
 import src.err
+from src.cache import ShipRadarFileCache, ShipRadarResultCache, file_fingerprint, partial_fingerprint
+from src.dataset import ShipRadarDataset
 from src.logger import ShipRadarLogger
-from src.reader import ShipRadarCSVReader
+from src.planner import ShipRadarSelection
+from src.reader import ShipRadarCSVReader, ShipRadarFilter
+from src.stream import ShipRadarStreamReceiver
+from src.track import ShipRadarTrack
 
 
 class MainWindow(flet.Row):
     """
     Main window of the app. Contains a file picker, a button to open filters window and a go button which opens plot
     """
+    # Results of queries, shared by all sessions of the app
+    RESULTS: ShipRadarResultCache = ShipRadarResultCache()
+    # Worker processes reading big files, one per core
+    WORKERS: int = os.cpu_count() or 1
+
     def __init__(self, page: flet.Page, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = ShipRadarLogger("MainWindow")
@@ -25,6 +40,23 @@ class MainWindow(flet.Row):
         self.__picker_text = flet.Text("Select a CSV file to open")
 
         self.filter = None
+        # Dataset of the last opened file, kept so that re-filtering doesn't read the file again
+        self.dataset: Union[None, ShipRadarDataset] = None
+        self.dataset_file: Union[None, str] = None
+        # Parsed files are cached next to them, so reopening a file doesn't parse it again
+        self.cache = ShipRadarFileCache()
+        # Reader of the followed file, rows appended to it are added to the dataset and shown in the plot
+        self.follower: Union[None, ShipRadarCSVReader] = None
+        self.follow_switch = flet.Switch(label="Follow file", value=False)
+        # Appended rows are ingested by the plot window's thread, while the user may run another query
+        self.__dataset_lock = threading.Lock()
+        # Receiver of a live AIS feed, while connected its rows are filtered instead of the file
+        self.receiver: Union[None, ShipRadarStreamReceiver] = None
+        # Rows of the live feed already shown in the plot
+        self.__shown_rows: int = 0
+        self.feed_field = flet.TextField(label="Live AIS feed, e.g. tcp://localhost:10110 or udp://0.0.0.0:10110",
+                                         width=500)
+        self.feed_button = flet.ElevatedButton(text="Connect", on_click=self.toggle_feed)
 
         self.controls_view = flet.Column(
             [
@@ -55,6 +87,15 @@ class MainWindow(flet.Row):
                                     on_click=lambda _: self.page.go("/filters")
                                 )
                             )
+                        ),
+                        flet.Card(
+                            content=flet.Container(
+                                content=flet.ListTile(
+                                    leading=flet.Icon(flet.icons.SATELLITE_ALT_OUTLINED),
+                                    title=flet.Row([self.feed_field, self.feed_button]),
+                                    subtitle=flet.Text("While connected, the live feed is filtered instead of the file")
+                                )
+                            )
                         )
                     ]
                 ),
@@ -63,7 +104,8 @@ class MainWindow(flet.Row):
                     [
                         flet.ElevatedButton(
                             text="Go", on_click=self.open_plot_window
-                        )
+                        ),
+                        self.follow_switch
                     ]
                 )
             ]
@@ -118,6 +160,153 @@ class MainWindow(flet.Row):
         :param e: Click event
         :return: None
         """
+        if self.receiver is not None:
+            self.logger.debug("Opening plot window of the live feed")
+            dataset = self.dataset
+        else:
+            dataset = self.__open_file()
+            if dataset is None:
+                return
+
+        filter_types: list[str] = ['name_filter', 'datetime_filter', 'location_filter', 'ship_no_filter',
+                                   'ship_type_filter', 'move_status_filter', 'heading_filter',
+                                   'draught_filter', 'speed_filter', 'destination_filter', 'eta_filter']
+        filters: list[ShipRadarFilter] = [self.page.session.get(filter_type) for filter_type in filter_types
+                                          if self.page.session.get(filter_type)]
+        if not filters:
+            self.logger.error("No filters selected")
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("No filters selected!"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return
+        try:
+            # Adding or tightening filters only checks rows of the previous result of the session
+            with self.__dataset_lock:
+                ids = dataset.select(filters, self.RESULTS, self.page.session.get("selection"))
+                self.__shown_rows = len(dataset)
+        except src.err.ShipRadarFilterError:
+            self.logger.error("No data satisfying all filters")
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("No data satisfying all filters!"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return
+        self.logger.debug(f"Result cache: {self.RESULTS.hits} hits, {self.RESULTS.misses} misses")
+        self.page.session.set("selection", ShipRadarSelection(dataset.fingerprint, filters, ids))
+        tracks: list[ShipRadarTrack] = dataset.tracks(ids)
+
+        if self.receiver is None and self.follow_switch.value:
+            self.follower = ShipRadarCSVReader(self.dataset_file)
+            # Rows appended since the dataset was read are the first ones the follower reads
+            self.follower.follow(dataset.offset)
+        else:
+            self.follower = None
+        self.page.session.set("refresh", self.refresh_tracks if self.follower or self.receiver else None)
+        self.page.session.set("filter", tracks)
+        self.page.go("/plot")
+
+    def refresh_tracks(self) -> Union[None, list[ShipRadarTrack]]:
+        """
+        Filters rows added by the live feed or appended to the followed file, called periodically by the plot window.
+        Only new rows are filtered, unless the followed file was truncated or replaced, then it's read again.
+        :return: tracks of the current selection, None if no new row satisfies its filters
+        """
+        with self.__dataset_lock:
+            selection: Union[None, ShipRadarSelection] = self.page.session.get("selection")
+            if selection is None:
+                return None
+            if self.receiver is not None:
+                ids = np.arange(self.__shown_rows, len(self.dataset))
+                self.__shown_rows = len(self.dataset)
+            elif self.follower is not None:
+                try:
+                    records = self.follower.read_appended()
+                    if records is None:
+                        self.logger.info("Followed file was truncated or replaced, reading it again")
+                        dataset = ShipRadarDataset.from_csv(self.dataset_file, self.cache, self.WORKERS,
+                                                            complete_lines=True)
+                except src.err.ShipRadarImportError as exc:
+                    # The file may still be being written, the current selection is kept until the next poll
+                    self.logger.warning(f"Followed file can't be read, retrying: {exc}")
+                    return None
+                if records is None:
+                    self.dataset = dataset
+                    self.follower.follow(dataset.offset)
+                    try:
+                        ids = self.dataset.select(selection.filters, self.RESULTS)
+                    except src.err.ShipRadarFilterError:
+                        ids = np.empty(0, dtype=np.int64)
+                    return self.__show(ShipRadarSelection(self.dataset.fingerprint, selection.filters, ids))
+                # The dataset holds the file only up to the offset of the follower, not the file as it is now
+                ids = self.dataset.append(records, partial_fingerprint(file_fingerprint(self.dataset_file),
+                                                                       self.follower.offset))
+                self.dataset.offset = self.follower.offset
+            else:
+                return None
+            matches = len(selection.ids)
+            selection = self.dataset.extend(selection, ids)
+            if len(selection.ids) == matches:
+                self.page.session.set("selection", selection)
+                return None
+            return self.__show(selection)
+
+    def __show(self, selection: ShipRadarSelection) -> list[ShipRadarTrack]:
+        """
+        Makes a selection the current one of the session
+        :param selection: result of the current query
+        :return: tracks of the selection
+        """
+        self.page.session.set("selection", selection)
+        tracks: list[ShipRadarTrack] = self.dataset.tracks(selection.ids)
+        self.page.session.set("filter", tracks)
+        return tracks
+
+    def toggle_feed(self, e: flet.TapEvent) -> None:
+        """
+        Connects to or disconnects from the live AIS feed
+        :param e: Click event
+        :return: None
+        """
+        if self.receiver is not None:
+            self.receiver.stop()
+            self.receiver = None
+            self.feed_button.text = "Connect"
+            self.logger.info("Disconnected from live feed")
+            self.controls_view.update()
+            return None
+        address = urlsplit(self.feed_field.value or "")
+        try:
+            port = address.port
+        except ValueError:
+            port = None
+        if address.scheme not in ('tcp', 'udp') or not address.hostname or port is None:
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid feed address!"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return None
+        with self.__dataset_lock:
+            self.dataset = ShipRadarDataset.empty()
+            self.dataset_file = None
+            self.follower = None
+        receiver = ShipRadarStreamReceiver(self.dataset, address.hostname, port, address.scheme, self.__dataset_lock)
+        try:
+            receiver.start()
+        except OSError as exc:
+            self.logger.error(f"Can't connect to live feed {self.feed_field.value}: {exc}")
+            self.page.snack_bar = flet.SnackBar(content=flet.Text(f"Can't connect to live feed: {exc.strerror}"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return None
+        self.receiver = receiver
+        self.feed_button.text = "Disconnect"
+        self.logger.info(f"Connected to live feed {self.feed_field.value}")
+        self.controls_view.update()
+        return None
+
+    def __open_file(self) -> Union[None, ShipRadarDataset]:
+        """
+        Loads the dataset of the selected file, showing what's wrong if it can't
+        :return: ShipRadarDataset object, None if no valid file is selected
+        """
         # If app runs in browser, upload file
         if self.page.web:
             self.logger.debug("Running in browser")
@@ -130,7 +319,7 @@ class MainWindow(flet.Row):
                 )
                 self.page.snack_bar.open = True
                 self.page.update()
-                return
+                return None
             self.logger.debug("Uploading file")
             self.__pick_files_dialog.upload([flet.FilePickerUploadFile(
                 self.last_picked_file.name,
@@ -148,47 +337,39 @@ class MainWindow(flet.Row):
             self.page.snack_bar = flet.SnackBar(content=flet.Text("No file selected!"))
             self.page.snack_bar.open = True
             self.page.update()
-            return
+            return None
         # Confirmed that a file is selected, now check if headers are correct
         if not ShipRadarCSVReader.verify_headers(self.last_picked_file.path):
             self.logger.error("Invalid CSV header")
             self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid CSV file!"))
             self.page.snack_bar.open = True
             self.page.update()
-            return
-
-        filter_types: list[str] = ['name_filter', 'datetime_filter', 'location_filter', 'ship_no',
-                                   'ship_type_filter', 'move_status_filter', 'heading_filter',
-                                   'draught_filter', 'speed_filter', 'destination_filter', 'eta_filter']
-        data_list: list[list[dict[str, str]]] = []
-        for filter_type in filter_types:
-            filter_obj = self.page.session.get(filter_type)
-            if filter_obj:
-                try:
-                    data_list.append(data_file.parse(filter_obj))
-                except src.err.ShipRadarFilterError:
-                    self.logger.error(f"No entries for {filter_type}")
-                    self.page.snack_bar = flet.SnackBar(
-                        content=flet.Text("No entries for selected filter(s)")
-                    )
-                    self.page.snack_bar.open = True
-                    self.page.update()
-                    return
+            return None
         try:
-            data: list[dict] = ShipRadarCSVReader.and_collectors(data_list)
-        except IndexError:
-            self.logger.error("No filters selected")
-            self.page.snack_bar = flet.SnackBar(content=flet.Text("No filters selected!"))
-            self.page.snack_bar.open = True
-            self.page.update()
-            return
-        if not data:
-            self.logger.error("No data satisfying all filters")
-            self.page.snack_bar = flet.SnackBar(content=flet.Text("No data satisfying all filters!"))
+            with self.__dataset_lock:
+                return self.__load_dataset(data_file.file, bool(self.follow_switch.value))
+        except src.err.ShipRadarImportError:
+            self.logger.error("Invalid CSV data")
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("Invalid CSV file!"))
             self.page.snack_bar.open = True
             self.page.update()
-            return
-        data_list: list[list[dict]] = ShipRadarCSVReader.divide_collectors(data)
+            return None
 
-        self.page.session.set("filter", data_list)
-        self.page.go("/plot")
+    def __load_dataset(self, path: str, follow: bool = False) -> ShipRadarDataset:
+        """
+        Loads the dataset of a file, reusing the already loaded one if the file hasn't changed
+        :param path: Path to the CSV file
+        :param follow: the file will be followed, only its complete lines are read
+        :return: ShipRadarDataset object
+        """
+        try:
+            fingerprint = file_fingerprint(path)
+        except FileNotFoundError as exc:
+            raise src.err.ShipRadarImportError(f"No file {path}") from exc
+        if self.dataset is None or self.dataset_file != path or self.dataset.fingerprint != fingerprint or \
+                (follow and self.dataset.offset is None):
+            self.logger.debug(f"Loading dataset from {path}")
+            self.follower = None
+            self.dataset = ShipRadarDataset.from_csv(path, self.cache, self.WORKERS, complete_lines=follow)
+            self.dataset_file = path
+        return self.dataset
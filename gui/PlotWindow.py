@@ -1,24 +1,60 @@
 """
 Contains the Plot class, which is used to create a plot window
 """
-import itertools
+import base64
+import threading
+from concurrent.futures import Future
+from functools import partial
 import flet
-import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import distinctipy
-from beartype.typing import Union
-from flet.plotly_chart import PlotlyChart
+from beartype.typing import Union, Callable
+from src.figure import ShipRadarFigureBuilder, ShipRadarAnimation
 from src.logger import ShipRadarLogger
+from src.render import ShipRadarRenderer
+from src.track import ShipRadarTrack
 
 
 class Plot(flet.UserControl):
     """
     A class to create a plot window
     """
-    def __init__(self, page: flet.Page, data: list[list[dict]], title: str):
+    # Seconds between checks of a followed file for new positions
+    FOLLOW_INTERVAL: float = 2.0
+    # Default simplification of plotted tracks, see ShipRadarTrack.simplify, about 50 m
+    SIMPLIFY_TOLERANCE: Union[None, float] = 0.0005
+    SIMPLIFY_MINUTES: Union[None, float] = None
+    # Seconds without resize events before the chart is resized, a window being dragged fires many of them
+    RESIZE_DELAY: float = 0.3
+    # Views of the plot, switched by the "Change view" button
+    VIEWS: tuple[str, ...] = ('tracks', 'density', 'density by type', 'animation')
+    # Minutes of movements shown by a frame of the animation, and the number of frames of its slider
+    ANIMATION_MINUTES: float = 360.0
+    ANIMATION_STEPS: int = 500
+    # Seconds the slider has to stay still before its frame is drawn
+    SCRUB_DELAY: float = 0.1
+    # Renders charts of all plots in warm worker processes, shared by all sessions
+    RENDERER: ShipRadarRenderer = ShipRadarRenderer()
+    # Ships above which positions are aggregated into a density grid instead of showing tracks
+    DENSITY_SHIPS: int = 50
+
+    def __init__(self, page: flet.Page, data: list[ShipRadarTrack], title: str,
+                 refresh: Union[None, Callable[[], Union[None, list[ShipRadarTrack]]]] = None,
+                 tolerance: Union[None, float] = SIMPLIFY_TOLERANCE, minutes: Union[None, float] = SIMPLIFY_MINUTES,
+                 webgl_threshold: Union[None, int] = ShipRadarFigureBuilder.WEBGL_THRESHOLD):
         super().__init__()
         self.layout: Union[None, flet.Control] = None
-        self.__chart: Union[None, PlotlyChart] = None
+        self.__chart: Union[None, flet.Image] = None
+        # Numbers of the last requested and the last shown image, images finishing out of order are dropped
+        self.__requested: int = 0
+        self.__shown: int = 0
+        self.__image_lock = threading.Lock()
+        self.__container: Union[None, flet.Container] = None
+        self.__resize_timer: Union[None, threading.Timer] = None
+        self.__slider: Union[None, flet.Slider] = None
+        self.__scrub_timer: Union[None, threading.Timer] = None
+        self.__animation: Union[None, ShipRadarAnimation] = None
         self.__fig: Union[None, go.Figure] = None
         self.page = page
         self.page.on_resize = self.on_resize
@@ -26,8 +62,18 @@ class Plot(flet.UserControl):
         self.logger.debug("Initializing Plot")
         self.data = data
         self.title = title
+        # Returns updated tracks when a followed file has new matching positions, see MainWindow.refresh_tracks
+        self.refresh = refresh
+        # Simplification of tracks before plotting, None for both plots every position.
+        # Charts are static images, so they aren't drawn with WebGL, needing map tiles, only figures opened
+        # as interactive draw tracks with more points than webgl_threshold with WebGL
+        self.__builder = ShipRadarFigureBuilder(tolerance=tolerance, minutes=minutes, webgl_threshold=None)
+        self.__interactive_builder = ShipRadarFigureBuilder(tolerance=tolerance, minutes=minutes,
+                                                            webgl_threshold=webgl_threshold)
+        self.__stop_following = threading.Event()
 
         self.show_lines = True
+        self.view: str = 'density' if len(self.data) > self.DENSITY_SHIPS else 'tracks'
         self.__block = False
 
         self.colors: list[tuple[float, float, float]] = distinctipy.get_colors(len(self.data)) \
@@ -38,14 +84,67 @@ class Plot(flet.UserControl):
 
     def on_resize(self, e: flet.ScaleUpdateEvent) -> None:
         """
-        Update the chart when the page is resized
+        Resize the chart once the page stops being resized
         :param e: Resize event
         :return: None
         """
-        self.__chart.figure = self.__fig
+        if self.__resize_timer is not None:
+            self.__resize_timer.cancel()
+        self.__resize_timer = threading.Timer(self.RESIZE_DELAY, self.__resize)
+        self.__resize_timer.daemon = True
+        self.__resize_timer.start()
+
+    def __resize(self) -> None:
+        """
+        Fit the chart to the page, the figure itself stays the same
+        :return: None
+        """
+        if self.__container is None:
+            return
+        self.__container.height = self.page.height * 0.8
         self.logger.debug("Resized")
-        self.page.update()
         self.layout.update()
+        self.__redraw()
+
+    def did_mount(self) -> None:
+        """
+        Draw the chart and start following the file once the plot is shown
+        :return: None
+        """
+        if self.__fig is not None:
+            self.__redraw()
+        if self.refresh is not None and self.data:
+            self.__stop_following.clear()
+            threading.Thread(target=self.__follow, daemon=True).start()
+
+    def will_unmount(self) -> None:
+        """
+        Stop following the file when the plot is closed
+        :return: None
+        """
+        self.__stop_following.set()
+        for timer in (self.__resize_timer, self.__scrub_timer):
+            if timer is not None:
+                timer.cancel()
+
+    def __follow(self) -> None:
+        """
+        Periodically adds new positions of the followed file to the chart, runs in its own thread
+        :return: None
+        """
+        tracks = None
+        while not self.__stop_following.wait(self.FOLLOW_INTERVAL):
+            # Tracks refreshed while the chart is busy are kept and shown on the next try
+            tracks = self.refresh() or tracks
+            if not tracks or self.__block:
+                continue
+            self.logger.debug("New positions in followed file, updating chart")
+            if len(tracks) > len(self.colors):
+                # Ships already shown keep their colors
+                self.colors += distinctipy.get_colors(len(tracks) - len(self.colors), exclude_colors=self.colors)
+            self.data, tracks = tracks, None
+            self.__initialize_chart()
+            self.__redraw()
 
     def build(self) -> flet.Control:
         """
@@ -79,14 +178,22 @@ class Plot(flet.UserControl):
                 alignment=flet.alignment.center
             )
             return self.layout
+        self.__slider = flet.Slider(min=0, max=self.ANIMATION_STEPS, divisions=self.ANIMATION_STEPS, value=0,
+                                    on_change=self.__scrub)
         self.__initialize_chart()
 
-        self.__chart = PlotlyChart(self.__fig)
+        self.RENDERER.start()
+        # Shows the previous image until a new one is decoded
+        self.__chart = flet.Image(fit=flet.ImageFit.CONTAIN, gapless_playback=True)
+        # Progress ring is replaced by the chart once its first image is rendered
+        self.__container = flet.Container(content=flet.ProgressRing(),
+                                          alignment=flet.alignment.center,
+                                          height=self.page.height * 0.8
+                                          )
         self.layout = flet.Column(
             [
-                flet.Container(content=self.__chart,
-                               height=self.page.height * 0.8
-                               ),
+                self.__container,
+                self.__slider,
                 flet.Row(
                     [
                         flet.ElevatedButton(text="Open as interactive",
@@ -96,6 +203,10 @@ class Plot(flet.UserControl):
                         flet.ElevatedButton(text="Toggle lines",
                                             icon=flet.icons.LINE_STYLE,
                                             on_click=self.__toggle_lines
+                                            ),
+                        flet.ElevatedButton(text="Change view",
+                                            icon=flet.icons.GRID_ON,
+                                            on_click=self.__change_view
                                             )
                     ]
                 )
@@ -112,107 +223,40 @@ class Plot(flet.UserControl):
         """
         self.__block = True
         self.logger.debug("Initializing chart")
-
-        all_data_list: list[dict] = list(itertools.chain(*self.data))
-
-        # Create a dataframe of all the data to determine the center coordinates and zoom level
-        all_data: pd.DataFrame = pd.DataFrame(all_data_list)
-        all_data.sort_values(by='MovementDateTime',
-                             key=lambda x: pd.to_datetime(x),
-                             inplace=True
-                             )
-
-        # Convert latitude and longitude values to floats
-        latitudes: list[float] = all_data['Latitude'].astype(float)
-        longitudes: list[float] = all_data['Longitude'].astype(float)
-
-        # Calculate the center coordinates based on the latitude and longitude values of the points
-        center_lat: float = (max(latitudes) + min(latitudes)) / 2
-        center_lon: float = (max(longitudes) + min(longitudes)) / 2
-
-        # Create the figure
-        self.__fig: go.Figure = go.Figure()
-
-        # Add the scattergeo trace for points
-        for ship, color in zip(self.data, self.colors):
-            data_frame: pd.DataFrame = pd.DataFrame(ship)
-
-            # Sort the data based on MovementDateTime
-            sorted_data: pd.DataFrame = data_frame.sort_values(by='MovementDateTime',
-                                                               key=lambda x: pd.to_datetime(x)
-                                                               )
-            # Create a text column for the hovertext
-            sorted_data['text']: str = sorted_data.apply(lambda row:
-                                                         f"<b>Ship name:</b> {row['ShipName']}<br>"
-                                                         f"<b>LRIMO number:</b> {row['LRIMOShipNo']}<br>"
-                                                         f"<b>Ship type:</b> {row['ShipType']}<br>"
-                                                         f"<b>Movement date:</b> {row['MovementDateTime']}<br>"
-                                                         f"<b>Move status:</b> {row['MoveStatus']}<br>"
-                                                         f"<b>Destination:</b> {row['Destination']}<br>"
-                                                         f"<b>ETA:</b> {row['ETA']}<br>"
-                                                         f"<b>Heading:</b> {row['Heading']}<br>"
-                                                         f"<b>Speed:</b> {row['Speed']}<br>"
-                                                         f"<b>Draught:</b> {row['Draught']}<br>", axis=1
-                                                         )
-
-            # Create the scattergeo trace for points
-            scatter_points = go.Scattergeo(
-                lat=sorted_data['Latitude'].astype(float),
-                lon=sorted_data['Longitude'].astype(float),
-                hovertext=sorted_data['text'],
-                mode='lines+markers' if self.show_lines else 'markers',
-                marker={
-                    "color": f'rgb({color[0] * 255}, {color[1] * 255}, {color[2] * 255})',
-                    "size": 5
-                },
-                line={
-                    "width": 1,
-                    "color": f'rgb({color[0] * 255}, {color[1] * 255}, {color[2] * 255})'
-                },
-                showlegend=True,
-                name=sorted_data['ShipName'][0]
-            )
-            self.__fig.add_trace(scatter_points)
-
-        # Adjust the center and zoom level of the map
-        self.__fig.update_geos(
-            center={
-                "lon": center_lon,
-                "lat": center_lat
-            },
-            fitbounds='locations'
-        )
-
-        self.__fig.update_layout(
-            title='Selected ship movements',
-            title_x=0.5,
-            margin={
-                "r": 0,
-                "l": 0,
-                "t": 30,
-                "b": 0
-            },
-            hovermode='closest',  # Set hover mode to show the closest point information
-            geo={
-                "showland": True,
-                "landcolor": 'rgb(243, 243, 243)',
-                "countrycolor": 'rgb(204, 204, 204)',
-                "showcountries": True,
-                "showocean": True,
-                "oceancolor": 'rgb(200, 255, 255)',
-                "showcoastlines": True,
-                "coastlinecolor": 'rgb(150, 150, 150)',
-                "showframe": False,
-                "projection_type": 'natural earth'
-            }
-        )
-
+        if self.view == 'animation':
+            self.__animation = ShipRadarAnimation(self.data,
+                                                  np.timedelta64(int(self.ANIMATION_MINUTES * 60000), 'ms'))
+        if self.__slider is not None:
+            # New animations start from their first frame
+            self.__slider.value = 0
+            self.__slider.visible = self.view == 'animation'
+        self.__fig = self.__build(self.__builder)
         self.__block = False
         self.logger.debug("Initialized chart, unblocking")
 
+    def __build(self, builder: ShipRadarFigureBuilder) -> go.Figure:
+        """
+        Build the figure of the current view, animations show the frame at the slider
+        :param builder: ShipRadarFigureBuilder object
+        :return: plotly figure
+        """
+        builder.show_lines = self.show_lines
+        match self.view:
+            case 'density':
+                return builder.build_density(self.data)
+            case 'density by type':
+                return builder.build_density(self.data, by_type=True)
+            case 'animation':
+                figure = builder.build_animation(self.data, self.colors, self.__animation)
+                if self.__slider is not None and self.__slider.value:
+                    self.__animation.show(figure, self.__frame_time(float(self.__slider.value)))
+                return figure
+            case _:
+                return builder.build(self.data, self.colors)
+
     def __toggle_lines(self, e: flet.TapEvent) -> None:
         """
-        Toggle the lines on the chart
+        Toggle the lines on the chart, only visibility of line traces of the built figure changes
         :param e: Click event
         :return: None
         """
@@ -221,22 +265,111 @@ class Plot(flet.UserControl):
             self.page.snack_bar.open = True
             self.page.update()
             return None
-        self.logger.debug("Toggling lines, blocking")
         self.show_lines = False if self.show_lines else True  # Toggle the show_lines variable
-        self.__initialize_chart()
+        self.__builder.show_lines = self.show_lines
+        if self.view == 'animation':
+            self.__fig.update_traces(mode=self.__builder.mode)
+        else:
+            self.__fig.update_traces(visible=self.show_lines, selector={"mode": 'lines'})
 
         # Update the chart and GUI
-        self.__chart.figure = self.__fig
-        self.page.update()
-        self.layout.update()
+        self.__redraw()
         self.logger.debug("Toggled lines, updating GUI")
         return None
 
+    def __change_view(self, e: flet.TapEvent) -> None:
+        """
+        Switch to the next view of VIEWS, e.g. from tracks to density of positions
+        :param e: Click event
+        :return: None
+        """
+        if self.__block:
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("Please wait, chart is being updated"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return None
+        self.view = self.VIEWS[(self.VIEWS.index(self.view) + 1) % len(self.VIEWS)]
+        self.logger.debug(f"Changing view to {self.view}")
+        self.__initialize_chart()
+
+        self.__redraw()
+        self.layout.update()
+        return None
+
+    def __scrub(self, e: flet.ControlEvent) -> None:
+        """
+        Show the frame of the animation at the slider once it stops moving
+        :param e: Change event
+        :return: None
+        """
+        if self.__scrub_timer is not None:
+            self.__scrub_timer.cancel()
+        self.__scrub_timer = threading.Timer(self.SCRUB_DELAY, self.__show_frame, args=(float(self.__slider.value),))
+        self.__scrub_timer.daemon = True
+        self.__scrub_timer.start()
+
+    def __show_frame(self, value: float) -> None:
+        """
+        Replace positions of the chart with a frame of the animation
+        :param value: value of the slider, from 0 for the first position to ANIMATION_STEPS for the last one
+        :return: None
+        """
+        if self.__animation is None or self.view != 'animation':
+            return
+        time = self.__frame_time(value)
+        self.__animation.show(self.__fig, time)
+        self.__redraw()
+        self.logger.debug(f"Showing frame at {time}")
+
+    def __frame_time(self, value: float) -> np.datetime64:
+        """
+        Find the time of the animation frame at a value of the slider
+        :param value: value of the slider, from 0 for the first position to ANIMATION_STEPS for the last one
+        :return: end of the frame
+        """
+        duration = (self.__animation.end - self.__animation.start).astype(np.int64)
+        return self.__animation.start + np.timedelta64(int(duration * value / self.ANIMATION_STEPS), 'ms')
+
+    def __redraw(self) -> None:
+        """
+        Render the figure in the background, the previous image stays shown until the new one is ready
+        :return: None
+        """
+        with self.__image_lock:
+            self.__requested += 1
+            number = self.__requested
+        future = self.RENDERER.render(self.__fig, int(self.page.width), int(self.page.height * 0.8))
+        future.add_done_callback(partial(self.__show_image, number))
+
+    def __show_image(self, number: int, future: Future) -> None:
+        """
+        Show a rendered image, unless a newer one is already shown
+        :param number: number of the render request
+        :param future: finished future of ShipRadarRenderer.render
+        :return: None
+        """
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.logger.error(f"Chart not rendered: {future.exception()}")
+            self.page.snack_bar = flet.SnackBar(content=flet.Text("Chart can't be rendered"))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return
+        with self.__image_lock:
+            if number <= self.__shown:
+                return
+            self.__shown = number
+            self.__chart.src_base64 = base64.b64encode(future.result()).decode()
+            self.__container.content = self.__chart
+        self.__container.update()
+        self.logger.debug(f"Showing image {number}, {self.RENDERER.hits} cached renders")
+
     def __show_fig(self, e: flet.TapEvent) -> None:
         """
-        Show the figure in a new window
+        Show the figure in a new window, built again, so that large figures can use WebGL
         :param e: Click event
         :return: None
         """
         self.logger.debug("Showing figure in new window")
-        self.__fig.show()
+        self.__build(self.__interactive_builder).show()
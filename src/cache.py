@@ -0,0 +1,202 @@
+"""
+This module contains classes for caching data parsed from CSV files on disk and results of queries in memory.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from beartype.typing import Union, Iterable
+from src import logger
+
+# Bump when the layout of cached files changes, older caches are then rebuilt
+CACHE_VERSION: int = 1
+# Size of the blocks at the start and at the end of the file that are hashed
+FINGERPRINT_BLOCK: int = 1 << 20
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Computes a fingerprint of a file, changing whenever the file does.
+    Hashes size, modification time and the first and last block of the file, so it stays cheap for huge files.
+    :param path: Path to the file
+    :return: hex digest of the fingerprint
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(f"{stat.st_size};{stat.st_mtime_ns}".encode(), digest_size=16)
+    with open(path, 'rb') as file:
+        digest.update(file.read(FINGERPRINT_BLOCK))
+        if stat.st_size > FINGERPRINT_BLOCK:
+            file.seek(max(FINGERPRINT_BLOCK, stat.st_size - FINGERPRINT_BLOCK))
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def partial_fingerprint(fingerprint: str, length: int) -> str:
+    """
+    Computes a fingerprint of the first bytes of a file, e.g. of rows read up to the last complete line,
+    so results of a partially read file are never mistaken for results of the whole file
+    :param fingerprint: fingerprint of the whole file, see file_fingerprint
+    :param length: number of bytes read
+    :return: fingerprint of the read bytes
+    """
+    return f"{fingerprint}:{length}"
+
+
+class ShipRadarFileCache:
+    """
+    Class managing cache directories of parsed CSV files.
+    By default, the cache of a file is kept next to it, in a <file>.shipradar directory.
+    """
+    META_FILE: str = "meta.json"
+
+    def __init__(self, cache_dir: Union[None, str] = None):
+        self.logger = logger.ShipRadarLogger("FileCacheLogger")
+        self.cache_dir: Union[None, str] = cache_dir
+
+    def directory(self, file: str) -> str:
+        """
+        Returns the cache directory of a file
+        :param file: Path to the CSV file
+        :return: Path to the cache directory
+        """
+        if self.cache_dir is None:
+            return f"{file}.shipradar"
+        name = hashlib.blake2b(os.path.abspath(file).encode(), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, f"{os.path.basename(file)}.{name}.shipradar")
+
+    @staticmethod
+    def describe(file: str) -> dict:
+        """
+        Describes the current state of a file, cache is valid only as long as the description doesn't change
+        :param file: Path to the CSV file
+        :return: dict with cache version, path, size, modification time and fingerprint of the file
+        """
+        stat = os.stat(file)
+        return {
+            "version": CACHE_VERSION,
+            "path": os.path.abspath(file),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "fingerprint": file_fingerprint(file)
+        }
+
+    def lookup(self, file: str, meta: dict) -> Union[None, str]:
+        """
+        Finds a valid cache of a file
+        :param file: Path to the CSV file
+        :param meta: current description of the file, from ShipRadarFileCache.describe
+        :return: Path to the cache directory, None if there is no cache or the file has changed since
+        """
+        directory = self.directory(file)
+        try:
+            with open(os.path.join(directory, self.META_FILE), encoding='utf-8') as meta_file:
+                cached_meta = json.load(meta_file)
+        except (OSError, ValueError):
+            self.logger.debug(f"No cache for {file}")
+            return None
+        if cached_meta != meta:
+            self.logger.debug(f"Cache for {file} is outdated")
+            return None
+        self.logger.debug(f"Valid cache for {file} found in {directory}")
+        return directory
+
+    def prepare(self, file: str) -> str:
+        """
+        Creates an empty cache directory of a file, removing the old one
+        :param file: Path to the CSV file
+        :return: Path to the cache directory
+        """
+        directory = self.directory(file)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        return directory
+
+    def commit(self, file: str, meta: dict) -> None:
+        """
+        Marks the cache of a file as complete, must be called after all cached data is written
+        :param file: Path to the CSV file
+        :param meta: description of the file the cached data was read from, from ShipRadarFileCache.describe
+        :return: None
+        """
+        with open(os.path.join(self.directory(file), self.META_FILE), 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        self.logger.debug(f"Cache for {file} written")
+
+
+class ShipRadarResultCache:
+    """
+    In-memory LRU cache of query results, row ids keyed by the fingerprint of the file and the set of filters.
+    Least recently used results are evicted once the cached row ids take more than budget bytes.
+    Safe to share between threads, e.g. between sessions of the app.
+    """
+    def __init__(self, budget: int = 64 << 20):
+        self.logger = logger.ShipRadarLogger("ResultCacheLogger")
+        self.budget: int = budget
+        # Bytes taken by cached row ids
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__results: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__results)
+
+    @staticmethod
+    def key(fingerprint: str, filters: Iterable) -> tuple:
+        """
+        Builds the key of a query, order of filters doesn't matter
+        :param fingerprint: fingerprint of the file, see file_fingerprint
+        :param filters: ShipRadarFilter objects of the query
+        :return: key of the query
+        """
+        return fingerprint, frozenset(filters)
+
+    def get(self, key: tuple) -> Union[None, np.ndarray]:
+        """
+        Returns the cached result of a query and marks it as the most recently used
+        :param key: key of the query, from ShipRadarResultCache.key
+        :return: read-only array of row ids, None if the result isn't cached
+        """
+        with self.__lock:
+            ids = self.__results.get(key)
+            if ids is None:
+                self.misses += 1
+                return None
+            self.__results.move_to_end(key)
+            self.hits += 1
+            return ids
+
+    def put(self, key: tuple, ids: np.ndarray) -> None:
+        """
+        Caches the result of a query, evicting the least recently used results over the budget
+        :param key: key of the query, from ShipRadarResultCache.key
+        :param ids: array of row ids, it must not be modified afterwards
+        :return: None
+        """
+        if ids.nbytes > self.budget:
+            self.logger.debug(f"Result of {ids.nbytes} bytes is over the budget, not cached")
+            return
+        ids.flags.writeable = False
+        with self.__lock:
+            if key in self.__results:
+                self.size -= self.__results.pop(key).nbytes
+            self.__results[key] = ids
+            self.size += ids.nbytes
+            while self.size > self.budget:
+                _, evicted = self.__results.popitem(last=False)
+                self.size -= evicted.nbytes
+                self.logger.debug(f"Evicted result of {evicted.nbytes} bytes")
+
+    def clear(self) -> None:
+        """
+        Removes all cached results, counters are kept
+        :return: None
+        """
+        with self.__lock:
+            self.__results.clear()
+            self.size = 0
@@ -0,0 +1,653 @@
+"""
+This module contains a columnar, in-memory representation of a CSV file and vectorized filtering over it.
+"""
+
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from beartype.typing import Union
+from src import err
+from src import logger
+from src.cache import ShipRadarFileCache, ShipRadarResultCache, partial_fingerprint
+from src.index import ShipRadarGridIndex, ShipRadarInvertedIndex, ShipRadarSortedIndex
+from src.planner import ShipRadarColumnStatistics, ShipRadarPlan, ShipRadarPlanner, ShipRadarSelection, \
+    ShipRadarValueStatistics
+from src.reader import HEADER, ShipRadarCSVReader, ShipRadarFilter, ShipRadarRow
+from src.record import ShipRadarRecord
+from src.track import ShipRadarTrack
+
+# Columns with few distinct values, stored as pandas categoricals
+CATEGORICAL_COLUMNS: tuple[str, ...] = ("ShipName", "ShipType", "MoveStatus", "Destination")
+DATETIME_COLUMNS: tuple[str, ...] = ("MovementDateTime", "ETA")
+FLOAT_COLUMNS: tuple[str, ...] = ("Latitude", "Longitude", "Draught", "Speed")
+
+
+def _convert(raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts columns of strings, as read from the CSV file, to typed columns
+    :param raw: DataFrame with all columns as strings
+    :return: DataFrame with typed columns
+    """
+    columns = {}
+    for column in HEADER:
+        values = raw[column]
+        if column == "LRIMOShipNo":
+            columns[column] = values.to_numpy().astype(np.int64)
+        elif column == "Heading":
+            columns[column] = values.to_numpy().astype(np.int16)
+        elif column in FLOAT_COLUMNS:
+            # Ensure that the decimal separator is a dot
+            columns[column] = values.str.replace(",", ".", regex=False).to_numpy().astype(np.float64)
+        elif column in DATETIME_COLUMNS:
+            # Millisecond resolution, nanoseconds can't hold dates like 9999-12-31 used as 'unknown ETA'
+            columns[column] = values.to_numpy().astype('datetime64[ms]')
+        else:
+            columns[column] = pd.Categorical(values)
+    return pd.DataFrame(columns)
+
+
+def _concat(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates typed columns of consecutive parts of a file
+    :param frames: DataFrames with typed columns, as returned by _convert
+    :return: DataFrame with rows of all frames, in order
+    """
+    if len(frames) == 1:
+        return frames[0]
+    frame = pd.concat(frames, ignore_index=True)
+    for column in CATEGORICAL_COLUMNS:
+        # Categories of earlier frames keep their codes, new values are added after them
+        frame[column] = union_categoricals([part[column].array for part in frames])
+    return frame
+
+
+def _read_part(file: str, start: int, end: int, fieldnames: list[str]) -> pd.DataFrame:
+    """
+    Reads a part of a CSV file into typed columns, run in worker processes by ShipRadarDataset.from_csv
+    :param file: Path to the CSV file
+    :param start: offset of the first byte of the part, at the start of a line
+    :param end: offset after the last byte of the part, at the start of a line or at the end of the file
+    :param fieldnames: header of the CSV file
+    :return: DataFrame with typed columns
+    """
+    with open(file, 'rb') as binfile:
+        binfile.seek(start)
+        data = binfile.read(end - start)
+    if not data.strip():
+        return _convert(pd.DataFrame({column: pd.Series(dtype=str) for column in fieldnames}))
+    return _convert(pd.read_csv(io.BytesIO(data), sep=';', names=fieldnames, header=None, dtype=str,
+                                keep_default_na=False, encoding='utf-8'))
+
+
+class ShipRadarDataset:
+    """
+    Class holding a whole CSV file as typed columns.
+    Filters are evaluated as boolean masks over the columns, so the file is read only once.
+    Columns have spare capacity for appended rows, which grows in steps, so appending doesn't copy all rows.
+    """
+    # Rows appended since an index was last extended are checked one by one, more of them are merged into it
+    MERGE_ROWS: int = 1 << 16
+
+    def __init__(self, frame: pd.DataFrame, fingerprint: Union[None, str] = None):
+        self.logger = logger.ShipRadarLogger("DatasetLogger")
+        # Fingerprint of the file the dataset was read from, see cache.file_fingerprint
+        self.fingerprint: Union[None, str] = fingerprint
+        # Bytes of the file read, ending with a complete line, so following the file can start there,
+        # None if the last line read had no newline or the dataset wasn't read from a file
+        self.offset: Union[None, int] = None
+        self.__rows: int = len(frame)
+        # Arrays of column values, categorical columns as category codes, longer than the dataset once rows
+        # are appended
+        self.__columns: dict[str, np.ndarray] = {}
+        # Categories of categorical columns, new values are added after them, so codes of old rows never change
+        self.__categories: dict[str, np.ndarray] = {}
+        self.__codes: dict[str, dict[str, int]] = {}
+        for column in HEADER:
+            if column in CATEGORICAL_COLUMNS:
+                categorical: pd.Categorical = frame[column].array
+                self.__columns[column] = categorical.codes
+                self.__categories[column] = categorical.categories.to_numpy()
+                self.__codes[column] = {value: code for code, value in enumerate(self.__categories[column].tolist())}
+            else:
+                self.__columns[column] = frame[column].to_numpy()
+        # DataFrame of the columns, built again on first use after rows are appended
+        self.__frame: Union[None, pd.DataFrame] = frame
+        # Indexes are built on first use
+        self.__grid: Union[None, ShipRadarGridIndex] = None
+        self.__sorted_indexes: dict[str, ShipRadarSortedIndex] = {}
+        self.__inverted_indexes: dict[str, ShipRadarInvertedIndex] = {}
+        self.__statistics: Union[None, dict] = None
+        # Rows the statistics were computed for
+        self.__statistics_rows: int = 0
+
+    def __len__(self) -> int:
+        return self.__rows
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        Typed columns as a DataFrame, categorical columns as pandas categoricals
+        :return: DataFrame with a row for every row of the dataset
+        """
+        if self.__frame is None:
+            self.__frame = pd.DataFrame({
+                column: pd.Categorical.from_codes(self.__column(column, None), self.__categories[column])
+                if column in CATEGORICAL_COLUMNS else self.__column(column, None)
+                for column in HEADER
+            })
+        return self.__frame
+
+    @classmethod
+    def from_csv(cls, file: str, cache: Union[None, ShipRadarFileCache] = None, workers: int = 1,
+                 complete_lines: bool = False) -> 'ShipRadarDataset':
+        """
+        Loads a CSV file into typed columns.
+        Files bigger than ShipRadarCSVReader.PARALLEL_THRESHOLD are read by a pool of worker processes,
+        if more than one is allowed.
+        :param file: Path to the CSV file
+        :param cache: ShipRadarFileCache object, if given the parsed columns are read from and written to it
+        :param workers: number of worker processes reading the file
+        :param complete_lines: read only lines ending with a newline, e.g. of a file still being appended to,
+                               following it then starts at ShipRadarDataset.offset
+        :return: ShipRadarDataset object
+        """
+        try:
+            meta: dict = ShipRadarFileCache.describe(file)
+            end = ShipRadarCSVReader.line_end(file, meta["size"])
+            # A last line without a newline isn't read, the cache holds the whole file, so it can't be used
+            partial = complete_lines and end < meta["size"]
+            if complete_lines and end == 0:
+                raise err.ShipRadarImportError('No complete line in CSV file')
+            if cache is not None and not partial:
+                directory = cache.lookup(file, meta)
+                if directory is not None:
+                    dataset = cls.load(directory, meta["fingerprint"])
+                    dataset.offset = end if end == meta["size"] else None
+                    return dataset
+            if not ShipRadarCSVReader.verify_headers(file):
+                raise err.ShipRadarImportError('Wrong header in CSV file')
+            # Rows appended while the file is read must not be read, they are left to the follower
+            size = end if complete_lines else None
+            if workers > 1 and meta["size"] >= ShipRadarCSVReader.PARALLEL_THRESHOLD:
+                frame = cls.__read_parallel(file, workers, size)
+            elif complete_lines:
+                fieldnames, ranges = ShipRadarCSVReader(file).split(1, size)
+                frame = _concat([_read_part(file, start, stop, fieldnames) for start, stop in ranges]) if ranges \
+                    else _read_part(file, 0, 0, fieldnames)
+            else:
+                frame = _convert(pd.read_csv(file, sep=';', dtype=str, keep_default_na=False, encoding='utf-8'))
+        except FileNotFoundError as exc:
+            raise err.ShipRadarImportError(f"No file {file}") from exc
+        except ValueError as exc:
+            raise err.ShipRadarImportError(f"Wrong value in CSV file: {exc}") from exc
+        dataset = cls(frame, partial_fingerprint(meta["fingerprint"], end) if partial else meta["fingerprint"])
+        dataset.offset = end if complete_lines or end == meta["size"] else None
+
+        if cache is not None and not partial:
+            try:
+                dataset.save(cache.prepare(file))
+                cache.commit(file, meta)
+            except OSError as exc:
+                # Not being able to write the cache, e.g. in a read-only directory, is not fatal
+                dataset.logger.warning(f"Could not write cache for {file}: {exc}")
+        return dataset
+
+    @staticmethod
+    def __read_parallel(file: str, workers: int, size: Union[None, int] = None) -> pd.DataFrame:
+        """
+        Reads parts of a CSV file in worker processes, each of them converts its part to typed columns
+        :param file: Path to the CSV file
+        :param workers: number of worker processes
+        :param size: bytes of the file to read, at the end of a line, the whole file by default
+        :return: DataFrame with typed columns
+        """
+        # A few parts per worker, so that workers finishing early get more work
+        fieldnames, ranges = ShipRadarCSVReader(file, workers).split(workers * 4, size)
+        # Forking the app, with its threads, isn't safe, workers start as fresh interpreters
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            frames = list(executor.map(_read_part, repeat(file), [start for start, _ in ranges],
+                                       [end for _, end in ranges], repeat(fieldnames)))
+        return _concat(frames) if frames else _read_part(file, 0, 0, fieldnames)
+
+    @classmethod
+    def empty(cls) -> 'ShipRadarDataset':
+        """
+        Creates a dataset without rows, e.g. for rows of a live feed to be appended to
+        :return: ShipRadarDataset object
+        """
+        return cls(_convert(pd.DataFrame({column: pd.Series(dtype=str) for column in HEADER})))
+
+    def save(self, directory: str) -> None:
+        """
+        Saves typed columns to a directory, one .npy file per array
+        :param directory: Path to an existing directory
+        :return: None
+        """
+        for column in HEADER:
+            if column in CATEGORICAL_COLUMNS:
+                np.save(os.path.join(directory, f"{column}.codes.npy"), self.__column(column, None))
+                np.save(os.path.join(directory, f"{column}.categories.npy"), self.__categories[column].astype(str))
+            else:
+                np.save(os.path.join(directory, f"{column}.npy"), self.__column(column, None))
+
+    @classmethod
+    def load(cls, directory: str, fingerprint: Union[None, str] = None) -> 'ShipRadarDataset':
+        """
+        Loads typed columns saved by ShipRadarDataset.save
+        :param directory: Path to the directory
+        :param fingerprint: fingerprint of the file the columns were read from
+        :return: ShipRadarDataset object
+        """
+        columns = {}
+        for column in HEADER:
+            if column in CATEGORICAL_COLUMNS:
+                columns[column] = pd.Categorical.from_codes(
+                    np.load(os.path.join(directory, f"{column}.codes.npy")),
+                    np.load(os.path.join(directory, f"{column}.categories.npy"))
+                )
+            else:
+                columns[column] = np.load(os.path.join(directory, f"{column}.npy"))
+        return cls(pd.DataFrame(columns), fingerprint)
+
+    def append(self, records: list[ShipRadarRecord], fingerprint: Union[None, str] = None) -> np.ndarray:
+        """
+        Appends rows, e.g. read from a followed file by ShipRadarCSVReader.read_appended or received by
+        ShipRadarStreamReceiver. Only appended rows are converted and copied, indexes and statistics take them in
+        on their next use.
+        :param records: list of ShipRadarRecord objects, they get the next row ids of the dataset
+        :param fingerprint: fingerprint of the file after the rows were appended
+        :return: row ids of appended rows
+        """
+        start = len(self)
+        end = start + len(records)
+        if records:
+            self.__reserve(end)
+            for column, attribute in ShipRadarRecord.COLUMNS.items():
+                values = [getattr(record, attribute) for record in records]
+                if column in CATEGORICAL_COLUMNS:
+                    values = self.__encode(column, values)
+                self.__columns[column][start:end] = values
+            self.__rows = end
+            self.__frame = None
+        self.fingerprint = fingerprint
+        self.logger.debug(f"Appended {len(records)} rows")
+        return np.arange(start, end)
+
+    def __reserve(self, rows: int) -> None:
+        """
+        Makes sure that columns can hold a number of rows, growing them by half at least, so that appending
+        a row takes constant time on average
+        :param rows: number of rows
+        :return: None
+        """
+        for column, values in self.__columns.items():
+            if len(values) < rows:
+                grown = np.empty(max(rows, len(values) + len(values) // 2), dtype=values.dtype)
+                grown[:len(self)] = values[:len(self)]
+                self.__columns[column] = grown
+
+    def __encode(self, column: str, values: list[str]) -> np.ndarray:
+        """
+        Converts values of a categorical column to category codes, adding new values to its categories
+        :param column: name of the categorical column
+        :param values: list of values
+        :return: array of codes
+        """
+        codes = self.__codes[column]
+        new = [value for value in dict.fromkeys(values) if value not in codes]
+        if new:
+            for value in new:
+                codes[value] = len(codes)
+            self.__categories[column] = np.concatenate((self.__categories[column], np.array(new, dtype=object)))
+            if len(codes) > np.iinfo(self.__columns[column].dtype).max:
+                # Codes of pandas categoricals are as small as their categories allow
+                self.__columns[column] = self.__columns[column].astype(np.int32)
+        return np.array([codes[value] for value in values], dtype=self.__columns[column].dtype)
+
+    def __column(self, column: str, ids: Union[None, np.ndarray]) -> np.ndarray:
+        """
+        Returns values of a column, categorical columns as category codes
+        :param column: name of the column
+        :param ids: row ids to take, None for all rows
+        :return: array of values
+        """
+        values = self.__columns[column][:len(self)]
+        return values if ids is None else values[ids]
+
+    @staticmethod
+    def __check(filter_obj: ShipRadarFilter) -> None:
+        """
+        Checks if Filter's fields are filled
+        :param filter_obj: ShipRadarFilter object
+        :return: None
+        """
+        if (filter_obj.type is None) or (filter_obj.filter is None):
+            raise err.ShipRadarFilterError('Filter not initialized')
+
+    def mask(self, filter_obj: ShipRadarFilter, ids: Union[None, np.ndarray] = None) -> np.ndarray:
+        """
+        Evaluates the filter over the dataset
+        :param filter_obj: ShipRadarFilter object
+        :param ids: row ids to evaluate the filter for, None for all rows
+        :return: boolean array, True for rows satisfying filter
+        """
+        self.__check(filter_obj)
+        match filter_obj.type:
+            case 'ship_no':
+                return self.__column("LRIMOShipNo", ids) == filter_obj.filter
+            case 'ship_type':
+                return self.__category_mask("ShipType", filter_obj.filter, ids)
+            case 'move_status':
+                return self.__category_mask("MoveStatus", filter_obj.filter, ids)
+            case 'heading':
+                return self.__range_mask("Heading", filter_obj.ranges(), ids)
+            case 'draught':
+                return self.__range_mask("Draught", filter_obj.ranges(), ids)
+            case 'speed':
+                return self.__range_mask("Speed", filter_obj.ranges(), ids)
+            case 'destination':
+                return self.__category_mask("Destination", filter_obj.filter, ids)
+            case 'eta':
+                return self.__column("ETA", ids) == np.datetime64(filter_obj.filter, 'ms')
+            case 'ship_name':
+                return self.__category_mask("ShipName", filter_obj.filter, ids)
+            case 'date':
+                # Filter is a tuple of 2 datetime objects, from and till
+                dates = self.__column("MovementDateTime", ids)
+                return (np.datetime64(filter_obj.filter[0], 'ms') <= dates) & \
+                    (dates <= np.datetime64(filter_obj.filter[1], 'ms'))
+            case 'coords':
+                x, y = self.__column("Longitude", ids), self.__column("Latitude", ids)
+                lon_ranges, (lat_min, lat_max) = filter_obj.box()
+                inside = np.zeros(len(x), dtype=bool)
+                for lon_min, lon_max in lon_ranges:
+                    inside |= (lon_min <= x) & (x <= lon_max)
+                return inside & (lat_min <= y) & (y <= lat_max)
+            case _:
+                self.logger.debug("Unknown error occurred")
+                raise err.ShipRadarBaseException('Unknown error')
+
+    def __range_mask(self, column: str, ranges: list[tuple], ids: Union[None, np.ndarray]) -> np.ndarray:
+        """
+        Checks if values of a numeric column are inside any of the ranges
+        :param column: name of the numeric column
+        :param ranges: list of (min, max) ranges, None for an unbounded side, e.g. from ShipRadarFilter.ranges
+        :param ids: row ids to compare, None for all rows
+        :return: boolean array, True for rows inside a range
+        """
+        values = self.__column(column, ids)
+        inside = np.zeros(len(values), dtype=bool)
+        for low, high in ranges:
+            in_range = np.ones(len(values), dtype=bool)
+            if low is not None:
+                in_range &= low <= values
+            if high is not None:
+                in_range &= values <= high
+            inside |= in_range
+        return inside
+
+    def __category_mask(self, column: str, value: str, ids: Union[None, np.ndarray]) -> np.ndarray:
+        """
+        Compares a categorical column with a value, using the category codes
+        :param column: name of the categorical column
+        :param value: value to compare with
+        :param ids: row ids to compare, None for all rows
+        :return: boolean array, True for rows equal to value
+        """
+        code = self.__codes[column].get(value)
+        codes = self.__column(column, ids)
+        if code is None:
+            # Value does not appear in the column at all
+            return np.zeros(len(codes), dtype=bool)
+        return codes == code
+
+    @property
+    def grid(self) -> ShipRadarGridIndex:
+        """
+        Spatial index over positions, built on first use, see ShipRadarDataset.MERGE_ROWS for appended rows
+        :return: ShipRadarGridIndex object
+        """
+        if self.__grid is None:
+            self.logger.debug("Building grid index")
+            self.__grid = ShipRadarGridIndex(self.__column("Latitude", None), self.__column("Longitude", None))
+        elif len(self) - self.__grid.rows >= self.MERGE_ROWS:
+            self.logger.debug("Extending grid index")
+            self.__grid.extend(self.__column("Latitude", None), self.__column("Longitude", None))
+        return self.__grid
+
+    def sorted_index(self, column: str) -> ShipRadarSortedIndex:
+        """
+        Index of rows sorted by a column, built on first use, see ShipRadarDataset.MERGE_ROWS for appended rows.
+        Dates are indexed as int64 milliseconds since the epoch.
+        :param column: name of the column
+        :return: ShipRadarSortedIndex object
+        """
+        index = self.__sorted_indexes.get(column)
+        if index is None or len(self) - index.rows >= self.MERGE_ROWS:
+            values = self.__column(column, None)
+            if column in DATETIME_COLUMNS:
+                values = values.view(np.int64)
+            if index is None:
+                self.logger.debug(f"Building sorted index of {column}")
+                self.__sorted_indexes[column] = ShipRadarSortedIndex(values)
+            else:
+                self.logger.debug(f"Extending sorted index of {column}")
+                index.extend(values[index.rows:])
+        return self.__sorted_indexes[column]
+
+    def inverted_index(self, column: str) -> ShipRadarInvertedIndex:
+        """
+        Index of rows by distinct values of a categorical column, or of LRIMO numbers, built on first use,
+        see ShipRadarDataset.MERGE_ROWS for appended rows
+        :param column: name of the column
+        :return: ShipRadarInvertedIndex object
+        """
+        index = self.__inverted_indexes.get(column)
+        if index is None or len(self) - index.rows >= self.MERGE_ROWS:
+            start = 0 if index is None else index.rows
+            if column in CATEGORICAL_COLUMNS:
+                # Categorical columns are already dictionary-encoded
+                codes, values = self.__column(column, None)[start:], self.__categories[column]
+            else:
+                codes, values = pd.factorize(self.__column(column, None)[start:])
+            if index is None:
+                self.logger.debug(f"Building inverted index of {column}")
+                self.__inverted_indexes[column] = ShipRadarInvertedIndex(codes, values)
+            else:
+                self.logger.debug(f"Extending inverted index of {column}")
+                index.extend(codes, values)
+        return self.__inverted_indexes[column]
+
+    @staticmethod
+    def __epoch(value: datetime) -> np.int64:
+        """
+        Converts a date to the representation used by sorted indexes of dates
+        :param value: datetime object
+        :return: milliseconds since the epoch
+        """
+        return np.datetime64(value, 'ms').astype(np.int64)
+
+    @staticmethod
+    def __range_lookup(index: ShipRadarSortedIndex, ranges: list[tuple]) -> np.ndarray:
+        """
+        Finds rows with values of a numeric column inside any of the ranges, using the sorted index of the column
+        :param index: sorted index of the numeric column
+        :param ranges: list of (min, max) ranges, None for an unbounded side, e.g. from ShipRadarFilter.ranges
+        :return: sorted array of row ids
+        """
+        ids = index.range(*ranges[0])
+        for low, high in ranges[1:]:
+            ids = np.union1d(ids, index.range(low, high))
+        return ids
+
+    def lookup(self, filter_obj: ShipRadarFilter) -> Union[None, np.ndarray]:
+        """
+        Answers the filter from an index, without evaluating it for every row
+        :param filter_obj: ShipRadarFilter object
+        :return: sorted array of row ids satisfying filter, None if no index can answer the filter
+        """
+        self.__check(filter_obj)
+        match filter_obj.type:
+            case 'coords':
+                index = self.grid
+                ids = index.query(*filter_obj.box())
+            case 'date':
+                index = self.sorted_index("MovementDateTime")
+                ids = index.range(self.__epoch(filter_obj.filter[0]), self.__epoch(filter_obj.filter[1]))
+            case 'eta':
+                index = self.sorted_index("ETA")
+                eta = self.__epoch(filter_obj.filter)
+                ids = index.range(eta, eta)
+            case 'heading' | 'draught' | 'speed':
+                index = self.sorted_index(ShipRadarPlanner.COLUMNS[filter_obj.type])
+                ids = self.__range_lookup(index, filter_obj.ranges())
+            case 'ship_no' | 'ship_name' | 'ship_type' | 'move_status' | 'destination':
+                index = self.inverted_index(ShipRadarPlanner.COLUMNS[filter_obj.type])
+                ids = index.postings(filter_obj.filter)
+            case _:
+                return None
+        if index.rows < len(self):
+            # Rows appended since the index was last extended are few, so they are checked one by one
+            appended = np.arange(index.rows, len(self))
+            ids = np.concatenate((ids, appended[self.mask(filter_obj, appended)]))
+        return ids
+
+    @property
+    def statistics(self) -> dict[str, Union[ShipRadarColumnStatistics, ShipRadarValueStatistics]]:
+        """
+        Statistics of every column used by the query planner, computed on first use and updated with rows
+        appended since their last use
+        :return: dict of column name: statistics of the column
+        """
+        if self.__statistics is None:
+            self.logger.debug("Computing column statistics")
+            self.__statistics = {}
+            for column in HEADER:
+                if column in CATEGORICAL_COLUMNS or column == "LRIMOShipNo":
+                    self.__statistics[column] = ShipRadarValueStatistics(*self.__counts(column, None))
+                else:
+                    self.__statistics[column] = ShipRadarColumnStatistics(self.__column(column, None))
+        elif self.__statistics_rows < len(self):
+            self.logger.debug(f"Updating column statistics with {len(self) - self.__statistics_rows} rows")
+            appended = np.arange(self.__statistics_rows, len(self))
+            for column, statistics in self.__statistics.items():
+                if isinstance(statistics, ShipRadarValueStatistics):
+                    statistics.update(*self.__counts(column, appended))
+                else:
+                    statistics.update(self.__column(column, appended))
+        self.__statistics_rows = len(self)
+        return self.__statistics
+
+    def __counts(self, column: str, ids: Union[None, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Counts rows of every value of a categorical column or of LRIMO numbers
+        :param column: name of the column
+        :param ids: row ids to count, None for all rows
+        :return: array of values and array of their numbers of rows
+        """
+        if column in CATEGORICAL_COLUMNS:
+            categories = self.__categories[column]
+            return categories, np.bincount(self.__column(column, ids), minlength=len(categories))
+        return np.unique(self.__column(column, ids), return_counts=True)
+
+    def explain(self, filters: list[ShipRadarFilter],
+                previous: Union[None, ShipRadarSelection] = None) -> ShipRadarPlan:
+        """
+        Runs a query and reports how it was evaluated: order of filters, index or scan,
+        estimated and actual row counts and time of every step
+        :param filters: list of ShipRadarFilter objects
+        :param previous: optional result of a previous query, if filters only add to or tighten its filters,
+                         only its rows are checked
+        :return: ShipRadarPlan object, print it to see the plan
+        """
+        if not filters:
+            self.logger.debug("No filters given.\nFilterError raised.")
+            raise err.ShipRadarFilterError('No filters given')
+        for filter_obj in filters:
+            self.__check(filter_obj)
+        if previous is not None and previous.fingerprint is not None and previous.fingerprint == self.fingerprint:
+            refinement = previous.refinement(filters)
+            if refinement is not None:
+                self.logger.debug(f"Refining previous result of {len(previous.ids)} rows with {refinement}")
+                return ShipRadarPlanner(self).run(refinement, previous.ids)
+        return ShipRadarPlanner(self).run(filters)
+
+    def extend(self, selection: ShipRadarSelection, ids: np.ndarray) -> ShipRadarSelection:
+        """
+        Adds matches among appended rows to the result of a query, without evaluating its filters for old rows
+        :param selection: result of a query run before the rows were appended
+        :param ids: row ids of appended rows, as returned by ShipRadarDataset.append
+        :return: ShipRadarSelection object with the result of the query over all rows
+        """
+        found = ids
+        for filter_obj in selection.filters:
+            # Few rows are appended at a time, so filters are evaluated for them directly, without planning
+            found = found[self.mask(filter_obj, found)]
+        # Appended rows come after all old rows, so row ids stay sorted
+        return ShipRadarSelection(self.fingerprint, selection.filters, np.concatenate([selection.ids, found]))
+
+    def select(self, filters: list[ShipRadarFilter], results: Union[None, ShipRadarResultCache] = None,
+               previous: Union[None, ShipRadarSelection] = None) -> np.ndarray:
+        """
+        Finds rows satisfying all filters (logical AND).
+        Filters are evaluated from the most selective one, see ShipRadarPlanner.
+        :param filters: list of ShipRadarFilter objects
+        :param results: optional ShipRadarResultCache, repeated queries are then answered from it
+        :param previous: optional result of a previous query, if filters only add to or tighten its filters,
+                         only its rows are checked
+        :return: sorted array of row ids satisfying all filters
+        """
+        self.logger.debug(f"Selecting rows with filters {filters} started")
+        key = None
+        ids = None
+        if results is not None and self.fingerprint is not None and filters:
+            key = results.key(self.fingerprint, filters)
+            ids = results.get(key)
+        if ids is None:
+            ids = self.explain(filters, previous).ids
+            if key is not None:
+                results.put(key, ids)
+
+        if not ids.size:
+            self.logger.debug(f"No ships for given filters {filters}")
+            raise err.ShipRadarFilterError('No entries for these filters: ' +
+                                           ', '.join(f'{f.type}: {f.filter}' for f in filters))
+
+        return ids
+
+    def rows(self, ids: np.ndarray) -> list[ShipRadarRow]:
+        """
+        Builds rows with given row ids
+        :param ids: row ids, e.g. from ShipRadarDataset.select
+        :return: list of rows with typed values, in order of ids
+        """
+        records: list[dict] = self.frame.iloc[ids].to_dict('records')
+        return [ShipRadarRow(record, int(row_id)) for record, row_id in zip(records, ids)]
+
+    def tracks(self, ids: np.ndarray) -> list[ShipRadarTrack]:
+        """
+        Groups rows with given row ids into tracks of individual ships, by LRIMO number
+        :param ids: row ids, e.g. from ShipRadarDataset.select
+        :return: list of tracks, in order of the first appearance of each ship
+        """
+        # Hash pass assigning each row a group number, ships numbered in order of appearance
+        groups, ship_nos = pd.factorize(self.__column("LRIMOShipNo", ids))
+        # Sort by ship, then by time, each group ends up as a contiguous slice
+        order = np.lexsort((self.__column("MovementDateTime", ids), groups))
+        sorted_ids = ids[order]
+        bounds = np.searchsorted(groups[order], np.arange(len(ship_nos) + 1))
+
+        columns = {column: self.__categories[column][self.__column(column, sorted_ids)]
+                   if column in CATEGORICAL_COLUMNS else self.__column(column, sorted_ids) for column in HEADER}
+        return [
+            ShipRadarTrack(int(ship_no),
+                           {column: values[start:end] for column, values in columns.items()},
+                           sorted_ids[start:end])
+            for ship_no, start, end in zip(ship_nos, bounds[:-1], bounds[1:])
+        ]
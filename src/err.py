@@ -26,3 +26,9 @@ class ShipRadarFilterError(ShipRadarImportError):
     """
     def __init__(self, reason: str):
         super().__init__(reason)
+
+
+class ShipRadarRenderError(ShipRadarBaseException):
+    """
+    Raised when a figure can't be rendered to an image, e.g. when kaleido is missing
+    """
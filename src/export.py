@@ -0,0 +1,227 @@
+"""
+This module exports maps of ship tracks to image files without the GUI, e.g. for daily maps of many vessels.
+
+Usage: python -m src.export FILE [--ships LRIMO ...] [--all-ships] [--queries QUERIES.json] [--output DIR]
+                                 [--format png|jpeg|webp|svg|pdf] [--width PX] [--height PX] [--workers N]
+                                 [--timeout SECONDS]
+
+A queries file holds a list of maps, each with a name and filters given as a filter type and its arguments,
+dates in ISO format, e.g.
+[{"name": "moored-cargo", "filters": [["ship_type", "Cargo"], ["move_status", "Moored"]]},
+ {"name": "slow", "filters": [["speed", null, 0.5], ["date", "2012-01-01 00:00:00", "2012-01-02 00:00:00"]]}]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from datetime import datetime
+import numpy as np
+import distinctipy
+from beartype.typing import Union
+from src import err, logger
+from src.cache import ShipRadarFileCache
+from src.dataset import ShipRadarDataset
+from src.figure import ShipRadarFigureBuilder
+from src.reader import ShipRadarFilter
+from src.render import FORMATS, ShipRadarRenderer
+
+
+def parse_filter(spec: list) -> ShipRadarFilter:
+    """
+    Creates a filter from its JSON form
+    :param spec: list of the filter type and its arguments, dates as ISO strings
+    :return: ShipRadarFilter object
+    """
+    if not spec:
+        raise err.ShipRadarFilterError('Empty filter')
+    filter_type, *args = spec
+    if filter_type in ('date', 'eta'):
+        try:
+            args = [datetime.fromisoformat(arg) for arg in args]
+        except (TypeError, ValueError) as exc:
+            raise err.ShipRadarFilterError('Wrong time format') from exc
+    return ShipRadarFilter(filter_type, *args)
+
+
+def read_queries(path: str) -> list[tuple[str, list[ShipRadarFilter]]]:
+    """
+    Reads maps to export from a queries file
+    :param path: Path to the JSON file
+    :return: list of names and filters of maps
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            queries = json.load(file)
+        return [(str(query["name"]), [parse_filter(spec) for spec in query["filters"]]) for query in queries]
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        raise err.ShipRadarImportError(f"Wrong queries file {path}: {exc}") from exc
+
+
+def file_name(name: str) -> str:
+    """
+    Converts the name of a map to a safe file name
+    :param name: name of the map
+    :return: file name without extension
+    """
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or "map"
+
+
+class ShipRadarExporter:
+    """
+    Exports maps to files. Figures are built in the main process, one map at a time, and rendered in worker processes
+    of ShipRadarRenderer, at most two maps per worker are waiting, so memory doesn't grow with the number of maps.
+    """
+    # Seconds without any render finishing after which maps in progress are given up, e.g. if kaleido hangs
+    TIMEOUT: float = 300.0
+
+    def __init__(self, dataset: ShipRadarDataset, output: str, image_format: str = 'png', width: int = 1200,
+                 height: int = 800, workers: int = 2, builder: Union[None, ShipRadarFigureBuilder] = None,
+                 renderer: Union[None, ShipRadarRenderer] = None):
+        """
+        :param dataset: ShipRadarDataset object
+        :param output: Path to the output directory, created if missing
+        :param image_format: one of render.FORMATS
+        :param width: width of images in pixels
+        :param height: height of images in pixels
+        :param workers: number of render worker processes
+        :param builder: ShipRadarFigureBuilder object styling the maps, SVG maps with simplified tracks by default
+        :param renderer: ShipRadarRenderer object, a new one with workers processes by default
+        """
+        self.logger = logger.ShipRadarLogger("ExportLogger")
+        self.dataset = dataset
+        self.output: str = output
+        self.image_format: str = image_format
+        self.width: int = width
+        self.height: int = height
+        # Static images can't be panned, so WebGL maps, needing map tiles, aren't used
+        self.builder = builder if builder is not None else \
+            ShipRadarFigureBuilder(tolerance=0.0005, webgl_threshold=None)
+        self.renderer = renderer if renderer is not None else ShipRadarRenderer(workers=workers, budget=0)
+        self.workers: int = self.renderer.workers
+        self.timeout: float = self.TIMEOUT
+        self.exported: list[str] = []
+        self.failed: list[tuple[str, str]] = []
+        self.seconds: float = 0.0
+
+    def export(self, maps: list[tuple[str, list[ShipRadarFilter]]]) -> list[str]:
+        """
+        Exports maps, maps without matching positions or failing to render are reported in failed
+        :param maps: list of names and filters of maps
+        :return: paths of written files
+        """
+        os.makedirs(self.output, exist_ok=True)
+        start = time.perf_counter()
+        pending: dict[Future, tuple[str, str]] = {}
+        for number, (name, filters) in enumerate(maps, 1):
+            while len(pending) >= 2 * self.workers:
+                self.__write(pending)
+            try:
+                tracks = self.dataset.tracks(self.dataset.select(filters))
+            except err.ShipRadarFilterError as exc:
+                self.failed.append((name, str(exc)))
+                self.logger.debug(f"Map {name} skipped: {exc}")
+                continue
+            figure = self.builder.build(tracks, distinctipy.get_colors(len(tracks)))
+            figure.update_layout(title=name)
+            path = os.path.join(self.output, f"{file_name(name)}.{self.image_format}")
+            pending[self.renderer.render(figure, self.width, self.height, self.image_format)] = name, path
+            self.logger.debug(f"Map {number} of {len(maps)} queued: {name}")
+        while pending:
+            self.__write(pending)
+        self.seconds = time.perf_counter() - start
+        return self.exported
+
+    def __write(self, pending: dict[Future, tuple[str, str]]) -> None:
+        """
+        Waits for renders to finish and writes rendered maps to their files, all maps in progress fail and render
+        workers are killed if none finishes within ShipRadarExporter.timeout
+        :param pending: futures of renders in progress with names and paths of their maps, done ones are removed
+        :return: None
+        """
+        done = wait(pending, timeout=self.timeout, return_when=FIRST_COMPLETED).done
+        if not done:
+            for future, (name, _) in pending.items():
+                future.cancel()
+                self.failed.append((name, f"Rendering timed out after {self.timeout} s"))
+                self.logger.error(f"Map {name} not exported: rendering timed out")
+            pending.clear()
+            # Stuck workers would keep later maps and closing the renderer waiting
+            self.renderer.terminate()
+            return
+        for future in done:
+            name, path = pending.pop(future)
+            try:
+                image = future.result()
+                with open(path, 'wb') as file:
+                    file.write(image)
+            except (err.ShipRadarRenderError, OSError, RuntimeError) as exc:
+                self.failed.append((name, str(exc)))
+                self.logger.error(f"Map {name} not exported: {exc}")
+                continue
+            self.exported.append(path)
+            self.logger.info(f"[{len(self.exported) + len(self.failed)}] {path}")
+
+    def summary(self) -> str:
+        """
+        Describes the last export
+        :return: number of exported and failed maps and the throughput
+        """
+        rate = len(self.exported) / self.seconds if self.seconds else 0.0
+        lines = [f"Exported {len(self.exported)} maps to {self.output} in {self.seconds:.1f} s, "
+                 f"{rate:.2f} maps/s with {self.workers} workers"]
+        lines += [f"Failed {name}: {reason}" for name, reason in self.failed]
+        return "\n".join(lines)
+
+
+def main(argv: Union[None, list[str]] = None) -> int:
+    """
+    Exports maps given on the command line
+    :param argv: command line arguments, sys.argv by default
+    :return: exit code, 1 if some map wasn't exported
+    """
+    parser = argparse.ArgumentParser(prog="python -m src.export", description="Export maps of ship tracks to files")
+    parser.add_argument("file", help="CSV file with positions")
+    parser.add_argument("--ships", nargs='+', type=int, default=[], metavar="LRIMO",
+                        help="LRIMO numbers of ships, one map per ship")
+    parser.add_argument("--all-ships", action='store_true', help="one map for every ship of the file")
+    parser.add_argument("--queries", help="JSON file with names and filters of maps")
+    parser.add_argument("--output", default="maps", help="output directory")
+    parser.add_argument("--format", default='png', choices=FORMATS, help="image format")
+    parser.add_argument("--width", type=int, default=1200, help="image width in pixels")
+    parser.add_argument("--height", type=int, default=800, help="image height in pixels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes reading the file and rendering maps")
+    parser.add_argument("--timeout", type=float, default=ShipRadarExporter.TIMEOUT,
+                        help="seconds without any map rendered after which maps in progress fail")
+    args = parser.parse_args(argv)
+    if not args.ships and not args.all_ships and args.queries is None:
+        parser.error("no maps given, use --ships, --all-ships or --queries")
+
+    try:
+        dataset = ShipRadarDataset.from_csv(args.file, ShipRadarFileCache(), args.workers)
+        ships = args.ships
+        if args.all_ships:
+            ships = np.unique(dataset.frame["LRIMOShipNo"].to_numpy()).tolist()
+        maps = [(str(ship), [ShipRadarFilter('ship_no', ship)]) for ship in ships]
+        if args.queries is not None:
+            maps += read_queries(args.queries)
+    except err.ShipRadarBaseException as exc:
+        print(exc, file=sys.stderr)
+        return 2
+
+    exporter = ShipRadarExporter(dataset, args.output, args.format, args.width, args.height, args.workers)
+    exporter.timeout = args.timeout
+    try:
+        exporter.export(maps)
+    finally:
+        exporter.renderer.close()
+    print(exporter.summary())
+    return 1 if exporter.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""
+This module contains the ShipRadarFigureBuilder class, building plotly figures of ship tracks for the plot window
+and for exports.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+import distinctipy
+import plotly.graph_objects as go
+from beartype.typing import Union, Iterator
+from src import logger
+from src.track import ShipRadarTrack
+
+# Text columns, hardly ever changing along a track, so they are written into hover templates of traces
+# instead of being sent with every point
+RUN_COLUMNS: tuple[str, ...] = ("ShipName", "ShipType", "MoveStatus", "Destination", "ETA")
+# Numeric columns sent with every point as customdata, in this order
+DATA_COLUMNS: tuple[str, ...] = ("Heading", "Speed", "Draught")
+HOVER_TEMPLATE: str = (
+    "<b>Ship name:</b> {ShipName}<br>"
+    "<b>LRIMO number:</b> {ship_no}<br>"
+    "<b>Ship type:</b> {ShipType}<br>"
+    "<b>Movement date:</b> %{{hovertext|%Y-%m-%d %H:%M:%S}}<br>"
+    "<b>Move status:</b> {MoveStatus}<br>"
+    "<b>Destination:</b> {Destination}<br>"
+    "<b>ETA:</b> {ETA}<br>"
+    "<b>Heading:</b> %{{customdata[0]}}<br>"
+    "<b>Speed:</b> %{{customdata[1]}}<br>"
+    "<b>Draught:</b> %{{customdata[2]}}<br>"
+    "<b>Position:</b> %{{lat}}, %{{lon}}"
+)
+# Hover template of a ship with runs merged into one trace, only columns of single positions are shown
+SHIP_TEMPLATE: str = (
+    "<b>Ship name:</b> {name}<br>"
+    "<b>LRIMO number:</b> {ship_no}<br>"
+    "<b>Movement date:</b> %{{hovertext|%Y-%m-%d %H:%M:%S}}<br>"
+    "<b>Heading:</b> %{{customdata[0]}}<br>"
+    "<b>Speed:</b> %{{customdata[1]}}<br>"
+    "<b>Draught:</b> %{{customdata[2]}}<br>"
+    "<b>Position:</b> %{{lat}}, %{{lon}}"
+)
+ANIMATION_TEMPLATE: str = "<b>{name}</b><br><b>Position:</b> %{{lat}}, %{{lon}}<extra></extra>"
+DENSITY_TEMPLATE: str = "<b>{name}</b><br><b>Positions:</b> %{{customdata}}<br><b>Cell:</b> %{{lat}}, %{{lon}}"
+
+
+def rgb(color: tuple[float, float, float]) -> str:
+    """
+    Converts a color as returned by distinctipy to a plotly color
+    :param color: red, green and blue components from 0 to 1
+    :return: color string
+    """
+    return f'rgb({color[0] * 255}, {color[1] * 255}, {color[2] * 255})'
+
+
+def bounds(tracks: list[ShipRadarTrack]) -> tuple[float, float, float, float]:
+    """
+    Finds the bounding box of all positions of tracks, without copying them into one array
+    :param tracks: list of non-empty tracks
+    :return: lowest longitude, lowest latitude, highest longitude, highest latitude
+    """
+    extremes = np.array([(track["Longitude"].min(), track["Latitude"].min(),
+                          track["Longitude"].max(), track["Latitude"].max()) for track in tracks])
+    return (float(extremes[:, 0].min()), float(extremes[:, 1].min()),
+            float(extremes[:, 2].max()), float(extremes[:, 3].max()))
+
+
+def zoom(lon_min: float, lat_min: float, lon_max: float, lat_max: float) -> float:
+    """
+    Estimates a web map zoom level showing a bounding box, zoom 0 shows the whole world in 256 pixels
+    :param lon_min: lowest longitude
+    :param lat_min: lowest latitude
+    :param lon_max: highest longitude
+    :param lat_max: highest latitude
+    :return: zoom level
+    """
+    span = max(lon_max - lon_min, (lat_max - lat_min) * 2, 1e-6)
+    return min(15.0, max(0.0, math.log2(360 / span)))
+
+
+def density(longitudes: np.ndarray, latitudes: np.ndarray, box: tuple[float, float, float, float],
+            cells: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Counts positions in cells of a square grid covering a bounding box, grids of the same box and number of cells
+    are aligned
+    :param longitudes: longitudes of positions
+    :param latitudes: latitudes of positions
+    :param box: lowest longitude, lowest latitude, highest longitude, highest latitude of the grid
+    :param cells: number of cells along the longer side of the box
+    :return: longitudes and latitudes of centres of cells with positions, and numbers of their positions
+    """
+    lon_min, lat_min, lon_max, lat_max = box
+    size = max(lon_max - lon_min, lat_max - lat_min, 1e-6) / cells
+    edges = []
+    for low, high in ((lon_min, lon_max), (lat_min, lat_max)):
+        side = low + size * np.arange(max(1, math.ceil((high - low) / size)) + 1)
+        # The last bin includes its upper edge, it must not end below the highest value due to rounding
+        side[-1] = max(side[-1], high)
+        edges.append(side)
+    counts, _, _ = np.histogram2d(longitudes, latitudes, bins=edges)
+    lon_cells, lat_cells = np.nonzero(counts)
+    return (edges[0][lon_cells] + size / 2, edges[1][lat_cells] + size / 2,
+            counts[lon_cells, lat_cells].astype(np.int64))
+
+
+def runs(track: ShipRadarTrack) -> Iterator[tuple[int, int]]:
+    """
+    Splits a track into runs of positions with the same values of RUN_COLUMNS
+    :param track: non-empty ShipRadarTrack object
+    :return: iterator of first and past the last position of every run
+    """
+    changes = np.zeros(len(track) - 1, dtype=bool)
+    for column in RUN_COLUMNS:
+        values = track[column]
+        changes |= values[1:] != values[:-1]
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1, [len(track)]))
+    return zip(starts[:-1].tolist(), starts[1:].tolist())
+
+
+def hover_template(track: ShipRadarTrack, position: int) -> str:
+    """
+    Creates the hover template of a run of a track
+    :param track: ShipRadarTrack object
+    :param position: any position of the run
+    :return: plotly hover template
+    """
+    values = {column: track[column][position] for column in RUN_COLUMNS}
+    values["ETA"] = str(np.datetime_as_string(values["ETA"], unit='s')).replace('T', ' ')
+    return HOVER_TEMPLATE.format(ship_no=track.ship_no, **values)
+
+
+class ShipRadarAnimation:
+    """
+    Positions of tracks sorted by time, for replaying movements of ships. A frame holds positions within a window
+    ending at a time, frames are cut from the sorted positions only when shown, so memory doesn't grow with their count.
+    """
+    def __init__(self, tracks: list[ShipRadarTrack], window: np.timedelta64):
+        """
+        :param tracks: list of non-empty ShipRadarTrack objects
+        :param window: length of the time window of a frame
+        """
+        self.window: np.timedelta64 = window
+        self.names: list[str] = [f"{track.name} ({track.ship_no})" for track in tracks]
+        times = np.concatenate([track["MovementDateTime"] for track in tracks]).astype('datetime64[ms]')
+        order = np.argsort(times, kind='stable')
+        self.times: np.ndarray = times[order]
+        self.longitudes: np.ndarray = np.concatenate([track["Longitude"] for track in tracks])[order]
+        self.latitudes: np.ndarray = np.concatenate([track["Latitude"] for track in tracks])[order]
+        # Index of the track of every position, positions of a track stay sorted by time
+        self.ships: np.ndarray = np.repeat(np.arange(len(tracks)), [len(track) for track in tracks])[order]
+
+    @property
+    def start(self) -> np.datetime64:
+        """
+        Time of the first position
+        :return: datetime64
+        """
+        return self.times[0]
+
+    @property
+    def end(self) -> np.datetime64:
+        """
+        Time of the last position
+        :return: datetime64
+        """
+        return self.times[-1]
+
+    def frame(self, time: np.datetime64) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Finds positions of every track within the window ending at a time
+        :param time: end of the window
+        :return: list of longitudes and latitudes of positions, one per track, empty arrays for tracks without them
+        """
+        first = np.searchsorted(self.times, time - self.window, side='left')
+        last = np.searchsorted(self.times, time, side='right')
+        ships = self.ships[first:last]
+        # Group positions of the window by track, keeping their order by time
+        order = np.argsort(ships, kind='stable')
+        starts = np.searchsorted(ships[order], np.arange(len(self.names) + 1))
+        longitudes = self.longitudes[first:last][order]
+        latitudes = self.latitudes[first:last][order]
+        return [(longitudes[start:end], latitudes[start:end]) for start, end in zip(starts[:-1], starts[1:])]
+
+    def show(self, figure: go.Figure, time: np.datetime64) -> None:
+        """
+        Replaces positions of traces of a figure built by ShipRadarFigureBuilder.build_animation with a frame
+        :param figure: plotly figure
+        :param time: end of the window of the frame
+        :return: None
+        """
+        with figure.batch_update():
+            for trace, (longitudes, latitudes) in zip(figure.data, self.frame(time)):
+                trace.lon = longitudes
+                trace.lat = latitudes
+            figure.layout.title.text = str(np.datetime_as_string(time, unit='m')).replace('T', ' ')
+
+
+class ShipRadarFigureBuilder:
+    """
+    Builds a figure of tracks. Every ship has a trace of its lines and traces of its markers, one per run of
+    positions with the same text columns. Plotly copies arrays of strings element by element, so columns are passed
+    only as numeric and date arrays, and hover texts are formatted by plotly from templates.
+    Above a number of points, SVG based Scattergeo traces become unresponsive, so WebGL based Scattermapbox traces
+    are used instead.
+    Figures of many ships are unreadable as tracks, build_density aggregates positions into a grid instead.
+    """
+    # Points of a figure above which WebGL is used
+    WEBGL_THRESHOLD: int = 20000
+    # Mapbox style of WebGL figures, styles other than the Mapbox ones don't need an access token
+    MAP_STYLE: str = 'open-street-map'
+    # Cells of density figures along the longer side of the bounding box of positions
+    DENSITY_CELLS: int = 200
+    # Runs of a figure above which a ship has a single trace of markers
+    MAX_RUNS: int = 2000
+
+    def __init__(self, show_lines: bool = True, tolerance: Union[None, float] = None,
+                 minutes: Union[None, float] = None, webgl_threshold: Union[None, int] = WEBGL_THRESHOLD):
+        """
+        :param show_lines: connect positions of a ship with lines
+        :param tolerance: simplification of tracks, see ShipRadarTrack.simplify
+        :param minutes: simplification of tracks, see ShipRadarTrack.simplify
+        :param webgl_threshold: points of a figure above which WebGL is used, 0 to use it always, None to never use it
+        """
+        self.logger = logger.ShipRadarLogger("FigureLogger")
+        self.show_lines: bool = show_lines
+        self.tolerance: Union[None, float] = tolerance
+        self.minutes: Union[None, float] = minutes
+        self.webgl_threshold: Union[None, int] = webgl_threshold
+        self.density_cells: int = self.DENSITY_CELLS
+        self.max_runs: int = self.MAX_RUNS
+
+    @property
+    def mode(self) -> str:
+        """
+        Plotly mode of traces showing both lines and markers
+        :return: 'lines+markers' or 'markers'
+        """
+        return 'lines+markers' if self.show_lines else 'markers'
+
+    def webgl(self, points: int) -> bool:
+        """
+        Checks if a figure is drawn with WebGL
+        :param points: number of points of the figure
+        :return: True for WebGL, False for SVG
+        """
+        return self.webgl_threshold is not None and points > self.webgl_threshold
+
+    @staticmethod
+    def traces(track: ShipRadarTrack, color: tuple[float, float, float], show_lines: bool = True,
+               webgl: bool = False, merge_runs: bool = False) -> list[dict]:
+        """
+        Creates traces of a single ship, as plain dicts, so plotly doesn't validate every trace
+        :param track: non-empty ShipRadarTrack object, sorted by MovementDateTime
+        :param color: color of the ship, as returned by distinctipy
+        :param show_lines: show the trace of lines
+        :param webgl: create WebGL Scattermapbox traces instead of Scattergeo
+        :param merge_runs: create one trace of markers instead of one per run, hover texts then lack text columns
+        :return: list of plotly traces, the lines first
+        """
+        scatter = 'scattermapbox' if webgl else 'scattergeo'
+        name = f"{track.name} ({track.ship_no})"
+        traces = [{
+            "type": scatter,
+            "lat": track["Latitude"],
+            "lon": track["Longitude"],
+            "mode": 'lines',
+            "line": {
+                "width": 1,
+                "color": rgb(color)
+            },
+            "hoverinfo": 'skip',
+            "visible": show_lines,
+            "showlegend": False,
+            "legendgroup": name,
+            "name": name
+        }]
+        data = np.column_stack([track[column].astype(np.float64) for column in DATA_COLUMNS])
+        for start, end in [(0, len(track))] if merge_runs else runs(track):
+            traces.append({
+                "type": scatter,
+                "lat": track["Latitude"][start:end],
+                "lon": track["Longitude"][start:end],
+                "hovertext": track["MovementDateTime"][start:end],
+                "customdata": data[start:end],
+                "hovertemplate": SHIP_TEMPLATE.format(name=track.name, ship_no=track.ship_no) if merge_runs
+                else hover_template(track, start),
+                "mode": 'markers',
+                "marker": {
+                    "color": rgb(color),
+                    "size": 5
+                },
+                # Markers stay in the legend when lines are hidden, clicking it hides the whole ship
+                "showlegend": start == 0,
+                "legendgroup": name,
+                "name": name
+            })
+        return traces
+
+    def build(self, tracks: list[ShipRadarTrack], colors: list[tuple[float, float, float]]) -> go.Figure:
+        """
+        Builds the figure of tracks
+        :param tracks: list of non-empty ShipRadarTrack objects
+        :param colors: colors of tracks, as returned by distinctipy
+        :return: plotly figure
+        """
+        lon_min, lat_min, lon_max, lat_max = bounds(tracks)
+        # Drop positions that don't change the shape of tracks to keep the figure light
+        simplified: list[ShipRadarTrack] = [track.simplify(self.tolerance, self.minutes) for track in tracks]
+        points = sum(map(len, simplified))
+        webgl = self.webgl(points)
+        self.logger.debug(f"Plotting {points} of {sum(map(len, tracks))} positions, "
+                          f"{'WebGL' if webgl else 'SVG'}")
+
+        # Every trace costs plotly time even unvalidated, so runs of many ships are merged into a trace per ship
+        merge_runs = sum(len(list(runs(track))) for track in simplified) > self.max_runs
+        if merge_runs:
+            self.logger.debug(f"More than {self.max_runs} runs, merging runs of every ship")
+
+        figure = go.Figure(data=[trace for track, color in zip(simplified, colors)
+                                 for trace in self.traces(track, color, self.show_lines, webgl, merge_runs)],
+                           _validate=False)
+        # Only the traces are taken unvalidated, later changes of the figure are validated as usual
+        figure._validate = figure.layout._validate = True  # pylint: disable=protected-access
+        self.__layout(figure, (lon_min, lat_min, lon_max, lat_max), webgl)
+        return figure
+
+    def build_density(self, tracks: list[ShipRadarTrack], by_type: bool = False) -> go.Figure:
+        """
+        Builds a figure of numbers of positions in cells of a grid, only cells with positions are sent to the chart
+        :param tracks: list of non-empty ShipRadarTrack objects
+        :param by_type: count positions of every ShipType separately, in a trace per type
+        :return: plotly figure
+        """
+        box = bounds(tracks)
+        longitudes = np.concatenate([track["Longitude"] for track in tracks])
+        latitudes = np.concatenate([track["Latitude"] for track in tracks])
+        if by_type:
+            codes, types = pd.factorize(np.concatenate([track["ShipType"] for track in tracks]), sort=True)
+            groups = [(str(ship_type), codes == code) for code, ship_type in enumerate(types)]
+        else:
+            groups = [("All ships", slice(None))]
+
+        grids = [(name, *density(longitudes[rows], latitudes[rows], box, self.density_cells)) for name, rows in groups]
+        cells = sum(len(counts) for _, _, _, counts in grids)
+        webgl = self.webgl(cells)
+        self.logger.debug(f"Plotting {cells} cells of {len(longitudes)} positions, {'WebGL' if webgl else 'SVG'}")
+
+        scatter = go.Scattermapbox if webgl else go.Scattergeo
+        largest = max(counts.max() for _, _, _, counts in grids)
+        colors = distinctipy.get_colors(len(grids))
+        traces = []
+        for (name, lon_cells, lat_cells, counts), color in zip(grids, colors):
+            marker = {
+                # Area of markers grows with the number of positions
+                "size": 4 + 12 * np.sqrt(counts / largest),
+                "opacity": 0.8
+            }
+            if by_type:
+                marker["color"] = rgb(color)
+            else:
+                marker.update(color=np.log10(counts), colorscale='Viridis',
+                              colorbar={"title": "log<sub>10</sub> positions"})
+            traces.append(scatter(
+                lat=lat_cells,
+                lon=lon_cells,
+                customdata=counts,
+                hovertemplate=DENSITY_TEMPLATE.format(name=name),
+                mode='markers',
+                marker=marker,
+                showlegend=by_type,
+                name=name
+            ))
+
+        figure = go.Figure(data=traces)
+        self.__layout(figure, box, webgl)
+        return figure
+
+    def build_animation(self, tracks: list[ShipRadarTrack], colors: list[tuple[float, float, float]],
+                        animation: ShipRadarAnimation) -> go.Figure:
+        """
+        Builds a figure with a trace per ship for frames of an animation, showing its first frame
+        :param tracks: list of non-empty ShipRadarTrack objects the animation was created from
+        :param colors: colors of tracks, as returned by distinctipy
+        :param animation: ShipRadarAnimation object
+        :return: plotly figure
+        """
+        box = bounds(tracks)
+        webgl = self.webgl(sum(map(len, tracks)))
+        scatter = go.Scattermapbox if webgl else go.Scattergeo
+        figure = go.Figure(data=[scatter(
+            lat=[],
+            lon=[],
+            hovertemplate=ANIMATION_TEMPLATE.format(name=name),
+            mode=self.mode,
+            marker={
+                "color": rgb(color),
+                "size": 5
+            },
+            line={
+                "width": 1,
+                "color": rgb(color)
+            },
+            name=name
+        ) for name, color in zip(animation.names, colors)])
+        # The map stays at the bounds of whole tracks while frames change
+        self.__layout(figure, box, webgl)
+        animation.show(figure, animation.start)
+        return figure
+
+    def __layout(self, figure: go.Figure, box: tuple[float, float, float, float], webgl: bool) -> None:
+        """
+        Sets the map and the title of a figure
+        :param figure: plotly figure
+        :param box: lowest longitude, lowest latitude, highest longitude, highest latitude of shown positions
+        :param webgl: the figure has Scattermapbox traces
+        :return: None
+        """
+        lon_min, lat_min, lon_max, lat_max = box
+        center = {
+            "lon": (lon_min + lon_max) / 2,
+            "lat": (lat_min + lat_max) / 2
+        }
+        if webgl:
+            figure.update_layout(
+                mapbox={
+                    "style": self.MAP_STYLE,
+                    "center": center,
+                    "zoom": zoom(lon_min, lat_min, lon_max, lat_max)
+                }
+            )
+        else:
+            # Adjust the center and zoom level of the map
+            figure.update_geos(
+                center=center,
+                fitbounds='locations'
+            )
+            figure.update_layout(
+                geo={
+                    "showland": True,
+                    "landcolor": 'rgb(243, 243, 243)',
+                    "countrycolor": 'rgb(204, 204, 204)',
+                    "showcountries": True,
+                    "showocean": True,
+                    "oceancolor": 'rgb(200, 255, 255)',
+                    "showcoastlines": True,
+                    "coastlinecolor": 'rgb(150, 150, 150)',
+                    "showframe": False,
+                    "projection_type": 'natural earth'
+                }
+            )
+
+        figure.update_layout(
+            title='Selected ship movements',
+            title_x=0.5,
+            margin={
+                "r": 0,
+                "l": 0,
+                "t": 30,
+                "b": 0
+            },
+            hovermode='closest'  # Set hover mode to show the closest point information
+        )
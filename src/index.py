@@ -0,0 +1,204 @@
+"""
+This module contains indexes over columns of a ShipRadarDataset, answering filters without scanning all rows.
+"""
+
+import numpy as np
+
+
+class ShipRadarGridIndex:
+    """
+    Uniform grid over positions. Row ids are stored sorted by grid cell, so rows of every cell,
+    and of every run of neighbouring cells in a grid row, form a contiguous slice.
+    """
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, cell_size: float = 1.0):
+        self.latitudes: np.ndarray = latitudes
+        self.longitudes: np.ndarray = longitudes
+        self.cell_size: float = cell_size
+        self.grid_columns: int = int(np.ceil(360 / cell_size))
+        self.grid_rows: int = int(np.ceil(180 / cell_size))
+
+        cells = self.__cells(latitudes, longitudes)
+        # Stable sort keeps row ids within each cell in file order
+        self.order: np.ndarray = np.argsort(cells, kind='stable')
+        self.offsets: np.ndarray = np.searchsorted(cells[self.order],
+                                                   np.arange(self.grid_rows * self.grid_columns + 1))
+
+    @property
+    def rows(self) -> int:
+        """
+        Number of indexed rows
+        :return: number of rows
+        """
+        return len(self.order)
+
+    def extend(self, latitudes: np.ndarray, longitudes: np.ndarray) -> None:
+        """
+        Adds rows appended after the indexed ones, merging them into cells without sorting indexed rows again
+        :param latitudes: array of latitudes of all rows, indexed ones unchanged
+        :param longitudes: array of longitudes of all rows, indexed ones unchanged
+        :return: None
+        """
+        start = self.rows
+        cells = self.__cells(latitudes[start:], longitudes[start:])
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        # Appended rows come after all indexed rows, so they go at the end of their cells
+        self.order = np.insert(self.order, self.offsets[cells + 1], order + start)
+        self.offsets = self.offsets + np.searchsorted(cells, np.arange(len(self.offsets)), side='left')
+        self.latitudes, self.longitudes = latitudes, longitudes
+
+    def __grid_row(self, latitudes):
+        """
+        Returns grid rows of latitudes, positions outside valid range are put into the edge rows
+        :param latitudes: latitude or array of latitudes
+        :return: grid row or array of grid rows
+        """
+        return np.clip(np.floor((np.nan_to_num(latitudes) + 90) / self.cell_size), 0, self.grid_rows - 1) \
+            .astype(np.int64)
+
+    def __grid_column(self, longitudes):
+        """
+        Returns grid columns of longitudes, positions outside valid range are put into the edge columns
+        :param longitudes: longitude or array of longitudes
+        :return: grid column or array of grid columns
+        """
+        return np.clip(np.floor((np.nan_to_num(longitudes) + 180) / self.cell_size), 0, self.grid_columns - 1) \
+            .astype(np.int64)
+
+    def __cells(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Returns grid cells of positions
+        :param latitudes: array of latitudes
+        :param longitudes: array of longitudes
+        :return: array of cell numbers
+        """
+        return self.__grid_row(latitudes) * self.grid_columns + self.__grid_column(longitudes)
+
+    def query(self, lon_ranges: list[tuple[float, float]], lat_range: tuple[float, float]) -> np.ndarray:
+        """
+        Finds rows with positions inside an area
+        :param lon_ranges: list of (min, max) longitude ranges, e.g. from ShipRadarFilter.box
+        :param lat_range: (min, max) latitude range
+        :return: sorted array of row ids
+        """
+        lat_min, lat_max = lat_range
+        first_row, last_row = self.__grid_row(lat_min), self.__grid_row(lat_max)
+        candidates = []
+        for lon_min, lon_max in lon_ranges:
+            first_column, last_column = self.__grid_column(lon_min), self.__grid_column(lon_max)
+            for grid_row in range(first_row, last_row + 1):
+                # Cells of a grid row between the two columns are numbered consecutively
+                start = self.offsets[grid_row * self.grid_columns + first_column]
+                end = self.offsets[grid_row * self.grid_columns + last_column + 1]
+                candidates.append(self.order[start:end])
+        ids = np.unique(np.concatenate(candidates)) if candidates else np.empty(0, dtype=np.int64)
+
+        # Cells on the edges of the area are only partially inside, so candidates are checked exactly
+        latitudes, longitudes = self.latitudes[ids], self.longitudes[ids]
+        inside = np.zeros(len(ids), dtype=bool)
+        for lon_min, lon_max in lon_ranges:
+            inside |= (lon_min <= longitudes) & (longitudes <= lon_max)
+        inside &= (lat_min <= latitudes) & (latitudes <= lat_max)
+        return ids[inside]
+
+
+class ShipRadarSortedIndex:
+    """
+    Row ids sorted by the values of a column, a range of values is then a slice found by two binary searches.
+    """
+    def __init__(self, values: np.ndarray):
+        # Stable sort keeps row ids of equal values in file order
+        self.order: np.ndarray = np.argsort(values, kind='stable')
+        self.values: np.ndarray = values[self.order]
+
+    @property
+    def rows(self) -> int:
+        """
+        Number of indexed rows
+        :return: number of rows
+        """
+        return len(self.order)
+
+    def extend(self, values: np.ndarray) -> None:
+        """
+        Adds rows appended after the indexed ones, merging them into the sorted order without sorting it again
+        :param values: values of appended rows, in row order
+        :return: None
+        """
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        # Appended rows come after all indexed rows, so they go after equal values
+        positions = np.searchsorted(self.values, values, side='right')
+        self.order = np.insert(self.order, positions, order + self.rows)
+        self.values = np.insert(self.values, positions, values)
+
+    def bounds(self, low, high) -> tuple[int, int]:
+        """
+        Finds the slice of rows with values within a range
+        :param low: lowest value, inclusive, None for no lower bound
+        :param high: highest value, inclusive, None for no upper bound
+        :return: start and end of the slice of ShipRadarSortedIndex.order
+        """
+        start = 0 if low is None else int(np.searchsorted(self.values, low, side='left'))
+        end = len(self.values) if high is None else int(np.searchsorted(self.values, high, side='right'))
+        return start, max(start, end)
+
+    def range(self, low, high) -> np.ndarray:
+        """
+        Finds rows with values within a range
+        :param low: lowest value, inclusive, None for no lower bound
+        :param high: highest value, inclusive, None for no upper bound
+        :return: sorted array of row ids
+        """
+        start, end = self.bounds(low, high)
+        return np.sort(self.order[start:end])
+
+
+class ShipRadarInvertedIndex:
+    """
+    Posting list of row ids for every distinct value of a dictionary-encoded column.
+    """
+    def __init__(self, codes: np.ndarray, values: np.ndarray):
+        # Stable sort keeps every posting list sorted by row id
+        self.order: np.ndarray = np.argsort(codes, kind='stable')
+        self.offsets: np.ndarray = np.searchsorted(codes[self.order], np.arange(len(values) + 1))
+        self.codes: dict = {value: code for code, value in enumerate(values.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def rows(self) -> int:
+        """
+        Number of indexed rows
+        :return: number of rows
+        """
+        return len(self.order)
+
+    def extend(self, codes: np.ndarray, values: np.ndarray) -> None:
+        """
+        Adds rows appended after the indexed ones to the ends of their posting lists
+        :param codes: codes of appended rows, positions in values
+        :param values: values the codes refer to, values not seen before get new posting lists
+        :return: None
+        """
+        mapping = np.array([self.codes.setdefault(value, len(self.codes)) for value in values.tolist()],
+                           dtype=np.int64)
+        codes = mapping[codes]
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        offsets = np.concatenate((self.offsets, np.full(len(self.codes) + 1 - len(self.offsets), self.offsets[-1])))
+        # Appended rows come after all indexed rows, so they go at the end of their posting lists
+        self.order = np.insert(self.order, offsets[codes + 1], order + self.rows)
+        self.offsets = offsets + np.searchsorted(codes, np.arange(len(offsets)), side='left')
+
+    def postings(self, value) -> np.ndarray:
+        """
+        Finds rows with a value
+        :param value: value to look up
+        :return: sorted array of row ids, empty if the value doesn't appear in the column
+        """
+        code = self.codes.get(value)
+        if code is None:
+            return self.order[:0]
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
@@ -0,0 +1,310 @@
+"""
+This module contains the query planner of ShipRadarDataset, ordering filters by their estimated selectivity.
+"""
+
+import time
+from datetime import datetime
+import numpy as np
+from beartype.typing import Union
+from src import logger
+from src.reader import ShipRadarFilter, intersect_row_ids
+
+
+class ShipRadarColumnStatistics:
+    """
+    Statistics of a numeric or date column: row count, number of distinct values, minimum, maximum and histogram.
+    Dates are kept as int64 milliseconds since the epoch, like in sorted indexes.
+    """
+    BINS: int = 64
+
+    def __init__(self, values: np.ndarray):
+        self.__reset(values)
+
+    def __reset(self, values: np.ndarray) -> None:
+        """
+        Computes the statistics from all values of the column
+        :param values: array of numbers or dates
+        :return: None
+        """
+        values = self.__prepare(values)
+        self.rows: int = len(values)
+        self.distinct: int = len(np.unique(values))
+        self.min = values.min() if self.rows else None
+        self.max = values.max() if self.rows else None
+        counts, self.edges = np.histogram(values, bins=max(1, min(self.BINS, self.distinct)))
+        # Rows with values up to each bin edge
+        self.cumulative: np.ndarray = np.concatenate(([0], np.cumsum(counts)))
+
+    @staticmethod
+    def __prepare(values: np.ndarray) -> np.ndarray:
+        """
+        Converts values of a column to the representation used by the statistics, without missing values
+        :param values: array of numbers or dates
+        :return: array of numbers
+        """
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[ms]').view(np.int64)
+        return values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Adds values of appended rows, without going over the values of the other rows again.
+        Bins keep their edges, except for the outer ones, which are moved to new extremes.
+        Values inside the previous range are assumed to be among the known distinct values.
+        :param values: array of numbers or dates
+        :return: None
+        """
+        if not self.rows:
+            self.__reset(values)
+            return
+        values = self.__prepare(values)
+        if not values.size:
+            return
+        outside = values[(values < self.min) | (values > self.max)]
+        self.distinct += len(np.unique(outside))
+        self.rows += len(values)
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+        self.edges = self.edges.astype(np.float64)
+        self.edges[0], self.edges[-1] = min(self.edges[0], self.min), max(self.edges[-1], self.max)
+        counts, _ = np.histogram(values, bins=self.edges)
+        self.cumulative = self.cumulative + np.concatenate(([0], np.cumsum(counts)))
+
+    @staticmethod
+    def __value(value):
+        """
+        Converts a filter value to the representation used by the statistics
+        :param value: number or datetime object
+        :return: number
+        """
+        if isinstance(value, datetime):
+            return np.datetime64(value, 'ms').astype(np.int64)
+        return value
+
+    def estimate_equal(self, value) -> float:
+        """
+        Estimates the number of rows with a value, assuming distinct values are equally frequent
+        :param value: number or datetime object
+        :return: estimated number of rows
+        """
+        value = self.__value(value)
+        if not self.rows or not self.min <= value <= self.max:
+            return 0.0
+        return self.rows / self.distinct
+
+    def estimate_range(self, low, high) -> float:
+        """
+        Estimates the number of rows with values within a range, interpolating inside histogram bins
+        :param low: lowest value, inclusive, None for no lower bound
+        :param high: highest value, inclusive, None for no upper bound
+        :return: estimated number of rows
+        """
+        if low is not None and high is not None and low == high:
+            return self.estimate_equal(low)
+        low = self.edges[0] if low is None else self.__value(low)
+        high = self.edges[-1] if high is None else self.__value(high)
+        if not self.rows or low > high:
+            return 0.0
+        return float(np.interp(high, self.edges, self.cumulative) - np.interp(low, self.edges, self.cumulative))
+
+
+class ShipRadarValueStatistics:
+    """
+    Statistics of a column compared only for equality, e.g. a categorical column: number of rows of every value.
+    """
+    def __init__(self, values: np.ndarray, counts: np.ndarray):
+        self.frequencies: dict = {}
+        self.rows: int = 0
+        self.distinct: int = 0
+        self.update(values, counts)
+
+    def update(self, values: np.ndarray, counts: np.ndarray) -> None:
+        """
+        Adds numbers of appended rows of values
+        :param values: array of values
+        :param counts: array of numbers of rows of every value
+        :return: None
+        """
+        for value, count in zip(values.tolist(), counts.tolist()):
+            if count:
+                self.distinct += value not in self.frequencies
+                self.frequencies[value] = self.frequencies.get(value, 0) + count
+        self.rows += int(counts.sum())
+
+    def estimate_equal(self, value) -> float:
+        """
+        Returns the number of rows with a value
+        :param value: value of the column
+        :return: number of rows
+        """
+        return float(self.frequencies.get(value, 0))
+
+
+class ShipRadarPlanStep:
+    """
+    Single filter of a plan, with the way it is evaluated and, once executed, its actual row count and time.
+    """
+    def __init__(self, filter_obj: ShipRadarFilter, access: str, estimated: float):
+        self.filter: ShipRadarFilter = filter_obj
+        # 'grid' or 'index' for a lookup in an index, 'scan' for evaluating the filter for every remaining row
+        self.access: str = access
+        self.estimated: float = estimated
+        # Rows left after the step, None if the step was skipped because no rows were left
+        self.actual: Union[None, int] = None
+        self.seconds: float = 0.0
+
+    def __str__(self) -> str:
+        actual = "skipped" if self.actual is None else f"actual {self.actual}"
+        value = self.filter.filter
+        value = ", ".join(map(str, value)) if isinstance(value, tuple) else value
+        return f"{self.filter.type}: {value} [{self.access}] estimated {self.estimated:.0f}, " \
+               f"{actual}, {self.seconds * 1000:.3f} ms"
+
+
+class ShipRadarPlan:
+    """
+    Executed plan of a query, as returned by ShipRadarPlanner.run, printing it shows why a query is slow.
+    """
+    def __init__(self, steps: list[ShipRadarPlanStep], ids: np.ndarray, candidates: Union[None, int] = None):
+        self.steps: list[ShipRadarPlanStep] = steps
+        # Sorted row ids satisfying all filters
+        self.ids: np.ndarray = ids
+        # Number of rows of a previous result the query was refined from, None if it started from all rows
+        self.candidates: Union[None, int] = candidates
+
+    @property
+    def seconds(self) -> float:
+        """
+        Total time of all steps
+        :return: time in seconds
+        """
+        return sum(step.seconds for step in self.steps)
+
+    def __str__(self) -> str:
+        lines = [] if self.candidates is None else [f"0. refining previous result of {self.candidates} rows"]
+        lines += [f"{number}. {step}" for number, step in enumerate(self.steps, 1)]
+        lines.append(f"Result: {len(self.ids)} rows in {self.seconds * 1000:.3f} ms")
+        return "\n".join(lines)
+
+
+class ShipRadarSelection:
+    """
+    Result of a query, kept so that a following, stricter query only has to check its rows.
+    """
+    def __init__(self, fingerprint: Union[None, str], filters: list[ShipRadarFilter], ids: np.ndarray):
+        # Fingerprint of the file the query was run on, see cache.file_fingerprint
+        self.fingerprint: Union[None, str] = fingerprint
+        self.filters: list[ShipRadarFilter] = filters
+        # Sorted row ids satisfying all filters
+        self.ids: np.ndarray = ids
+
+    def refinement(self, filters: list[ShipRadarFilter]) -> Union[None, list[ShipRadarFilter]]:
+        """
+        Checks if a query only adds or tightens filters of this one, so its result is a subset of this result
+        :param filters: list of ShipRadarFilter objects of the new query
+        :return: filters that still have to be evaluated on this result, None if some filter was loosened or removed
+        """
+        if not all(any(new.narrows(old) for new in filters) for old in self.filters):
+            return None
+        # Filters equal to one of this query are already satisfied by all rows of this result
+        return [new for new in filters if new not in self.filters]
+
+
+class ShipRadarPlanner:
+    """
+    Orders filters of a query from the most selective, estimated from column statistics of the dataset.
+    The most selective filter is looked up in its index, the following ones are either looked up and intersected,
+    or evaluated only for the remaining rows, whichever touches fewer rows. Once no rows are left, the rest is skipped.
+    """
+    # Columns of filter types, filters of types without a column are estimated separately
+    COLUMNS: dict[str, str] = {
+        'ship_no': "LRIMOShipNo",
+        'ship_name': "ShipName",
+        'ship_type': "ShipType",
+        'move_status': "MoveStatus",
+        'destination': "Destination",
+        'heading': "Heading",
+        'draught': "Draught",
+        'speed': "Speed",
+        'eta': "ETA",
+        'date': "MovementDateTime"
+    }
+
+    def __init__(self, dataset):
+        """
+        :param dataset: ShipRadarDataset object
+        """
+        self.logger = logger.ShipRadarLogger("PlannerLogger")
+        self.dataset = dataset
+
+    def estimate(self, filter_obj: ShipRadarFilter) -> float:
+        """
+        Estimates the number of rows satisfying a filter
+        :param filter_obj: ShipRadarFilter object
+        :return: estimated number of rows
+        """
+        statistics = self.dataset.statistics
+        match filter_obj.type:
+            case 'ship_no' | 'ship_name' | 'ship_type' | 'move_status' | 'destination' | 'eta':
+                return statistics[self.COLUMNS[filter_obj.type]].estimate_equal(filter_obj.filter)
+            case 'heading' | 'draught' | 'speed':
+                column = statistics[self.COLUMNS[filter_obj.type]]
+                return sum(column.estimate_range(low, high) for low, high in filter_obj.ranges())
+            case 'date':
+                return statistics["MovementDateTime"].estimate_range(*filter_obj.filter)
+            case 'coords':
+                # Latitude and longitude are assumed to be independent
+                lon_ranges, lat_range = filter_obj.box()
+                rows = max(1, len(self.dataset))
+                latitude = statistics["Latitude"].estimate_range(*lat_range) / rows
+                longitude = sum(statistics["Longitude"].estimate_range(low, high) for low, high in lon_ranges) / rows
+                return rows * latitude * longitude
+            case _:
+                return float(len(self.dataset))
+
+    def plan(self, filters: list[ShipRadarFilter],
+             candidates: Union[None, np.ndarray] = None) -> list[ShipRadarPlanStep]:
+        """
+        Orders filters by estimated selectivity and chooses how each of them is evaluated
+        :param filters: list of ShipRadarFilter objects
+        :param candidates: sorted row ids the query is restricted to, None for all rows
+        :return: list of steps, not executed yet
+        """
+        estimates = sorted(((self.estimate(filter_obj), filter_obj) for filter_obj in filters), key=lambda x: x[0])
+        steps: list[ShipRadarPlanStep] = []
+        remaining: float = len(self.dataset) if candidates is None else len(candidates)
+        for estimated, filter_obj in estimates:
+            if (steps or candidates is not None) and remaining <= estimated:
+                # Evaluating the filter for the remaining rows is cheaper than reading its larger index lookup
+                access = 'scan'
+            else:
+                access = 'grid' if filter_obj.type == 'coords' else 'index'
+            steps.append(ShipRadarPlanStep(filter_obj, access, estimated))
+            remaining = min(remaining, estimated)
+        return steps
+
+    def run(self, filters: list[ShipRadarFilter], candidates: Union[None, np.ndarray] = None) -> ShipRadarPlan:
+        """
+        Plans and executes a query
+        :param filters: list of ShipRadarFilter objects
+        :param candidates: sorted row ids the query is restricted to, e.g. matches of a broader previous query,
+                           None for all rows
+        :return: ShipRadarPlan object with row ids satisfying all filters
+        """
+        steps = self.plan(filters, candidates)
+        ids: Union[None, np.ndarray] = candidates
+        for step in steps:
+            if ids is not None and not ids.size:
+                break
+            start = time.perf_counter()
+            if step.access == 'scan':
+                ids = np.flatnonzero(self.dataset.mask(step.filter)) if ids is None \
+                    else ids[self.dataset.mask(step.filter, ids)]
+            else:
+                found = self.dataset.lookup(step.filter)
+                ids = found if ids is None else intersect_row_ids([ids, found])
+            step.seconds = time.perf_counter() - start
+            step.actual = len(ids)
+        plan = ShipRadarPlan(steps, np.empty(0, dtype=np.int64) if ids is None else ids,
+                             None if candidates is None else len(candidates))
+        self.logger.debug(f"Query plan:\n{plan}")
+        return plan
@@ -3,10 +3,94 @@ This module contains classes for reading CSV files and filtering them.
 """
 
 import csv
+import io
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from beartype.typing import Union
+from itertools import repeat
+import numpy as np
+from beartype.typing import Union, Iterable, Iterator
 from src import err
 from src import logger
+from src.record import ShipRadarRecord
+
+HEADER: tuple[str, ...] = ("LRIMOShipNo", "ShipName", "ShipType", "MovementDateTime", "Latitude", "Longitude",
+                           "MoveStatus", "Heading", "Draught", "Speed", "Destination", "ETA")
+
+
+class ShipRadarRow(dict):
+    """
+    Row of a CSV file, as returned by csv.DictReader, which also remembers its position in the file.
+    Compares equal to a plain dict with the same contents.
+    """
+    __slots__ = ('row_id',)
+
+    def __init__(self, row: dict[str, str], row_id: int):
+        super().__init__(row)
+        # Index of the data row in the file, header excluded
+        self.row_id: int = row_id
+
+
+def take_rows(rows: Iterable[ShipRadarRow], ids: Iterable[int]) -> Iterator[ShipRadarRow]:
+    """
+    Picks rows with given row ids, stops reading rows as soon as the last one is found
+    :param rows: rows sorted by row id
+    :param ids: sorted row ids
+    :return: generator of rows with given row ids
+    """
+    wanted = iter(ids)
+    next_id = next(wanted, None)
+    for row in rows:
+        # Skip ids of rows that are not among rows
+        while next_id is not None and next_id < row.row_id:
+            next_id = next(wanted, None)
+        if next_id is None:
+            return
+        if row.row_id == next_id:
+            yield row
+
+
+def intersect_row_ids(id_arrays: list[np.ndarray]) -> np.ndarray:
+    """
+    Returns a logical AND of sorted row id arrays
+    :param id_arrays: list of sorted arrays of unique row ids
+    :return: sorted array of row ids present in every array
+    """
+    if not id_arrays:
+        return np.empty(0, dtype=np.int64)
+    # Start from the smallest array, so the work scales with the number of matches
+    id_arrays = sorted(id_arrays, key=len)
+    result = id_arrays[0]
+    for ids in id_arrays[1:]:
+        if not result.size or not ids.size:
+            return result[:0]
+        positions = np.searchsorted(ids, result).clip(max=len(ids) - 1)
+        result = result[ids[positions] == result]
+    return result
+
+
+def _scan_range(file: str, start: int, end: int, fieldnames: list[str],
+                filters: list['ShipRadarFilter']) -> tuple[int, list[tuple[int, dict[str, str]]]]:
+    """
+    Parses and filters a part of a CSV file, run in worker processes by ShipRadarCSVReader
+    :param file: Path to the CSV file
+    :param start: offset of the first byte of the part, at the start of a line
+    :param end: offset after the last byte of the part, at the start of a line or at the end of the file
+    :param fieldnames: header of the CSV file
+    :param filters: list of ShipRadarFilter objects
+    :return: number of rows in the part and list of rows satisfying all filters, with their index within the part
+    """
+    with open(file, 'rb') as binfile, mmap.mmap(binfile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        text = mapped[start:end].decode('utf-8')
+    count = 0
+    matches = []
+    for ind, row in enumerate(csv.DictReader(io.StringIO(text), fieldnames=fieldnames, delimiter=';')):
+        count = ind + 1
+        if all(filter_obj.match(row) for filter_obj in filters):
+            matches.append((ind, row))
+    return count, matches
 
 
 class ShipRadarFilter:
@@ -15,12 +99,16 @@ class ShipRadarFilter:
     """
     type = None
     filter = None
+    # Only for coords filters, box spans eastwards from longitude1 to longitude2, across the antimeridian if needed
+    antimeridian = False
 
     def __init__(self, type: str, *args):
         self.logger = logger.ShipRadarLogger("ShipRadarFilterLogger")
         self.filter: Union[None, int, float, datetime, tuple] = None
         self.type: str = type
         self.additional_info: tuple = args
+        # Only for heading, draught and speed filters, see ShipRadarFilter.ranges
+        self.__ranges: list[tuple] = []
         self.__parse_type()
 
     def __parse_type(self) -> None:
@@ -39,14 +127,11 @@ class ShipRadarFilter:
                 self.filter: str = self.additional_info[0]
                 self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
             case 'heading':
-                self.filter: int = self.additional_info[0]
-                self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
+                self.__parse_range()
             case 'draught':
-                self.filter: float = self.additional_info[0]
-                self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
+                self.__parse_range()
             case 'speed':
-                self.filter: float = self.additional_info[0]
-                self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
+                self.__parse_range()
             case 'destination':
                 self.filter: str = self.additional_info[0]
                 self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
@@ -66,22 +151,236 @@ class ShipRadarFilter:
                     self.logger.debug(f"Date filter exception: {exc}\nFilterError raised.")
                     raise err.ShipRadarFilterError('Wrong time format')
             case 'coords':
-                # longitude1, latitude1, logitude2, latitude2
+                # longitude1, latitude1, logitude2, latitude2, optionally antimeridian flag
                 self.filter: tuple[float, float, float, float] = self.additional_info[0], \
                     self.additional_info[1], self.additional_info[2], self.additional_info[3]
-                self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
+                self.antimeridian: bool = len(self.additional_info) > 4 and bool(self.additional_info[4])
+                self.__box = self.__parse_box()
+                self.logger.debug(f"Filter set for {self.type} with filter {self.filter}, "
+                                  f"antimeridian {self.antimeridian}")
             case _:
                 self.logger.debug("Filter type does not exist.\nFilterError raised.")
                 raise err.ShipRadarFilterError('Filter type does not exist')
 
+    def __parse_range(self) -> None:
+        """
+        Sets a numeric filter, either a single value or a (min, max) range with None for an unbounded side.
+        Heading ranges with min greater than max wrap around north, e.g. (350, 10), and are clamped to 0..359,
+        so heading 511 (not available) matches no heading filter.
+        :return: None
+        """
+        if len(self.additional_info) == 1:
+            self.filter: Union[int, float] = self.additional_info[0]
+            self.__ranges = [(self.filter, self.filter)]
+        else:
+            low, high = self.additional_info[0], self.additional_info[1]
+            if low is None and high is None:
+                self.logger.debug("Range filter without bounds.\nFilterError raised.")
+                raise err.ShipRadarFilterError('No bounds given')
+            self.filter: tuple = low, high
+            if self.type == 'heading' and low is not None and high is not None and low > high:
+                self.__ranges = [(low, 359), (0, high)]
+            else:
+                self.__ranges = [(low, high)]
+        if self.type == 'heading':
+            self.__ranges = [(max(0 if low is None else low, 0), min(359 if high is None else high, 359))
+                             for low, high in self.__ranges]
+        self.logger.debug(f"Filter set for {self.type} with filter {self.filter}")
+
+    def ranges(self) -> list[tuple]:
+        """
+        Returns values accepted by a heading, draught or speed filter
+        :return: list of (min, max) ranges, inclusive, None for an unbounded side
+        """
+        return self.__ranges
+
+    def __in_ranges(self, value: Union[int, float]) -> bool:
+        """
+        Checks if a value is inside the ranges of a numeric filter
+        :param value: heading, draught or speed
+        :return: True if value is inside, False otherwise
+        """
+        return any((low is None or low <= value) and (high is None or value <= high) for low, high in self.__ranges)
+
+    def __parse_box(self) -> tuple[list[tuple[float, float]], tuple[float, float]]:
+        """
+        Converts coords filter to ranges of longitudes and a range of latitudes
+        :return: list of (min, max) longitude ranges, (min, max) latitude range
+        """
+        lon1, lat1, lon2, lat2 = self.filter
+        lat_range = (min(lat1, lat2), max(lat1, lat2))
+        if not self.antimeridian:
+            # Corners can be given in any order
+            return [(min(lon1, lon2), max(lon1, lon2))], lat_range
+        if lon1 <= lon2:
+            return [(lon1, lon2)], lat_range
+        # Box crosses the antimeridian, so it's split into a part east and a part west of it
+        return [(lon1, 180.0), (-180.0, lon2)], lat_range
+
+    def box(self) -> tuple[list[tuple[float, float]], tuple[float, float]]:
+        """
+        Returns area of a coords filter
+        :return: list of (min, max) longitude ranges, (min, max) latitude range
+        """
+        return self.__box
+
+    def __in_box(self, x: float, y: float) -> bool:
+        """
+        Checks if a position is inside the area of a coords filter
+        :param x: longitude
+        :param y: latitude
+        :return: True if position is inside, False otherwise
+        """
+        lon_ranges, (lat_min, lat_max) = self.__box
+        return lat_min <= y <= lat_max and any(lon_min <= x <= lon_max for lon_min, lon_max in lon_ranges)
+
+    @staticmethod
+    def __contains(outer: tuple, inner: tuple) -> bool:
+        """
+        Checks if a range contains another one
+        :param outer: (min, max) range, None for an unbounded side
+        :param inner: (min, max) range, None for an unbounded side
+        :return: True if every value of inner is in outer, False otherwise
+        """
+        (outer_low, outer_high), (inner_low, inner_high) = outer, inner
+        return (outer_low is None or (inner_low is not None and outer_low <= inner_low)) and \
+            (outer_high is None or (inner_high is not None and inner_high <= outer_high))
+
+    def narrows(self, other: 'ShipRadarFilter') -> bool:
+        """
+        Checks if the filter is at least as strict as another one, e.g. a smaller date range or a smaller box.
+        Rows satisfying this filter then all satisfy the other one, so it can be evaluated only on their matches.
+        :param other: ShipRadarFilter object
+        :return: True if every row satisfying this filter satisfies other, False if it might not
+        """
+        if self == other:
+            return True
+        if self.type != other.type:
+            return False
+        match self.type:
+            case 'date':
+                return self.__contains(other.filter, self.filter)
+            case 'heading' | 'draught' | 'speed':
+                return all(any(self.__contains(outer, inner) for outer in other.ranges()) for inner in self.ranges())
+            case 'coords':
+                (lon_ranges, lat_range), (other_lon_ranges, other_lat_range) = self.box(), other.box()
+                return self.__contains(other_lat_range, lat_range) and \
+                    all(any(self.__contains(outer, inner) for outer in other_lon_ranges) for inner in lon_ranges)
+            case _:
+                # Other filters match a single value, so only an equal filter is as strict
+                return False
+
+    def _key(self) -> tuple:
+        """
+        Returns what the filter is compared and hashed by
+        :return: tuple of type, filter value and antimeridian flag
+        """
+        return self.type, self.filter, self.antimeridian
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ShipRadarFilter):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return f"ShipRadarFilter({self.type!r}, {', '.join(map(repr, self.additional_info))})"
+
+    def __reduce__(self):
+        # Logger can't be sent to worker processes, so the filter is rebuilt from its arguments there
+        return self.__class__, (self.type, *self.additional_info)
+
+    def match(self, row: dict[str, str]) -> bool:
+        """
+        Checks if a CSV row satisfies the filter
+        :param row: row of the CSV file, as returned by csv.DictReader
+        :return: True if row satisfies the filter, False otherwise
+        """
+        match self.type:
+            case 'ship_no':
+                return int(row["LRIMOShipNo"]) == self.filter
+            case 'ship_type':
+                return row["ShipType"] == self.filter
+            case 'move_status':
+                return row["MoveStatus"] == self.filter
+            case 'heading':
+                return self.__in_ranges(int(row["Heading"]))
+            case 'draught':
+                # Ensure that the decimal separator is a dot
+                return self.__in_ranges(float(row["Draught"].replace(",", ".")))
+            case 'speed':
+                # Ensure that the decimal separator is a dot
+                return self.__in_ranges(float(row["Speed"].replace(",", ".")))
+            case 'destination':
+                return row["Destination"] == self.filter
+            case 'eta':
+                return datetime.fromisoformat(row["ETA"]) == self.filter
+            case 'ship_name':
+                return row["ShipName"] == self.filter
+            case 'date':
+                # Filter is a tuple of 2 datetime objects, from and till
+                return self.filter[0] <= datetime.fromisoformat(row["MovementDateTime"]) <= self.filter[1]
+            case 'coords':
+                # Filter is a tuple of 4 floats, longitude1, latitude1, longitude2, latitude2
+                return self.__in_box(float(row["Longitude"]), float(row["Latitude"]))
+            case _:
+                self.logger.debug("Unknown error occurred")
+                raise err.ShipRadarBaseException('Unknown error')
+
+    def match_record(self, record: ShipRadarRecord) -> bool:
+        """
+        Checks if a record satisfies the filter, fields of records are already typed, so nothing is converted
+        :param record: ShipRadarRecord object
+        :return: True if record satisfies the filter, False otherwise
+        """
+        match self.type:
+            case 'ship_no':
+                return record.ship_no == self.filter
+            case 'ship_type':
+                return record.ship_type == self.filter
+            case 'move_status':
+                return record.move_status == self.filter
+            case 'heading':
+                return self.__in_ranges(record.heading)
+            case 'draught':
+                return self.__in_ranges(record.draught)
+            case 'speed':
+                return self.__in_ranges(record.speed)
+            case 'destination':
+                return record.destination == self.filter
+            case 'eta':
+                return record.eta == self.filter
+            case 'ship_name':
+                return record.ship_name == self.filter
+            case 'date':
+                return self.filter[0] <= record.movement_date <= self.filter[1]
+            case 'coords':
+                return self.__in_box(record.longitude, record.latitude)
+            case _:
+                self.logger.debug("Unknown error occurred")
+                raise err.ShipRadarBaseException('Unknown error')
+
 
 class ShipRadarCSVReader:
     """
     Class for reading CSV files.
+    Files bigger than PARALLEL_THRESHOLD are scanned by a pool of worker processes, if more than one is allowed.
     """
-    def __init__(self, file: str):
+    # Smaller files are scanned serially, starting worker processes would take longer than the scan itself
+    PARALLEL_THRESHOLD: int = 64 << 20
+
+    def __init__(self, file: str, workers: int = 1):
         self.logger = logger.ShipRadarLogger("CSVReaderLogger")
         self.file: str = file
+        self.workers: int = workers
+        # Follow mode, see ShipRadarCSVReader.follow
+        self.fieldnames: Union[None, list[str]] = None
+        self.offset: int = 0
+        # Rows read by ShipRadarCSVReader.read_appended since the file is followed
+        self.appended: int = 0
+        self.__identity: Union[None, tuple[int, int]] = None
 
     def parse(self, filter_obj: ShipRadarFilter) -> list[dict[str, str]]:
         """
@@ -89,167 +388,361 @@ class ShipRadarCSVReader:
         :param filter_obj: ShipRadarFilter object
         :return: collector: list of dicts satisfying filter
         """
+        return list(self.iter_parse(filter_obj))
+
+    def parse_many(self, filters: list[ShipRadarFilter]) -> list[dict[str, str]]:
+        """
+        Parses CSV file with all given filters at once, in a single pass over the file.
+        A row is collected only if it satisfies every filter (logical AND).
+        :param filters: list of ShipRadarFilter objects
+        :return: collector: list of dicts satisfying all filters
+        """
+        return list(self.iter_parse_many(filters))
+
+    def iter_parse(self, filter_obj: ShipRadarFilter,
+                   chunk_size: Union[None, int] = None) -> Iterator[Union[ShipRadarRow, list[ShipRadarRow]]]:
+        """
+        Parses CSV file with given filter lazily, only the current row or chunk is held in memory
+        :param filter_obj: ShipRadarFilter object
+        :param chunk_size: if given, rows are yielded in lists of at most chunk_size rows
+        :return: generator of rows, or lists of rows, satisfying filter
+        """
         self.logger.debug(f"Parsing CSV file with filter {filter_obj} started")
-        collector = []
-        if (filter_obj.type is None) or (filter_obj.filter is None):
-            # Check if Filter's fields are filled
-            self.logger.debug("Filter has not been initialized.\nFilterError raised.")
-            raise err.ShipRadarFilterError('Filter not initialized')
+        yield from self.__chunked(
+            self.__iter_rows([filter_obj]), chunk_size,
+            err.ShipRadarFilterError(f'No entries for this filter: {filter_obj.type}: {filter_obj.filter}')
+        )
+
+    def iter_parse_many(self, filters: list[ShipRadarFilter],
+                        chunk_size: Union[None, int] = None) -> Iterator[Union[ShipRadarRow, list[ShipRadarRow]]]:
+        """
+        Parses CSV file with all given filters lazily, in a single pass over the file
+        :param filters: list of ShipRadarFilter objects
+        :param chunk_size: if given, rows are yielded in lists of at most chunk_size rows
+        :return: generator of rows, or lists of rows, satisfying all filters
+        """
+        self.logger.debug(f"Parsing CSV file with filters {filters} started")
+        if not filters:
+            self.logger.debug("No filters given.\nFilterError raised.")
+            raise err.ShipRadarFilterError('No filters given')
+        yield from self.__chunked(
+            self.__iter_rows(filters), chunk_size,
+            err.ShipRadarFilterError('No entries for these filters: ' +
+                                     ', '.join(f'{f.type}: {f.filter}' for f in filters))
+        )
+
+    def __chunked(self, rows: Iterable[ShipRadarRow], chunk_size: Union[None, int],
+                  empty_error: err.ShipRadarFilterError) -> Iterator[Union[ShipRadarRow, list[ShipRadarRow]]]:
+        """
+        Passes rows through, optionally grouped in chunks, and raises an error at the end if there were none
+        :param rows: iterable of rows
+        :param chunk_size: if given, rows are yielded in lists of at most chunk_size rows
+        :param empty_error: error raised when there are no rows
+        :return: generator of rows, or lists of rows
+        """
+        found = False
+        chunk = []
+        for row in rows:
+            found = True
+            if chunk_size is None:
+                yield row
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        if not found:
+            self.logger.debug(f"No ships for given filters: {empty_error}")
+            raise empty_error
+
+    def iter_records(self, filters: list[ShipRadarFilter],
+                     chunk_size: Union[None, int] = None) -> Iterator[Union[ShipRadarRecord, list[ShipRadarRecord]]]:
+        """
+        Parses CSV file into compact typed records lazily, every field is converted once, when the row is read
+        :param filters: list of ShipRadarFilter objects, no filters yield every record
+        :param chunk_size: if given, records are yielded in lists of at most chunk_size records
+        :return: generator of records, or lists of records, satisfying all filters
+        """
+        self.logger.debug(f"Parsing CSV file into records with filters {filters} started")
+        yield from self.__chunked(
+            self.__iter_records(filters), chunk_size,
+            err.ShipRadarFilterError('No entries for these filters: ' +
+                                     ', '.join(f'{f.type}: {f.filter}' for f in filters))
+        )
+
+    def __iter_records(self, filters: list[ShipRadarFilter]) -> Iterator[ShipRadarRecord]:
+        """
+        Reads the CSV file once and yields records satisfying all given filters
+        :param filters: list of ShipRadarFilter objects, no filters yield every record
+        :return: generator of records satisfying all filters
+        """
+        for filter_obj in filters:
+            if (filter_obj.type is None) or (filter_obj.filter is None):
+                self.logger.debug("Filter has not been initialized.\nFilterError raised.")
+                raise err.ShipRadarFilterError('Filter not initialized')
+        try:
+            with open(self.file, 'r', encoding='utf-8') as csvfile:
+                csvreader = csv.reader(csvfile, delimiter=';')
+                header = next(csvreader, [])
+                self.__check_header(header)
+                positions = {column: ind for ind, column in enumerate(header)}
+                row_id = 0
+                for values in csvreader:
+                    if not values:
+                        # Empty lines are skipped, the same as by csv.DictReader
+                        continue
+                    try:
+                        record = ShipRadarRecord.from_values(row_id, values, positions)
+                    except (ValueError, IndexError, KeyError) as exc:
+                        self.logger.debug(f"Row {row_id} can't be parsed.\nImportError raised.")
+                        raise err.ShipRadarImportError(f"Wrong value in row {row_id}: {exc}") from exc
+                    row_id += 1
+                    if all(filter_obj.match_record(record) for filter_obj in filters):
+                        yield record
+
+        except FileNotFoundError as exc:
+            self.logger.debug(f"File {self.file} not found.\nImportError raised.")
+            raise err.ShipRadarImportError(f"No file {self.file}") from exc
+
+    def parse_ids(self, filter_obj: ShipRadarFilter) -> np.ndarray:
+        """
+        Parses CSV file with given filter, keeping only positions of the matching rows
+        :param filter_obj: ShipRadarFilter object
+        :return: sorted array of row ids satisfying filter
+        """
+        self.logger.debug(f"Parsing CSV file for row ids with filter {filter_obj} started")
+        ids = np.fromiter((row.row_id for row in self.__iter_rows([filter_obj])), dtype=np.int64)
+
+        if not ids.size:
+            self.logger.debug(f"No ships for given filter {filter_obj}")
+            raise err.ShipRadarFilterError(f'No entries for this filter: {filter_obj.type}: {filter_obj.filter}')
+
+        return ids
+
+    def read_rows(self, ids: Iterable[int]) -> list[dict[str, str]]:
+        """
+        Reads rows with given row ids from the CSV file
+        :param ids: sorted row ids, e.g. from ShipRadarCSVReader.parse_ids or intersect_row_ids
+        :return: list of rows, in file order
+        """
+        return list(take_rows(self.__iter_rows([]), ids))
+
+    def follow(self, offset: Union[None, int] = None) -> None:
+        """
+        Starts following the CSV file, e.g. one an AIS logger keeps appending to.
+        ShipRadarCSVReader.read_appended returns only rows after offset.
+        :param offset: byte offset to follow the file from, at the start of a line, e.g. ShipRadarDataset.offset of
+                       the rows already read, the end of the file by default
+        :return: None
+        """
+        try:
+            with open(self.file, 'rb') as binfile:
+                stat = os.fstat(binfile.fileno())
+                header = next(csv.reader([binfile.readline().decode('utf-8').rstrip('\r\n')], delimiter=';'), [])
+        except FileNotFoundError as exc:
+            self.logger.debug(f"File {self.file} not found.\nImportError raised.")
+            raise err.ShipRadarImportError(f"No file {self.file}") from exc
+        self.__check_header(header)
+        self.fieldnames = header
+        self.offset = stat.st_size if offset is None else offset
+        self.appended = 0
+        # Device and inode tell if the file was replaced, e.g. by log rotation
+        self.__identity = stat.st_dev, stat.st_ino
+        self.logger.debug(f"Following {self.file} from offset {self.offset}")
+
+    def read_appended(self) -> Union[None, list[ShipRadarRecord]]:
+        """
+        Reads complete lines appended to the followed file since the last call, parsed into typed records.
+        A line still being written, without its newline, is left for the next call, as are all lines if any of them
+        can't be parsed.
+        :return: list of records, row ids count rows appended since ShipRadarCSVReader.follow,
+                 None if the file was truncated or replaced, so it has to be read again from the start
+        """
+        if self.__identity is None:
+            self.logger.debug("File not followed.\nBaseException raised.")
+            raise err.ShipRadarBaseException('File not followed')
+        try:
+            with open(self.file, 'rb') as binfile:
+                stat = os.fstat(binfile.fileno())
+                if (stat.st_dev, stat.st_ino) != self.__identity or stat.st_size < self.offset:
+                    self.logger.debug(f"File {self.file} was truncated or replaced")
+                    return None
+                binfile.seek(self.offset)
+                data = binfile.read(stat.st_size - self.offset)
+        except FileNotFoundError:
+            # Rotated away and not created again yet
+            self.logger.debug(f"File {self.file} was removed")
+            return None
+        complete = data.rfind(b'\n') + 1
+        positions = {column: ind for ind, column in enumerate(self.fieldnames)}
+        records = []
+        for values in csv.reader(io.StringIO(data[:complete].decode('utf-8')), delimiter=';'):
+            if not values:
+                # Empty lines are skipped, the same as by csv.DictReader
+                continue
+            if len(values) != len(self.fieldnames):
+                self.logger.debug(f"Appended row {values} has wrong number of values.\nImportError raised.")
+                raise err.ShipRadarImportError(f"Wrong number of values in appended row: {values}")
+            try:
+                records.append(ShipRadarRecord.from_values(self.appended + len(records), values, positions))
+            except (ValueError, KeyError) as exc:
+                self.logger.debug(f"Appended row {values} can't be parsed.\nImportError raised.")
+                raise err.ShipRadarImportError(f"Wrong value in appended row: {exc}") from exc
+        # Lines are consumed only once all of them are parsed, so a failed call reads them again
+        self.offset += complete
+        self.appended += len(records)
+        self.logger.debug(f"Read {len(records)} appended rows, following {self.file} from offset {self.offset}")
+        return records
+
+    def __iter_rows(self, filters: list[ShipRadarFilter]) -> Iterator[ShipRadarRow]:
+        """
+        Reads the CSV file once and yields rows satisfying all given filters
+        :param filters: list of ShipRadarFilter objects, no filters yield every row
+        :return: generator of rows satisfying all filters
+        """
+        for filter_obj in filters:
+            if (filter_obj.type is None) or (filter_obj.filter is None):
+                # Check if Filter's fields are filled
+                self.logger.debug("Filter has not been initialized.\nFilterError raised.")
+                raise err.ShipRadarFilterError('Filter not initialized')
         try:
+            if self.workers > 1 and os.path.getsize(self.file) >= self.PARALLEL_THRESHOLD:
+                yield from self.__iter_rows_parallel(filters)
+                return
             with open(self.file, 'r', encoding='utf-8') as csvfile:
                 csvreader = csv.DictReader(csvfile, delimiter=';')
                 for ind, row in enumerate(csvreader):
 
                     if ind == 0:  # Second verification of header
-                        # Header validation
-                        self.logger.debug("Header validation started")
-                        for key in row.keys():
-                            if key not in ["LRIMOShipNo", "ShipName", "ShipType", "MovementDateTime",
-                                           "Longitude", "Latitude", "MoveStatus", "Heading", "Draught",
-                                           "Speed", "Destination", "ETA"]:
-                                self.logger.debug("Header validation failed.\nImportError raised.")
-                                raise err.ShipRadarImportError('Wrong header in CSV file')
-                        self.logger.debug("Header validation passed")
-
-                    # Filtering
-                    match filter_obj.type:
-                        case 'ship_no':
-                            if int(row["LRIMOShipNo"]) != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'ship_type':
-                            if row["ShipType"] != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'move_status':
-                            if row["MoveStatus"] != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'heading':
-                            if int(row["Heading"]) != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'draught':
-                            # Ensure that the decimal separator is a dot
-                            if float(row["Draught"].replace(",", ".")) != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'speed':
-                            # Ensure that the decimal separator is a dot
-                            if float(row["Speed"].replace(",", ".")) != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'destination':
-                            if row["Destination"] != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'eta':
-                            if datetime.fromisoformat(row["ETA"]) != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'ship_name':
-                            if row["ShipName"] != filter_obj.filter:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'date':
-                            # Filter is a tuple of 2 datetime objects, from and till
-                            row_date = datetime.fromisoformat(row["MovementDateTime"])
-                            if not filter_obj.filter[0] <= row_date <= filter_obj.filter[1]:
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case 'coords':
-                            # Filter is a tuple of 4 floats, longitude1, latitude1, longitude2, latitude2
-                            x, y = float(row["Longitude"]), float(row["Latitude"])
-                            if not (((filter_obj.filter[0] <= x <= filter_obj.filter[2])
-                                    or (filter_obj.filter[2] <= x <= filter_obj.filter[0]))
-                                    and
-                                    ((filter_obj.filter[1] <= y <= filter_obj.filter[3])
-                                    or (filter_obj.filter[3] <= y <= filter_obj.filter[1]))):
-                                self.logger.verbose(f"Row {row} NOT ADDED")
-                                continue
-                            self.logger.verbose(f"Row {row} ADDED")
-                            collector.append(row)
-
-                        case _:
-                            self.logger.debug("Unknown error occurred")
-                            raise err.ShipRadarBaseException('Unknown error')
+                        self.__check_header(row.keys())
+
+                    # Filtering, stops at the first filter the row does not satisfy
+                    if not all(filter_obj.match(row) for filter_obj in filters):
+                        self.logger.verbose("Row %s NOT ADDED", row)
+                        continue
+                    self.logger.verbose("Row %s ADDED", row)
+                    yield ShipRadarRow(row, ind)
 
         except FileNotFoundError as exc:
             self.logger.debug(f"File {self.file} not found.\nImportError raised.")
             raise err.ShipRadarImportError(f"No file {self.file}") from exc
 
-        if not collector:
-            self.logger.debug(f"Collector {collector} is empty: No ships for given filter {filter_obj}")
-            raise err.ShipRadarFilterError(f'No entries for this filter: {filter_obj.type}: {filter_obj.filter}')
+    def split(self, parts: int, size: Union[None, int] = None) -> tuple[list[str], list[tuple[int, int]]]:
+        """
+        Splits the CSV file into parts at line boundaries, e.g. to be read by worker processes
+        :param parts: number of parts to split the rows into, at most
+        :param size: bytes of the file to split, at the end of a line, e.g. from ShipRadarCSVReader.line_end,
+                     the whole file by default
+        :return: header of the file and list of (start, end) byte offsets of the parts
+        """
+        with open(self.file, 'rb') as binfile:
+            if size is None:
+                size = os.fstat(binfile.fileno()).st_size
+            fieldnames = next(csv.reader([binfile.readline().decode('utf-8').rstrip('\r\n')], delimiter=';'), [])
+            self.__check_header(fieldnames)
+            header_end = binfile.tell()
+            step = max(1, (size - header_end) // max(1, parts))
+            ranges: list[tuple[int, int]] = []
+            start = header_end
+            while start < size:
+                # Part ends after the first line break at least step bytes after its start
+                binfile.seek(start + step)
+                binfile.readline()
+                end = min(binfile.tell(), size)
+                ranges.append((start, end))
+                start = end
+        return fieldnames, ranges
+
+    @staticmethod
+    def line_end(file: str, size: int) -> int:
+        """
+        Finds the end of the last complete line, a line without a newline may still be being written
+        :param file: Path to the CSV file
+        :param size: bytes of the file to search, e.g. its size
+        :return: offset after the last newline within size bytes, 0 if there is none
+        """
+        with open(file, 'rb') as binfile:
+            end = size
+            while end > 0:
+                start = max(0, end - (1 << 16))
+                binfile.seek(start)
+                newline = binfile.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    return start + newline + 1
+                end = start
+        return 0
+
+    def __iter_rows_parallel(self, filters: list[ShipRadarFilter]) -> Iterator[ShipRadarRow]:
+        """
+        Splits the CSV file into parts at line boundaries, filters them in worker processes
+        and yields rows satisfying all given filters, in file order
+        :param filters: list of ShipRadarFilter objects, no filters yield every row
+        :return: generator of rows satisfying all filters
+        """
+        # A few parts per worker, so that workers finishing early get more work
+        fieldnames, ranges = self.split(self.workers * 4)
+        self.logger.debug(f"Scanning {len(ranges)} parts of {self.file} in {self.workers} processes")
+
+        offset = 0
+        # Spawned as in ShipRadarDataset, the reader may run in a thread of the app
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = executor.map(_scan_range, repeat(self.file), [start for start, _ in ranges],
+                                   [end for _, end in ranges], repeat(fieldnames), repeat(filters))
+            for count, matches in results:
+                for ind, row in matches:
+                    yield ShipRadarRow(row, offset + ind)
+                offset += count
 
-        return collector
+    def __check_header(self, keys: Iterable[str]) -> None:
+        """
+        Validates the header of the CSV file
+        :param keys: column names read from the file
+        :return: None
+        """
+        self.logger.debug("Header validation started")
+        keys = list(keys)
+        if not keys:
+            self.logger.debug("Empty header.\nImportError raised.")
+            raise err.ShipRadarImportError('Wrong header in CSV file')
+        for key in keys:
+            if key not in HEADER:
+                self.logger.debug("Header validation failed.\nImportError raised.")
+                raise err.ShipRadarImportError('Wrong header in CSV file')
+        self.logger.debug("Header validation passed")
 
     @staticmethod
-    def and_collectors(collectors: list[list[dict[str, str]]]) -> list[dict[str, str]]:
+    def and_collectors(collectors: list[Iterable[ShipRadarRow]]) -> list[ShipRadarRow]:
         """
         Returns a list of a logical AND of collectors
-        :return: List of ship satisfying all filters from individual collectors
+        :param collectors: list of collectors, returned by ShipRadarCSVReader.parse or ShipRadarCSVReader.iter_parse
+        :return: List of ship satisfying all filters from individual collectors, in file order
         :rtype: list
         """
         if not collectors:
             return []
+        if len(collectors) == 1:
+            return list(collectors[0])
 
-        result = set(tuple(ship.items()) for ship in collectors[0])
-        for collector in collectors[1:]:
-            result = result.intersection(set(tuple(ship.items()) for ship in collector))
-
-        return [dict(items) for items in result]
+        # Only row ids of the other collectors are kept, rows are then picked from the first one
+        ids = intersect_row_ids([np.fromiter((ship.row_id for ship in collector), dtype=np.int64)
+                                 for collector in collectors[1:]])
+        return list(take_rows(collectors[0], ids))
 
     @staticmethod
-    def divide_collectors(collector: list[dict]) -> list[list[dict]]:
+    def divide_collectors(collector: Iterable[dict]) -> list[list[dict]]:
         """
         Divide collector into multiple collectors, by ship name
-        :param collector: collector, returned by reader.ShipRadarCSVReader.and_collector(collectors)
+        :param collector: collector, returned by reader.ShipRadarCSVReader.and_collector(collectors),
+            or a generator of rows, e.g. from reader.ShipRadarCSVReader.iter_parse
         :return: list of collectors, each collector contains only ships with same name
         """
-        divided_collectors = []
+        divided_collectors: dict[str, list[dict]] = {}
         for item in collector:
-            no_value = item["ShipName"]
-            found = False
-            for sublist in divided_collectors:
-                if sublist[0]["ShipName"] == no_value:
-                    sublist.append(item)
-                    found = True
-                    break
-            if not found:
-                divided_collectors.append([item])
-
-        return divided_collectors
+            divided_collectors.setdefault(item["ShipName"], []).append(item)
+
+        return list(divided_collectors.values())
 
     @staticmethod
     def verify_headers(filepath: str) -> bool:
@@ -260,8 +753,7 @@ class ShipRadarCSVReader:
         """
         with open(filepath, encoding='utf-8') as file:
             reader = csv.reader(file, delimiter=";")
-            header = next(reader)
-            if set(header) != {"LRIMOShipNo", "ShipName", "ShipType", "MovementDateTime", "Latitude", "Longitude",
-                               "MoveStatus", "Heading", "Draught", "Speed", "Destination", "ETA"}:
+            header = next(reader, [])
+            if set(header) != set(HEADER):
                 return False
         return True
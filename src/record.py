@@ -0,0 +1,89 @@
+"""
+This module contains the ShipRadarRecord class, a compact, typed row of a CSV file.
+"""
+
+import sys
+from datetime import datetime
+from functools import lru_cache
+
+# Few distinct ETAs repeat over many rows, parsing each once also makes the rows share the datetime objects
+_parse_eta = lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+
+class ShipRadarRecord:
+    """
+    Row of a CSV file with every field converted to its type once, when the row is read.
+    Uses __slots__ and interns repeated strings, so it takes a fraction of the memory of a csv.DictReader row.
+    Fields can also be read by CSV column name, like a row: record["ShipName"].
+    """
+    # CSV column name: attribute name
+    COLUMNS: dict[str, str] = {
+        "LRIMOShipNo": "ship_no",
+        "ShipName": "ship_name",
+        "ShipType": "ship_type",
+        "MovementDateTime": "movement_date",
+        "Latitude": "latitude",
+        "Longitude": "longitude",
+        "MoveStatus": "move_status",
+        "Heading": "heading",
+        "Draught": "draught",
+        "Speed": "speed",
+        "Destination": "destination",
+        "ETA": "eta"
+    }
+    __slots__ = ('row_id', *COLUMNS.values())
+
+    def __init__(self, row_id: int, ship_no: int, ship_name: str, ship_type: str, movement_date: datetime,
+                 latitude: float, longitude: float, move_status: str, heading: int, draught: float, speed: float,
+                 destination: str, eta: datetime):
+        # Index of the data row in the file, header excluded
+        self.row_id: int = row_id
+        self.ship_no: int = ship_no
+        self.ship_name: str = ship_name
+        self.ship_type: str = ship_type
+        self.movement_date: datetime = movement_date
+        self.latitude: float = latitude
+        self.longitude: float = longitude
+        self.move_status: str = move_status
+        self.heading: int = heading
+        self.draught: float = draught
+        self.speed: float = speed
+        self.destination: str = destination
+        self.eta: datetime = eta
+
+    @classmethod
+    def from_values(cls, row_id: int, values: list[str], positions: dict[str, int]) -> 'ShipRadarRecord':
+        """
+        Parses a row of the CSV file
+        :param row_id: index of the data row in the file
+        :param values: fields of the row, as returned by csv.reader
+        :param positions: CSV column name: index of the column in values
+        :return: ShipRadarRecord object
+        """
+        return cls(
+            row_id,
+            int(values[positions["LRIMOShipNo"]]),
+            sys.intern(values[positions["ShipName"]]),
+            sys.intern(values[positions["ShipType"]]),
+            datetime.fromisoformat(values[positions["MovementDateTime"]]),
+            float(values[positions["Latitude"]]),
+            float(values[positions["Longitude"]]),
+            sys.intern(values[positions["MoveStatus"]]),
+            int(values[positions["Heading"]]),
+            # Ensure that the decimal separator is a dot
+            float(values[positions["Draught"]].replace(",", ".")),
+            float(values[positions["Speed"]].replace(",", ".")),
+            sys.intern(values[positions["Destination"]]),
+            _parse_eta(values[positions["ETA"]])
+        )
+
+    def __getitem__(self, column: str):
+        return getattr(self, self.COLUMNS[column])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ShipRadarRecord):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"ShipRadarRecord({', '.join(f'{slot}={getattr(self, slot)!r}' for slot in self.__slots__)})"
@@ -0,0 +1,273 @@
+"""
+This module contains the ShipRadarRenderer class, rendering plotly figures to images in a pool of worker processes.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+import plotly.graph_objects as go
+import plotly.io as pio
+from beartype.typing import Union, Callable
+from src import err, logger
+
+# Image formats supported by kaleido
+FORMATS: tuple[str, ...] = ('png', 'jpeg', 'webp', 'svg', 'pdf')
+
+
+def render_image(figure: str, width: int, height: int, image_format: str) -> bytes:
+    """
+    Renders a figure with kaleido, runs in a worker process
+    :param figure: JSON of a plotly figure
+    :param width: width of the image in pixels
+    :param height: height of the image in pixels
+    :param image_format: one of FORMATS
+    :return: content of the image file
+    """
+    try:
+        return pio.to_image(json.loads(figure), format=image_format, width=width, height=height, validate=False)
+    except (ValueError, ImportError, RuntimeError) as exc:
+        raise err.ShipRadarRenderError(f"Rendering failed: {exc}") from exc
+
+
+def warm_up() -> None:
+    """
+    Starts kaleido in a new worker process, so that its first figure doesn't pay for the start-up
+    :return: None
+    """
+    try:
+        pio.to_image({"data": [], "layout": {}}, format='png', width=16, height=16, validate=False)
+    except (ValueError, ImportError, RuntimeError):
+        # Reported once a figure is rendered
+        pass
+
+
+def forward(result: Future, future: Future) -> None:
+    """
+    Passes the outcome of a finished future to another one
+    :param result: future to complete, nothing is passed if it was cancelled, e.g. by a caller giving up waiting
+    :param future: finished future
+    :return: None
+    """
+    if result.cancelled():
+        return
+    if future.cancelled():
+        result.cancel()
+    elif isinstance(future.exception(), BrokenProcessPool):
+        result.set_exception(err.ShipRadarRenderError(f"Render worker died: {future.exception()}"))
+    elif future.exception() is not None:
+        result.set_exception(future.exception())
+    else:
+        result.set_result(future.result())
+
+
+class ShipRadarRenderer:
+    """
+    Renders figures in a pool of long-lived worker processes, kaleido starts once per worker instead of once
+    per figure. Images are cached by the hash of the figure and the size of the image, least recently used images
+    are evicted once they take more than budget bytes. Figures are serialized by the caller, so they can be changed
+    right after, and handed to workers in a background thread, so render doesn't wait for them to start.
+    A pool broken by a dying worker is started again on the next render. Safe to share between threads,
+    e.g. between sessions of the app.
+    """
+    def __init__(self, workers: int = 2, budget: int = 32 << 20,
+                 function: Callable[[str, int, int, str], bytes] = render_image):
+        """
+        :param workers: number of worker processes
+        :param budget: bytes of cached images
+        :param function: function rendering JSON of a figure in a worker process, with the signature of render_image
+        """
+        self.logger = logger.ShipRadarLogger("RendererLogger")
+        self.workers: int = workers
+        self.budget: int = budget
+        self.function: Callable[[str, int, int, str], bytes] = function
+        # Bytes taken by cached images
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__images: OrderedDict[str, bytes] = OrderedDict()
+        # Renders in progress, a figure requested again before it is done isn't rendered twice
+        self.__pending: dict[str, Future] = {}
+        self.__processes: Union[None, ProcessPoolExecutor] = None
+        self.__submitter = ThreadPoolExecutor(1, thread_name_prefix="ShipRadarRenderer")
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__images)
+
+    @staticmethod
+    def key(figure: str, width: int, height: int, image_format: str) -> str:
+        """
+        Builds the key of an image
+        :param figure: JSON of a plotly figure
+        :param width: width of the image in pixels
+        :param height: height of the image in pixels
+        :param image_format: one of FORMATS
+        :return: key of the image
+        """
+        digest = hashlib.blake2b(figure.encode(), digest_size=16).hexdigest()
+        return f"{digest}:{width}x{height}.{image_format}"
+
+    def start(self) -> None:
+        """
+        Starts worker processes if they aren't running, each of them starts kaleido right away
+        :return: None
+        """
+        with self.__lock:
+            self.__start()
+
+    def __start(self) -> ProcessPoolExecutor:
+        """
+        Starts worker processes if they aren't running, the lock must be held
+        :return: pool of worker processes
+        """
+        if self.__processes is None:
+            self.logger.debug(f"Starting {self.workers} render workers")
+            # Forking the app, with its threads, isn't safe, workers start as fresh interpreters
+            self.__processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                   initializer=warm_up)
+            for _ in range(self.workers):
+                self.__processes.submit(int)
+        return self.__processes
+
+    def render(self, figure: Union[go.Figure, dict], width: int, height: int, image_format: str = 'png') -> Future:
+        """
+        Renders a figure, from the cache if it was rendered before
+        :param figure: plotly figure or its dictionary, it is serialized before render returns
+        :param width: width of the image in pixels
+        :param height: height of the image in pixels
+        :param image_format: one of FORMATS
+        :return: future with the content of the image file, ShipRadarRenderError if rendering fails
+        """
+        if image_format not in FORMATS:
+            raise err.ShipRadarRenderError(f"Unknown image format: {image_format}")
+        result = Future()
+        try:
+            data = pio.to_json(figure, validate=False)
+        except (ValueError, TypeError, RuntimeError) as exc:
+            result.set_exception(err.ShipRadarRenderError(f"Figure can't be serialized: {exc}"))
+            return result
+        self.__submitter.submit(self.__submit, data, width, height, image_format, result)
+        return result
+
+    def __submit(self, data: str, width: int, height: int, image_format: str, result: Future) -> None:
+        """
+        Completes the result from the cache or from a worker process, runs in the background thread
+        :param data: JSON of a plotly figure
+        :param width: width of the image in pixels
+        :param height: height of the image in pixels
+        :param image_format: one of FORMATS
+        :param result: future to complete
+        :return: None
+        """
+        processes = None
+        try:
+            key = self.key(data, width, height, image_format)
+            with self.__lock:
+                image = self.__images.get(key)
+                if image is not None:
+                    self.__images.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    future = self.__pending.get(key)
+                    submitted = future is None
+                    if submitted:
+                        future, processes = self.__submit_locked(data, width, height, image_format)
+                        self.__pending[key] = future
+        # Nothing else waits on this thread, so every error has to reach the result
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self.logger.error(f"Render can't be submitted: {exc}")
+            result.set_exception(exc if isinstance(exc, err.ShipRadarRenderError)
+                                 else err.ShipRadarRenderError(f"Render can't be submitted: {exc}"))
+            return
+        if image is not None:
+            result.set_result(image)
+            return
+        # Callbacks of finished futures run right away, so they are added without holding the lock
+        if submitted:
+            future.add_done_callback(partial(self.__done, key, processes))
+        future.add_done_callback(partial(forward, result))
+
+    def __submit_locked(self, data: str, width: int, height: int,
+                        image_format: str) -> tuple[Future, ProcessPoolExecutor]:
+        """
+        Submits a render to worker processes, started again if a dying worker broke their pool, the lock must be held
+        :param data: JSON of a plotly figure
+        :param width: width of the image in pixels
+        :param height: height of the image in pixels
+        :param image_format: one of FORMATS
+        :return: future of the worker process and the pool it was submitted to
+        """
+        try:
+            return self.__start().submit(self.function, data, width, height, image_format), self.__processes
+        except BrokenProcessPool:
+            self.logger.warning("Render workers died, starting them again")
+            self.__processes.shutdown(wait=False)
+            self.__processes = None
+            return self.__start().submit(self.function, data, width, height, image_format), self.__processes
+
+    def __done(self, key: str, processes: ProcessPoolExecutor, future: Future) -> None:
+        """
+        Caches a rendered image, evicting the least recently used images over the budget
+        :param key: key of the image
+        :param processes: pool of worker processes the image was rendered in
+        :param future: finished future of a worker process
+        :return: None
+        """
+        with self.__lock:
+            self.__pending.pop(key, None)
+            if future.cancelled():
+                return
+            if isinstance(future.exception(), BrokenProcessPool):
+                # A worker died, e.g. kaleido crashed, the next render starts a new pool
+                self.logger.warning(f"Render workers died: {future.exception()}")
+                if self.__processes is processes:
+                    processes.shutdown(wait=False)
+                    self.__processes = None
+                return
+            if future.exception() is not None:
+                return
+            image = future.result()
+            if len(image) > self.budget:
+                self.logger.debug(f"Image of {len(image)} bytes is over the budget, not cached")
+                return
+            self.__images[key] = image
+            self.size += len(image)
+            while self.size > self.budget:
+                _, evicted = self.__images.popitem(last=False)
+                self.size -= len(evicted)
+                self.logger.debug(f"Evicted image of {len(evicted)} bytes")
+
+    def terminate(self) -> None:
+        """
+        Kills worker processes, e.g. when kaleido hangs, renders in progress fail and the next render starts
+        new workers
+        :return: None
+        """
+        with self.__lock:
+            processes, self.__processes = self.__processes, None
+        if processes is None:
+            return
+        self.logger.warning("Killing render workers")
+        # ProcessPoolExecutor can't stop a running task, its processes are killed, which fails their futures
+        for process in list(processes._processes.values()):  # pylint: disable=protected-access
+            process.kill()
+        processes.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        """
+        Stops worker processes, renders in progress are cancelled, cached images are kept
+        :return: None
+        """
+        self.__submitter.shutdown(wait=True)
+        with self.__lock:
+            processes, self.__processes = self.__processes, None
+            self.__submitter = ThreadPoolExecutor(1, thread_name_prefix="ShipRadarRenderer")
+        # Callbacks of cancelled renders take the lock, so it isn't held while waiting for them
+        if processes is not None:
+            processes.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,447 @@
+"""
+This module contains classes for receiving live AIS data over a socket and appending it to a ShipRadarDataset.
+"""
+
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from beartype.typing import Union, Callable
+import numpy as np
+from src import logger
+from src.dataset import ShipRadarDataset
+from src.reader import HEADER
+from src.record import ShipRadarRecord
+
+# Same value as unknown ETAs in CSV files
+UNKNOWN_ETA: datetime = datetime(9999, 12, 31, 23, 59, 59)
+# Characters of 6-bit AIS text fields
+_AIS_TEXT: str = "@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_ !\"#$%&'()*+,-./0123456789:;<=>?"
+# Navigation status of AIS position reports: MoveStatus, named like in CSV files
+NAVIGATION_STATUS: dict[int, str] = {
+    0: "Under way using engine",
+    1: "Anchored",
+    2: "Not under command",
+    3: "Restriced manoeuverability",
+    4: "Constrained by her draught",
+    5: "Moored",
+    6: "Aground",
+    7: "Engaged in fishing",
+    8: "Under way sailing"
+}
+
+
+def ship_type(code: int) -> str:
+    """
+    Converts an AIS ship type code to a ShipType of CSV files
+    :param code: ship type from AIS static data
+    :return: name of the ship type
+    """
+    match code:
+        case 30:
+            return "Fishing"
+        case 31 | 32 | 52:
+            return "Tug"
+        case 36 | 37:
+            return "Pleasure craft"
+        case _ if 40 <= code <= 49:
+            return "High speed craft"
+        case _ if 60 <= code <= 69:
+            return "Passenger"
+        case _ if 70 <= code <= 79:
+            return "Cargo"
+        case _ if 80 <= code <= 89:
+            return "Tanker"
+        case _:
+            return "N/A"
+
+
+class ShipRadarAISDecoder:
+    """
+    Decodes lines of an AIS feed into typed records with the columns of CSV files.
+    Accepts NMEA !AIVDM/!AIVDO sentences, position reports (types 1, 2, 3) become records, static data (type 5)
+    is remembered and fills name, type, draught, destination and ETA of the following records of the ship.
+    Also accepts already decoded rows, with values separated by ';' in the order of HEADER.
+    Ships are identified by their IMO number once their static data is received, by their MMSI until then.
+    """
+    def __init__(self):
+        self.logger = logger.ShipRadarLogger("AISDecoderLogger")
+        # MMSI: static data of the ship
+        self.ships: dict[int, dict] = {}
+        # (sequence id, channel): payloads of a multi-sentence message received so far
+        self.__fragments: dict[tuple[str, str], list[str]] = {}
+        self.__positions: dict[str, int] = {column: ind for ind, column in enumerate(HEADER)}
+        # Records decoded so far, row id of the next one
+        self.__decoded: int = 0
+
+    def decode(self, line: Union[str, bytes], received: Union[None, datetime] = None) -> Union[None, ShipRadarRecord]:
+        """
+        Decodes a line of the feed
+        :param line: NMEA sentence or ';' delimited row
+        :param received: time the line was received, used as MovementDateTime of AIS messages, now if None
+        :return: ShipRadarRecord object, row ids count decoded records, None if the line doesn't make a row
+        """
+        if isinstance(line, bytes):
+            line = line.decode('ascii', errors='replace')
+        line = line.strip()
+        if line.startswith(("!AIVDM", "!AIVDO")):
+            record = self.__decode_sentence(line, received or datetime.now(timezone.utc))
+        else:
+            values = line.split(';')
+            if len(values) != len(HEADER) or values[0] == HEADER[0]:
+                # Empty line, header or something else
+                return None
+            try:
+                record = ShipRadarRecord.from_values(self.__decoded, values, self.__positions)
+            except (ValueError, IndexError) as exc:
+                self.logger.debug(f"Invalid row {line}: {exc}")
+                return None
+        if record is not None:
+            self.__decoded += 1
+        return record
+
+    def __decode_sentence(self, line: str, received: datetime) -> Union[None, ShipRadarRecord]:
+        """
+        Decodes a NMEA sentence, joining multi-sentence messages
+        :param line: NMEA sentence
+        :param received: time the sentence was received
+        :return: ShipRadarRecord object, None if the sentence doesn't make a row
+        """
+        body, _, checksum = line[1:].partition('*')
+        if checksum:
+            computed = 0
+            for char in body:
+                computed ^= ord(char)
+            if f"{computed:02X}" != checksum[:2].upper():
+                self.logger.debug(f"Wrong checksum of {line}")
+                return None
+        fields = body.split(',')
+        if len(fields) < 7 or not fields[1].isdigit() or not fields[2].isdigit():
+            self.logger.debug(f"Invalid sentence {line}")
+            return None
+        count, number, sequence, channel, payload = int(fields[1]), int(fields[2]), fields[3], fields[4], fields[5]
+        fill = int(fields[6]) if fields[6].isdigit() else 0
+        if count > 1:
+            parts = self.__fragments.setdefault((sequence, channel), [])
+            if number != len(parts) + 1:
+                # Missed a fragment, the message can't be decoded
+                self.__fragments.pop((sequence, channel))
+                return None
+            parts.append(payload)
+            if number < count:
+                return None
+            payload = "".join(self.__fragments.pop((sequence, channel)))
+        return self.__decode_message(payload, fill, received)
+
+    @staticmethod
+    def __unarmor(payload: str) -> tuple[int, int]:
+        """
+        Converts the 6-bit ASCII payload of a message to bits
+        :param payload: payload of the message
+        :return: bits as an integer and their number
+        """
+        bits = 0
+        for char in payload:
+            value = ord(char) - 48
+            bits = (bits << 6) | (value - 8 if value > 40 else value)
+        return bits, 6 * len(payload)
+
+    @staticmethod
+    def __field(bits: int, length: int, start: int, end: int, signed: bool = False) -> int:
+        """
+        Reads an integer field of a message
+        :param bits: bits of the message, from ShipRadarAISDecoder.__unarmor
+        :param length: number of bits of the message
+        :param start: first bit of the field
+        :param end: bit after the last bit of the field
+        :param signed: True for two's complement fields
+        :return: value of the field
+        """
+        value = (bits >> (length - end)) & ((1 << (end - start)) - 1)
+        if signed and value >> (end - start - 1):
+            value -= 1 << (end - start)
+        return value
+
+    def __text(self, bits: int, length: int, start: int, end: int) -> str:
+        """
+        Reads a text field of a message
+        :param bits: bits of the message, from ShipRadarAISDecoder.__unarmor
+        :param length: number of bits of the message
+        :param start: first bit of the field
+        :param end: bit after the last bit of the field
+        :return: text without padding
+        """
+        chars = [_AIS_TEXT[self.__field(bits, length, bit, bit + 6)] for bit in range(start, end, 6)]
+        return "".join(chars).split('@')[0].strip()
+
+    def __decode_message(self, payload: str, fill: int, received: datetime) -> Union[None, ShipRadarRecord]:
+        """
+        Decodes a message of supported type
+        :param payload: payload of the whole message
+        :param fill: number of fill bits at the end of the payload
+        :param received: time the message was received
+        :return: ShipRadarRecord object, None if the message doesn't make a row
+        """
+        bits, length = self.__unarmor(payload)
+        if length < 38:
+            return None
+        message_type = self.__field(bits, length, 0, 6)
+        mmsi = self.__field(bits, length, 8, 38)
+        if message_type in (1, 2, 3) and length >= 168:
+            return self.__position(bits, length, mmsi, received)
+        if message_type == 5 and length - fill >= 420:
+            self.__static(bits, length, mmsi, received)
+        return None
+
+    def __position(self, bits: int, length: int, mmsi: int, received: datetime) -> Union[None, ShipRadarRecord]:
+        """
+        Converts a position report to a record
+        :param bits: bits of the message
+        :param length: number of bits of the message
+        :param mmsi: MMSI of the ship
+        :param received: time the message was received
+        :return: ShipRadarRecord object, None if the position is not available
+        """
+        longitude = self.__field(bits, length, 61, 89, signed=True) / 600000
+        latitude = self.__field(bits, length, 89, 116, signed=True) / 600000
+        if abs(longitude) > 180 or abs(latitude) > 90:
+            # 181 and 91 mean the position is not available
+            return None
+        # Heading 511 and speed 102.3 mean not available, they are kept as they are in CSV files
+        speed = self.__field(bits, length, 50, 60)
+        heading = self.__field(bits, length, 128, 137)
+        ship = self.ships.get(mmsi, {})
+        return ShipRadarRecord(
+            self.__decoded,
+            ship.get("imo") or mmsi,
+            ship.get("name", ""),
+            ship.get("type", "N/A"),
+            # Millisecond resolution, the same as in CSV files
+            received.replace(tzinfo=None, microsecond=received.microsecond // 1000 * 1000),
+            latitude,
+            longitude,
+            NAVIGATION_STATUS.get(self.__field(bits, length, 38, 42), "N/A"),
+            heading,
+            ship.get("draught", 0.0),
+            speed / 10,
+            ship.get("destination", ""),
+            ship.get("eta", UNKNOWN_ETA)
+        )
+
+    def __static(self, bits: int, length: int, mmsi: int, received: datetime) -> None:
+        """
+        Remembers static and voyage data of a ship
+        :param bits: bits of the message
+        :param length: number of bits of the message
+        :param mmsi: MMSI of the ship
+        :param received: time the message was received
+        :return: None
+        """
+        month, day = self.__field(bits, length, 274, 278), self.__field(bits, length, 278, 283)
+        hour, minute = self.__field(bits, length, 283, 288), self.__field(bits, length, 288, 294)
+        eta = UNKNOWN_ETA
+        if 1 <= month <= 12 and day >= 1 and hour < 24 and minute < 60:
+            try:
+                # ETA has no year, it's the next occurrence of the date, unless it's only a little late
+                eta = datetime(received.year, month, day, hour, minute)
+                if eta < received.replace(tzinfo=None) - timedelta(days=182):
+                    eta = eta.replace(year=received.year + 1)
+            except ValueError:
+                pass
+        self.ships[mmsi] = {
+            "imo": self.__field(bits, length, 40, 70),
+            "name": self.__text(bits, length, 112, 232),
+            "type": ship_type(self.__field(bits, length, 232, 240)),
+            "eta": eta,
+            "draught": self.__field(bits, length, 294, 302) / 10,
+            "destination": self.__text(bits, length, 302, 422)
+        }
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Passes lines of received datagrams to a ShipRadarStreamReceiver
+    """
+    def __init__(self, receiver: 'ShipRadarStreamReceiver'):
+        self.receiver = receiver
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        for line in data.splitlines():
+            self.receiver.feed(line)
+
+
+class ShipRadarStreamReceiver:
+    """
+    Receives a live AIS feed, decodes it and appends its rows to a dataset in batches.
+    Over TCP it connects to the feed and reconnects when the connection drops, over UDP it listens on the address.
+    Runs an asyncio event loop in its own thread, so it doesn't block the event loop of the app.
+    """
+    # A batch is appended when it has this many rows, or after BATCH_INTERVAL seconds
+    BATCH_SIZE: int = 5000
+    BATCH_INTERVAL: float = 0.5
+    # Seconds between attempts to connect to a TCP feed
+    RECONNECT_INTERVAL: float = 2.0
+
+    def __init__(self, dataset: ShipRadarDataset, host: str, port: int, protocol: str = 'tcp',
+                 lock: Union[None, threading.Lock] = None,
+                 on_batch: Union[None, Callable[[np.ndarray], None]] = None):
+        """
+        :param dataset: dataset rows are appended to, e.g. ShipRadarDataset.empty()
+        :param host: host of the feed for TCP, address to listen on for UDP
+        :param port: port of the feed for TCP, port to listen on for UDP
+        :param protocol: 'tcp' or 'udp'
+        :param lock: lock held while rows are appended, share it with code reading the dataset
+        :param on_batch: called with row ids of every appended batch, in the thread of the receiver
+        """
+        self.logger = logger.ShipRadarLogger("StreamReceiverLogger")
+        self.dataset: ShipRadarDataset = dataset
+        self.host: str = host
+        self.port: int = port
+        self.protocol: str = protocol
+        self.lock: threading.Lock = lock or threading.Lock()
+        self.on_batch: Union[None, Callable[[np.ndarray], None]] = on_batch
+        self.decoder = ShipRadarAISDecoder()
+        # Counters of received lines and of rows appended to the dataset
+        self.lines: int = 0
+        self.rows: int = 0
+        self.__batch: list[ShipRadarRecord] = []
+        self.__loop: Union[None, asyncio.AbstractEventLoop] = None
+        self.__stopped: Union[None, asyncio.Event] = None
+        self.__full: Union[None, asyncio.Event] = None
+        self.__ready = threading.Event()
+        # Error that stopped the receiver before it was ready, raised by ShipRadarStreamReceiver.start
+        self.__error: Union[None, OSError] = None
+        self.__thread: Union[None, threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Starts receiving in a new thread
+        :return: None
+        :raises OSError: if the receiver can't listen, e.g. the UDP port is already in use
+        """
+        self.__error = None
+        self.__ready.clear()
+        self.__thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        self.__thread.start()
+        self.__ready.wait()
+        if self.__error is not None:
+            self.__thread.join()
+            self.__thread = None
+            raise self.__error
+
+    def stop(self) -> None:
+        """
+        Stops receiving, rows received so far are appended before the thread ends
+        :return: None
+        """
+        if self.__loop is not None and not self.__loop.is_closed():
+            self.__loop.call_soon_threadsafe(self.__stopped.set)
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def feed(self, line: Union[str, bytes]) -> None:
+        """
+        Decodes a line of the feed and adds it to the current batch, must be called from the event loop
+        :param line: NMEA sentence or ';' delimited row
+        :return: None
+        """
+        self.lines += 1
+        record = self.decoder.decode(line)
+        if record is not None:
+            self.__batch.append(record)
+            if len(self.__batch) >= self.BATCH_SIZE:
+                self.__full.set()
+
+    async def run(self) -> None:
+        """
+        Receives the feed until ShipRadarStreamReceiver.stop is called
+        :return: None
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__stopped = asyncio.Event()
+        self.__full = asyncio.Event()
+        flusher = asyncio.create_task(self.__flush_periodically())
+        transport = None
+        try:
+            if self.protocol == 'udp':
+                try:
+                    transport, _ = await self.__loop.create_datagram_endpoint(lambda: _DatagramProtocol(self),
+                                                                              local_addr=(self.host, self.port))
+                except OSError as exc:
+                    self.logger.error(f"Can't listen for AIS datagrams on {self.host}:{self.port}: {exc}")
+                    self.__error = exc
+                    return
+                self.logger.info(f"Listening for AIS datagrams on {self.host}:{self.port}")
+                self.__ready.set()
+                await self.__stopped.wait()
+            else:
+                self.__ready.set()
+                receiving = asyncio.create_task(self.__receive_tcp())
+                await self.__stopped.wait()
+                receiving.cancel()
+        finally:
+            # Unblock start() if the endpoint couldn't be created
+            self.__ready.set()
+            if transport is not None:
+                transport.close()
+            self.__stopped.set()
+            await flusher
+            self.logger.info(f"Stream stopped after {self.lines} lines, {self.rows} rows")
+
+    async def __receive_tcp(self) -> None:
+        """
+        Reads lines from a TCP feed, reconnecting when the connection fails
+        :return: None
+        """
+        while not self.__stopped.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as exc:
+                self.logger.warning(f"Can't connect to AIS feed {self.host}:{self.port}: {exc}")
+            else:
+                self.logger.info(f"Connected to AIS feed {self.host}:{self.port}")
+                try:
+                    async for line in reader:
+                        self.feed(line)
+                except OSError as exc:
+                    self.logger.warning(f"Connection to AIS feed lost: {exc}")
+                finally:
+                    writer.close()
+            await asyncio.sleep(self.RECONNECT_INTERVAL)
+
+    async def __flush_periodically(self) -> None:
+        """
+        Appends batches of rows to the dataset, until the receiver is stopped
+        :return: None
+        """
+        while not self.__stopped.is_set():
+            try:
+                await asyncio.wait_for(self.__full.wait(), self.BATCH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.__full.clear()
+            await self.__flush()
+        await self.__flush()
+
+    async def __flush(self) -> None:
+        """
+        Appends the current batch to the dataset, in a worker thread so that receiving goes on meanwhile
+        :return: None
+        """
+        if not self.__batch:
+            return
+        batch, self.__batch = self.__batch, []
+        await self.__loop.run_in_executor(None, self.__append, batch)
+
+    def __append(self, batch: list[ShipRadarRecord]) -> None:
+        """
+        Appends rows to the dataset
+        :param batch: list of ShipRadarRecord objects
+        :return: None
+        """
+        with self.lock:
+            ids = self.dataset.append(batch)
+        self.rows += len(ids)
+        self.logger.debug(f"Appended batch of {len(ids)} rows")
+        if self.on_batch is not None:
+            self.on_batch(ids)
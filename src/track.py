@@ -0,0 +1,132 @@
+"""
+This module contains the ShipRadarTrack class, holding positions of a single ship.
+"""
+
+import numpy as np
+from beartype.typing import Union
+
+
+def farthest_points(x: np.ndarray, y: np.ndarray, firsts: np.ndarray,
+                    lasts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the point of every section of a line farthest from the segment joining the ends of the section,
+    all sections at once
+    :param x: x coordinates of points of the line
+    :param y: y coordinates of points of the line
+    :param firsts: indexes of first points of sections, each section has a point between its ends
+    :param lasts: indexes of last points of sections
+    :return: index of the farthest point of every section, the first one as with np.argmax, and its distance
+    """
+    # Points between the ends of all sections, one after another, with the section of each of them
+    section = np.repeat(np.arange(len(firsts)), lasts - firsts - 1)
+    starts = np.flatnonzero(np.r_[True, section[1:] != section[:-1]])
+    points = np.arange(len(section)) - starts[section] + firsts[section] + 1
+    dx, dy = (x[lasts] - x[firsts])[section], (y[lasts] - y[firsts])[section]
+    px, py = x[points] - x[firsts][section], y[points] - y[firsts][section]
+    length = np.hypot(dx, dy)
+    # Sections starting and ending at the same point, e.g. a ship returning to port, use the distance to it
+    distances = np.where(length == 0, np.hypot(px, py), np.abs(dx * py - dy * px) / np.where(length == 0, 1.0, length))
+    farthest = np.maximum.reduceat(distances, starts)
+    candidates = np.flatnonzero(distances == farthest[section])
+    candidates = candidates[np.r_[True, section[candidates[1:]] != section[candidates[:-1]]]]
+    return points[candidates], farthest
+
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Finds points of a line to keep with the Douglas-Peucker algorithm, the simplified line then stays
+    within tolerance of every original point. Sections are split a level at a time, so numpy is called
+    once per level instead of once per section.
+    :param x: x coordinates of points of the line
+    :param y: y coordinates of points of the line
+    :param tolerance: largest allowed distance of an original point from the simplified line
+    :return: boolean array, True for points to keep
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    if len(x) == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    # Sections of the line still to simplify, as indexes of their first and last point
+    firsts, lasts = np.array([0]), np.array([len(x) - 1])
+    while True:
+        inner = lasts - firsts >= 2
+        firsts, lasts = firsts[inner], lasts[inner]
+        if not firsts.size:
+            return keep
+        points, distances = farthest_points(x, y, firsts, lasts)
+        split = distances > tolerance
+        keep[points[split]] = True
+        firsts, lasts = np.concatenate((firsts[split], points[split])), np.concatenate((points[split], lasts[split]))
+
+
+def time_buckets(times: np.ndarray, interval: np.timedelta64) -> np.ndarray:
+    """
+    Finds the first point of every time interval
+    :param times: sorted times of points
+    :param interval: length of the intervals
+    :return: boolean array, True for points to keep
+    """
+    keep = np.zeros(len(times), dtype=bool)
+    if len(times) == 0:
+        return keep
+    buckets = (times - times[0]) // interval
+    keep[0] = True
+    keep[1:] = buckets[1:] != buckets[:-1]
+    return keep
+
+
+class ShipRadarTrack:
+    """
+    Class holding all positions of a single ship, identified by its LRIMO number, sorted by time.
+    Each column is a numpy array with one value per position.
+    """
+    def __init__(self, ship_no: int, columns: dict[str, np.ndarray], row_ids: np.ndarray):
+        self.ship_no: int = ship_no
+        self.columns: dict[str, np.ndarray] = columns
+        # Row ids of positions in the dataset, in the same order as columns
+        self.row_ids: np.ndarray = row_ids
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def take(self, positions: np.ndarray) -> 'ShipRadarTrack':
+        """
+        Creates a track with some positions of this track
+        :param positions: indexes or boolean mask of positions to take
+        :return: ShipRadarTrack object
+        """
+        return ShipRadarTrack(self.ship_no, {column: values[positions] for column, values in self.columns.items()},
+                              self.row_ids[positions])
+
+    def simplify(self, tolerance: Union[None, float] = None, minutes: Union[None, float] = None) -> 'ShipRadarTrack':
+        """
+        Drops positions that don't change the shape of the track much, to keep plots of long tracks light.
+        The first and the last position and positions around changes of MoveStatus are always kept.
+        :param tolerance: Douglas-Peucker tolerance in degrees, positions closer to the simplified track are dropped,
+                          None to skip
+        :param minutes: keep only the first position of every interval of this many minutes, None to skip
+        :return: ShipRadarTrack object with kept positions, this track if all are kept
+        """
+        if len(self) < 3 or (tolerance is None and minutes is None):
+            return self
+        keep = np.ones(len(self), dtype=bool)
+        if minutes is not None:
+            keep &= time_buckets(self.columns["MovementDateTime"], np.timedelta64(int(minutes * 60000), 'ms'))
+        if tolerance is not None:
+            keep &= douglas_peucker(self.columns["Longitude"], self.columns["Latitude"], tolerance)
+        statuses = self.columns["MoveStatus"]
+        changes = np.flatnonzero(statuses[1:] != statuses[:-1])
+        keep[changes] = keep[changes + 1] = True
+        keep[0] = keep[-1] = True
+        return self if keep.all() else self.take(keep)
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the ship, vessels can be renamed, so the most recent name is used
+        :return: Ship name
+        """
+        return str(self.columns["ShipName"][-1])
@@ -0,0 +1,365 @@
+"""
+Tests for dataset.py module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from src import err
+from src.cache import ShipRadarFileCache, ShipRadarResultCache, file_fingerprint
+from src.dataset import ShipRadarDataset
+from src.planner import ShipRadarSelection
+from src.reader import ShipRadarFilter, ShipRadarCSVReader
+
+
+class TestDataset(unittest.TestCase):
+    """
+    Tests for ShipRadarDataset class
+    """
+    FILTERS = [
+        ShipRadarFilter('ship_name', 'WINDSUPPLIER'),
+        ShipRadarFilter('ship_no', 9295490),
+        ShipRadarFilter('ship_type', 'Cargo'),
+        ShipRadarFilter('move_status', 'Moored'),
+        ShipRadarFilter('heading', 42),
+        ShipRadarFilter('draught', 3.0),
+        ShipRadarFilter('speed', 0.1),
+        ShipRadarFilter('destination', 'ESBJERG'),
+        ShipRadarFilter('eta', datetime.fromisoformat('9999-12-31 23:59:59.000')),
+        ShipRadarFilter('date',
+                        datetime.fromisoformat('2011-12-31 10:57:13.000'),
+                        datetime.fromisoformat('2012-01-01 20:57:14.000')),
+        ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = ShipRadarDataset.from_csv('baza_reduced.csv')
+        cls.reader = ShipRadarCSVReader('baza_reduced.csv')
+
+    def test_types(self):
+        """
+        Test for column types
+        :return:
+        """
+        dtypes = self.dataset.frame.dtypes
+        self.assertEqual(dtypes["LRIMOShipNo"], np.int64, "Failed test: dataset LRIMOShipNo type")
+        self.assertEqual(dtypes["MovementDateTime"], np.dtype('datetime64[ms]'), "Failed test: dataset date type")
+        self.assertEqual(dtypes["Speed"], np.float64, "Failed test: dataset speed type")
+        self.assertEqual(dtypes["ShipType"], 'category', "Failed test: dataset ship type type")
+
+    def test_filters(self):
+        """
+        Test for every filter type, results must be the same as when parsing the file
+        :return:
+        """
+        for filter_obj in self.FILTERS:
+            with self.subTest(filter=filter_obj.type):
+                np.testing.assert_array_equal(self.dataset.select([filter_obj]), self.reader.parse_ids(filter_obj),
+                                              f"Failed test: dataset filter {filter_obj.type}")
+
+    def test_select_many(self):
+        """
+        Test for selecting with multiple filters
+        :return:
+        """
+        filters = [ShipRadarFilter('ship_name', 'SILUNA ACE'), ShipRadarFilter('ship_type', 'Passenger')]
+        ids = self.dataset.select(filters)
+        self.assertEqual([row.row_id for row in self.dataset.rows(ids)],
+                         [row.row_id for row in self.reader.parse_many(filters)],
+                         "Failed test: dataset select many")
+
+    def test_tracks(self):
+        """
+        Test for grouping rows into tracks of individual ships
+        :return:
+        """
+        ids = self.dataset.select([ShipRadarFilter('ship_type', 'Passenger')])
+        tracks = self.dataset.tracks(ids)
+        self.assertEqual([track.ship_no for track in tracks], [9566148, 9295490], "Failed test: dataset tracks")
+        self.assertEqual(sum(len(track) for track in tracks), len(ids), "Failed test: dataset tracks\nLengths")
+        for track in tracks:
+            dates = track["MovementDateTime"]
+            self.assertTrue((dates[:-1] <= dates[1:]).all(), "Failed test: dataset tracks\nNot sorted")
+            self.assertTrue((track["LRIMOShipNo"] == track.ship_no).all(), "Failed test: dataset tracks\nMixed")
+
+    def test_grid(self):
+        """
+        Test for coords filter answered by the grid index, results must be the same as with a full scan
+        :return:
+        """
+        for box in [(8.0, 55.0, 11.0, 56.0), (4.87, 51.81, 4.875, 51.83), (1.9, 51.7, 1.95, 51.8), (-10, -10, 0, 0)]:
+            filter_obj = ShipRadarFilter('coords', *box)
+            with self.subTest(box=box):
+                np.testing.assert_array_equal(self.dataset.lookup(filter_obj),
+                                              np.flatnonzero(self.dataset.mask(filter_obj)),
+                                              "Failed test: dataset grid")
+
+    def test_time_index(self):
+        """
+        Test for date and eta filters answered by sorted indexes, results must be the same as with a full scan
+        :return:
+        """
+        for filter_obj in [ShipRadarFilter('date', datetime.fromisoformat('2012-01-01 00:57:04.000'),
+                                           datetime.fromisoformat('2012-01-01 00:57:10.000')),
+                           ShipRadarFilter('date', datetime.fromisoformat('2013-01-01 00:00:00.000'),
+                                           datetime.fromisoformat('2014-01-01 00:00:00.000')),
+                           ShipRadarFilter('date', datetime.fromisoformat('2014-01-01 00:00:00.000'),
+                                           datetime.fromisoformat('2013-01-01 00:00:00.000')),
+                           ShipRadarFilter('eta', datetime.fromisoformat('2011-09-19 14:00:00.000'))]:
+            with self.subTest(filter=filter_obj.filter):
+                np.testing.assert_array_equal(self.dataset.lookup(filter_obj),
+                                              np.flatnonzero(self.dataset.mask(filter_obj)),
+                                              "Failed test: dataset time index")
+
+    def test_inverted_index(self):
+        """
+        Test for equality filters answered by inverted indexes, results must be the same as with a full scan
+        :return:
+        """
+        for filter_obj in [ShipRadarFilter('ship_name', 'SILUNA ACE'), ShipRadarFilter('ship_type', 'N/A'),
+                           ShipRadarFilter('move_status', 'Moored'), ShipRadarFilter('destination', ''),
+                           ShipRadarFilter('ship_no', 9566148), ShipRadarFilter('ship_name', 'DefinitelyNotTest')]:
+            with self.subTest(filter=filter_obj.filter):
+                np.testing.assert_array_equal(self.dataset.lookup(filter_obj),
+                                              np.flatnonzero(self.dataset.mask(filter_obj)),
+                                              "Failed test: dataset inverted index")
+
+    def test_range_index(self):
+        """
+        Test for range filters answered by sorted indexes, results must be the same as with a full scan
+        :return:
+        """
+        for filter_obj in [ShipRadarFilter('speed', 15.0, None), ShipRadarFilter('speed', None, 0.1),
+                           ShipRadarFilter('draught', 2.0, 5.0), ShipRadarFilter('heading', 350, 10),
+                           ShipRadarFilter('heading', 90, 180), ShipRadarFilter('speed', 5.0, 1.0)]:
+            with self.subTest(filter=filter_obj.type, bounds=filter_obj.filter):
+                ids = self.dataset.lookup(filter_obj)
+                np.testing.assert_array_equal(ids, np.flatnonzero(self.dataset.mask(filter_obj)),
+                                              "Failed test: dataset range index")
+                if ids.size:
+                    np.testing.assert_array_equal(ids, self.reader.parse_ids(filter_obj),
+                                                  "Failed test: dataset range index\nDifferent from CSV")
+
+    def test_explain(self):
+        """
+        Test for the query planner, filters must be evaluated from the most selective one
+        :return:
+        """
+        filters = [ShipRadarFilter('ship_type', 'Passenger'), ShipRadarFilter('speed', None, 0.1),
+                   ShipRadarFilter('ship_name', 'SILUNA ACE')]
+        plan = self.dataset.explain(filters)
+        np.testing.assert_array_equal(plan.ids, [row.row_id for row in self.reader.parse_many(filters)],
+                                      "Failed test: dataset explain")
+        estimates = [step.estimated for step in plan.steps]
+        self.assertEqual(estimates, sorted(estimates), "Failed test: dataset explain\nNot ordered by selectivity")
+        self.assertEqual(plan.steps[0].access, 'index', "Failed test: dataset explain\nFirst step not an index")
+        # Categorical filters are estimated exactly
+        for step in plan.steps:
+            if step.filter.type != 'speed':
+                self.assertEqual(step.estimated, len(self.dataset.lookup(step.filter)),
+                                 "Failed test: dataset explain\nEstimate")
+        self.assertEqual(plan.steps[-1].actual, len(plan.ids), "Failed test: dataset explain\nActual rows")
+        self.assertIn(f"Result: {len(plan.ids)} rows", str(plan), "Failed test: dataset explain\nOutput")
+
+    def test_explain_short_circuit(self):
+        """
+        Test for the query planner skipping filters once no rows are left
+        :return:
+        """
+        plan = self.dataset.explain([ShipRadarFilter('speed', 1000.0, None), ShipRadarFilter('ship_name', 'NotTest'),
+                                     ShipRadarFilter('ship_type', 'Passenger')])
+        self.assertEqual(len(plan.ids), 0, "Failed test: dataset explain short circuit")
+        self.assertEqual([step.actual for step in plan.steps], [0, None, None],
+                         "Failed test: dataset explain short circuit\nNot skipped")
+
+    def test_refine(self):
+        """
+        Test for refining the previous result when filters are added or tightened
+        :return:
+        """
+        broad = [ShipRadarFilter('ship_type', 'Passenger'), ShipRadarFilter('speed', None, 5.0)]
+        previous = ShipRadarSelection(self.dataset.fingerprint, broad, self.dataset.select(broad))
+        for filters, refined in [
+            ([ShipRadarFilter('ship_type', 'Passenger'), ShipRadarFilter('speed', None, 0.1)], True),
+            (broad + [ShipRadarFilter('ship_name', 'SILUNA ACE')], True),
+            ([ShipRadarFilter('ship_type', 'Passenger'), ShipRadarFilter('speed', None, 10.0)], False),
+            ([ShipRadarFilter('ship_type', 'Passenger')], False),
+        ]:
+            with self.subTest(filters=filters):
+                plan = self.dataset.explain(filters, previous)
+                self.assertEqual(plan.candidates is not None, refined, "Failed test: dataset refine\nPlan")
+                np.testing.assert_array_equal(plan.ids, self.dataset.select(filters), "Failed test: dataset refine")
+        # Results of another file are never refined
+        other = ShipRadarSelection("other", broad, previous.ids)
+        self.assertIsNone(self.dataset.explain(broad, other).candidates, "Failed test: dataset refine\nFingerprint")
+
+    def test_append(self):
+        """
+        Test for appending rows of a followed file and extending a result with their matches
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            shutil.copy('baza_reduced.csv', file)
+            dataset = ShipRadarDataset.from_csv(file)
+            rows = len(dataset)
+            reader = ShipRadarCSVReader(file)
+            reader.follow()
+            filters = [ShipRadarFilter('ship_type', 'Passenger'), ShipRadarFilter('speed', None, 1.0)]
+            selection = ShipRadarSelection(dataset.fingerprint, filters, dataset.select(filters))
+            # Make sure indexes and statistics exist before rows are appended
+            dataset.explain([ShipRadarFilter('destination', 'NEW PORT'), ShipRadarFilter('coords', 0, 0, 20, 60)])
+
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write("\n9566148;WINDSUPPLIER;Passenger;2014-09-01 00:00:00.000;55.4;8.4;Moored;151;2;0,5;"
+                              "NEW PORT;9999-12-31 23:59:59.000\n"
+                              "9566148;WINDSUPPLIER;Passenger;2014-09-01 01:00:00.000;55.5;8.5;Underway;151;2;9;"
+                              "NEW PORT;9999-12-31 23:59:59.000\n")
+            ids = dataset.append(reader.read_appended(), file_fingerprint(file))
+            np.testing.assert_array_equal(ids, [rows, rows + 1], "Failed test: dataset append\nRow ids")
+
+            reloaded = ShipRadarDataset.from_csv(file)
+            pd.testing.assert_frame_equal(dataset.frame.astype(str), reloaded.frame.astype(str))
+            self.assertEqual(dataset.fingerprint, reloaded.fingerprint, "Failed test: dataset append\nFingerprint")
+            extended = dataset.extend(selection, ids)
+            np.testing.assert_array_equal(extended.ids, reloaded.select(filters), "Failed test: dataset append\nExtend")
+            np.testing.assert_array_equal(dataset.select([ShipRadarFilter('destination', 'NEW PORT')]), ids,
+                                          "Failed test: dataset append\nIndex not rebuilt")
+            self.assertEqual(len(dataset.select([ShipRadarFilter('coords', 8.39, 55.39, 8.51, 55.51)])),
+                             len(reloaded.select([ShipRadarFilter('coords', 8.39, 55.39, 8.51, 55.51)])),
+                             "Failed test: dataset append\nGrid not rebuilt")
+
+            # Appended rows merged into indexes
+            dataset.MERGE_ROWS = 1
+            for filter_obj in self.FILTERS + [ShipRadarFilter('destination', 'NEW PORT')]:
+                with self.subTest(filter=filter_obj):
+                    np.testing.assert_array_equal(dataset.lookup(filter_obj), reloaded.lookup(filter_obj),
+                                                  "Failed test: dataset append\nIndex extended")
+            self.assertEqual(dataset.statistics["Speed"].rows, len(reloaded), "Failed test: dataset append\nStatistics")
+            self.assertEqual(dataset.statistics["Destination"].estimate_equal('NEW PORT'), 2,
+                             "Failed test: dataset append\nStatistics of new value")
+
+    def test_result_cache(self):
+        """
+        Test for answering repeated queries from the result cache
+        :return:
+        """
+        results = ShipRadarResultCache()
+        filters = [ShipRadarFilter('ship_type', 'Passenger'), ShipRadarFilter('speed', None, 0.1)]
+        first = self.dataset.select(filters, results)
+        self.assertEqual((results.hits, results.misses), (0, 1), "Failed test: dataset result cache miss")
+        # Order of filters doesn't matter and equal filters are the same query
+        second = self.dataset.select([ShipRadarFilter('speed', None, 0.1), ShipRadarFilter('ship_type', 'Passenger')],
+                                     results)
+        self.assertEqual((results.hits, results.misses), (1, 1), "Failed test: dataset result cache hit")
+        self.assertIs(first, second, "Failed test: dataset result cache\nNot the cached result")
+        self.assertFalse(second.flags.writeable, "Failed test: dataset result cache\nCached result writeable")
+        # A different file is a different query
+        ShipRadarDataset(self.dataset.frame, "other").select(filters, results)
+        self.assertEqual((results.hits, results.misses), (1, 2), "Failed test: dataset result cache fingerprint")
+
+    def test_result_cache_eviction(self):
+        """
+        Test for evicting least recently used results over the memory budget
+        :return:
+        """
+        first = [ShipRadarFilter('ship_type', 'Passenger')]
+        second = [ShipRadarFilter('ship_type', 'Cargo')]
+        results = ShipRadarResultCache(budget=self.dataset.select(first).nbytes + self.dataset.select(second).nbytes)
+        self.dataset.select(first, results)
+        self.dataset.select(second, results)
+        self.assertEqual(len(results), 2, "Failed test: dataset result cache eviction\nNot cached")
+        self.dataset.select(first, results)
+        self.dataset.select([ShipRadarFilter('ship_name', 'DP GALYNA')], results)
+        self.assertLessEqual(results.size, results.budget, "Failed test: dataset result cache eviction\nOver budget")
+        self.assertIsNotNone(results.get(results.key(self.dataset.fingerprint, first)),
+                             "Failed test: dataset result cache eviction\nRecently used result evicted")
+        self.assertIsNone(results.get(results.key(self.dataset.fingerprint, second)),
+                          "Failed test: dataset result cache eviction\nLeast recently used result kept")
+
+    def test_antimeridian(self):
+        """
+        Test for coords filter crossing the antimeridian
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            with open('baza_reduced.csv', encoding='utf-8') as source, open(file, 'w', encoding='utf-8') as target:
+                target.write(next(source))
+                for longitude in ['179.5', '-179.5', '0.0', '175.0']:
+                    target.write(f"9566148;WINDSUPPLIER;Passenger;2012-01-01 00:00:00.000;1.0;{longitude};Moored;"
+                                 f"151;2;0;ESBJERG;9999-12-31 23:59:59.000\n")
+            dataset = ShipRadarDataset.from_csv(file)
+            reader = ShipRadarCSVReader(file)
+            crossing = ShipRadarFilter('coords', 178.0, 0.0, -178.0, 2.0, True)
+            plain = ShipRadarFilter('coords', 178.0, 0.0, -178.0, 2.0)
+            np.testing.assert_array_equal(dataset.select([crossing]), [0, 1], "Failed test: dataset antimeridian")
+            np.testing.assert_array_equal(dataset.select([plain]), [2, 3], "Failed test: dataset antimeridian")
+            np.testing.assert_array_equal(reader.parse_ids(crossing), [0, 1], "Failed test: CSV antimeridian")
+            np.testing.assert_array_equal(np.flatnonzero(dataset.mask(crossing)), [0, 1],
+                                          "Failed test: dataset antimeridian mask")
+
+    def test_null_result_filter(self):
+        """
+        Test for filter that returns no results
+        :return:
+        """
+        with self.assertRaises(err.ShipRadarFilterError) as exc:
+            self.dataset.select([ShipRadarFilter('ship_name', 'DefinitelyNotTest')])
+        self.assertTrue("No entries for these filters: ship_name: DefinitelyNotTest" in str(exc.exception))
+
+    def test_nonexistent_file(self):
+        """
+        Test for nonexistent file
+        :return:
+        """
+        with self.assertRaises(err.ShipRadarImportError) as exc:
+            ShipRadarDataset.from_csv('not_data.csv')
+        self.assertTrue("No file not_data.csv" in str(exc.exception), "Failed test: dataset nonexistent file")
+
+    def test_parallel(self):
+        """
+        Test for reading the file with worker processes, columns must be identical to the serial ones
+        :return:
+        """
+        with mock.patch.object(ShipRadarCSVReader, 'PARALLEL_THRESHOLD', 0):
+            dataset = ShipRadarDataset.from_csv('baza_reduced.csv', workers=3)
+        pd.testing.assert_frame_equal(dataset.frame.astype(str), self.dataset.frame.astype(str))
+        self.assertEqual(dataset.fingerprint, self.dataset.fingerprint, "Failed test: dataset parallel\nFingerprint")
+        for filter_obj in self.FILTERS:
+            with self.subTest(filter=filter_obj):
+                np.testing.assert_array_equal(dataset.select([filter_obj]), self.dataset.select([filter_obj]),
+                                              "Failed test: dataset parallel")
+
+    def test_cache(self):
+        """
+        Test for loading the dataset from cache and invalidating it when the file changes
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            shutil.copy('baza_reduced.csv', file)
+            cache = ShipRadarFileCache(os.path.join(directory, 'cache'))
+            os.makedirs(cache.cache_dir)
+            meta = cache.describe(file)
+            self.assertIsNone(cache.lookup(file, meta), "Failed test: dataset cache exists before loading")
+
+            first = ShipRadarDataset.from_csv(file, cache)
+            self.assertIsNotNone(cache.lookup(file, meta), "Failed test: dataset cache not written")
+            second = ShipRadarDataset.from_csv(file, cache)
+            pd.testing.assert_frame_equal(first.frame, second.frame)
+            self.assertEqual(first.fingerprint, second.fingerprint, "Failed test: dataset cache fingerprint")
+
+            # Appending to the file invalidates the cache
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write("\n9566148;WINDSUPPLIER;Passenger;2014-09-01 00:00:00.000;55.4;8.4;Moored;151;2;0;"
+                              "ESBJERG;9999-12-31 23:59:59.000\n")
+            self.assertIsNone(cache.lookup(file, cache.describe(file)), "Failed test: dataset cache not invalidated")
+            third = ShipRadarDataset.from_csv(file, cache)
+            self.assertEqual(len(third), len(first) + 1, "Failed test: dataset cache not reloaded")
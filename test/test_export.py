@@ -0,0 +1,109 @@
+"""
+Tests for export.py module
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from src import err
+from src.dataset import ShipRadarDataset
+from src.export import ShipRadarExporter, file_name, main, parse_filter, read_queries
+from src.reader import ShipRadarFilter
+from src.render import ShipRadarRenderer
+from test_render import fake_render
+
+
+class TestExport(unittest.TestCase):
+    """
+    Tests for ShipRadarExporter class and the export command
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = ShipRadarDataset.from_csv('baza_reduced.csv')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_filter(self):
+        """
+        Test for filters of queries files
+        :return:
+        """
+        self.assertEqual(parse_filter(["date", "2011-12-31 10:57:13", "2012-01-01 20:57:14"]),
+                         ShipRadarFilter('date', datetime(2011, 12, 31, 10, 57, 13), datetime(2012, 1, 1, 20, 57, 14)),
+                         "Failed test: export parse filter\nDate")
+        self.assertEqual(parse_filter(["speed", None, 0.5]), ShipRadarFilter('speed', None, 0.5),
+                         "Failed test: export parse filter\nRange")
+        for spec in [[], ["date", "yesterday", "today"], ["sunk"]]:
+            with self.subTest(spec=spec):
+                with self.assertRaises(err.ShipRadarFilterError, msg="Failed test: export parse filter\nInvalid"):
+                    parse_filter(spec)
+        self.assertEqual(file_name("SILUNA ACE / 2012"), "SILUNA_ACE_2012", "Failed test: export file name")
+
+    def test_export(self):
+        """
+        Test for exporting maps in worker processes
+        :return:
+        """
+        queries = os.path.join(self.directory, "queries.json")
+        with open(queries, 'w', encoding='utf-8') as file:
+            json.dump([{"name": "passenger", "filters": [["ship_type", "Passenger"]]},
+                       {"name": "nowhere", "filters": [["destination", "ATLANTIS"]]}], file)
+        maps = [("9566148", [ShipRadarFilter('ship_no', 9566148)])] + read_queries(queries)
+        exporter = ShipRadarExporter(self.dataset, os.path.join(self.directory, "maps"), 'svg', 640, 480,
+                                     renderer=ShipRadarRenderer(workers=2, function=fake_render))
+        try:
+            paths = exporter.export(maps)
+        finally:
+            exporter.renderer.close()
+        self.assertEqual(sorted(map(os.path.basename, paths)), ["9566148.svg", "passenger.svg"],
+                         "Failed test: export\nFiles")
+        with open(paths[0], 'rb') as file:
+            self.assertTrue(file.read().startswith(b"640x480.svg"), "Failed test: export\nContent")
+        self.assertEqual([name for name, _ in exporter.failed], ["nowhere"], "Failed test: export\nFailed")
+        self.assertIn("Exported 2 maps", exporter.summary(), "Failed test: export\nSummary")
+
+    def test_export_failures(self):
+        """
+        Test for maps whose renders crash a worker or never finish
+        :return:
+        """
+        maps = [("9566148", [ShipRadarFilter('ship_no', 9566148)]),
+                ("passenger", [ShipRadarFilter('ship_type', 'Passenger')])]
+        exporter = ShipRadarExporter(self.dataset, os.path.join(self.directory, "crashed"), width=-1,
+                                     renderer=ShipRadarRenderer(workers=1, function=fake_render))
+        try:
+            self.assertEqual(exporter.export(maps), [], "Failed test: export failures\nCrashed")
+            self.assertEqual(sorted(name for name, _ in exporter.failed), ["9566148", "passenger"],
+                             "Failed test: export failures\nCrashed maps")
+        finally:
+            exporter.renderer.close()
+
+        exporter = ShipRadarExporter(self.dataset, os.path.join(self.directory, "slow"), width=1,
+                                     renderer=ShipRadarRenderer(workers=1, function=fake_render))
+        exporter.timeout = 0.5
+        start = time.perf_counter()
+        try:
+            self.assertEqual(exporter.export(maps), [], "Failed test: export failures\nTimed out")
+            self.assertTrue(all("timed out" in reason for _, reason in exporter.failed),
+                            "Failed test: export failures\nTimed out maps")
+            self.assertLess(time.perf_counter() - start, 5, "Failed test: export failures\nExport waited")
+        finally:
+            exporter.renderer.close()
+        self.assertLess(time.perf_counter() - start, 10, "Failed test: export failures\nClose waited for workers")
+
+    def test_main(self):
+        """
+        Test for errors of the export command
+        :return:
+        """
+        self.assertEqual(main(['missing.csv', '--ships', '9566148']), 2, "Failed test: export main\nNo file")
+        with self.assertRaises(SystemExit, msg="Failed test: export main\nNo maps"):
+            main(['baza_reduced.csv'])
@@ -0,0 +1,165 @@
+"""
+Tests for figure.py module
+"""
+
+import unittest
+from time import perf_counter
+import numpy as np
+from src.dataset import ShipRadarDataset
+from src.figure import ShipRadarAnimation, ShipRadarFigureBuilder, bounds, density, runs
+from src.reader import ShipRadarFilter
+from src.track import ShipRadarTrack
+
+COLORS = [(1.0, 0.0, 0.0), (0.0, 0.0, 1.0)]
+
+
+class TestFigure(unittest.TestCase):
+    """
+    Tests for ShipRadarFigureBuilder class
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = ShipRadarDataset.from_csv('baza_reduced.csv')
+        cls.tracks = cls.dataset.tracks(cls.dataset.select([ShipRadarFilter('ship_type', 'Passenger')]))
+
+    def test_bounds(self):
+        """
+        Test for the bounding box of tracks
+        :return:
+        """
+        latitudes = np.concatenate([track["Latitude"] for track in self.tracks])
+        longitudes = np.concatenate([track["Longitude"] for track in self.tracks])
+        self.assertEqual(bounds(self.tracks), (longitudes.min(), latitudes.min(), longitudes.max(), latitudes.max()),
+                         "Failed test: figure bounds")
+
+    def test_runs(self):
+        """
+        Test for splitting tracks into runs of the same text columns
+        :return:
+        """
+        for track in self.tracks:
+            with self.subTest(ship_no=track.ship_no):
+                positions = list(runs(track))
+                self.assertEqual(positions[0][0], 0, "Failed test: figure runs\nStart")
+                self.assertEqual(positions[-1][1], len(track), "Failed test: figure runs\nEnd")
+                for (_, end), (start, _) in zip(positions[:-1], positions[1:]):
+                    self.assertEqual(end, start, "Failed test: figure runs\nGap")
+                for start, end in positions:
+                    self.assertTrue((track["MoveStatus"][start:end] == track["MoveStatus"][start]).all(),
+                                    "Failed test: figure runs\nMixed")
+
+    def test_build(self):
+        """
+        Test for traces of a figure
+        :return:
+        """
+        figure = ShipRadarFigureBuilder().build(self.tracks, COLORS)
+        lines = [trace for trace in figure.data if trace.mode == 'lines']
+        markers = [trace for trace in figure.data if trace.mode == 'markers']
+        self.assertEqual(len(lines), len(self.tracks), "Failed test: figure build\nLines")
+        self.assertEqual(sum(len(trace.lat) for trace in markers), sum(map(len, self.tracks)),
+                         "Failed test: figure build\nMarkers")
+        self.assertEqual(sum(bool(trace.showlegend) for trace in figure.data), len(self.tracks),
+                         "Failed test: figure build\nLegend")
+        self.assertIn("SILUNA ACE", markers[-1].hovertemplate, "Failed test: figure build\nHover")
+        self.assertEqual(markers[0].customdata.shape, (len(markers[0].lat), 3), "Failed test: figure build\nData")
+
+        hidden = ShipRadarFigureBuilder(show_lines=False, tolerance=0.01).build(self.tracks, COLORS)
+        self.assertFalse(any(trace.visible for trace in hidden.data if trace.mode == 'lines'),
+                         "Failed test: figure build\nHidden lines")
+        self.assertLess(sum(len(trace.lat) for trace in hidden.data if trace.mode == 'markers'),
+                        sum(map(len, self.tracks)), "Failed test: figure build\nSimplified")
+
+    def test_many_runs(self):
+        """
+        Test for merging runs into a trace of markers per ship when a figure has too many of them
+        :return:
+        """
+        # Move status changing every 16 positions, thousands of runs as in a busy selection
+        tracks = []
+        for track in self.tracks:
+            columns = {column: np.tile(values, 250) for column, values in track.columns.items()}
+            positions = np.arange(len(track) * 250)
+            columns["MoveStatus"] = np.where(positions // 16 % 2, "Under way using engine", "Moored").astype(object)
+            tracks.append(ShipRadarTrack(track.ship_no, columns, positions))
+        self.assertGreater(sum(len(list(runs(track))) for track in tracks), 7000, "Failed test: figure many runs\nRuns")
+
+        start = perf_counter()
+        figure = ShipRadarFigureBuilder(webgl_threshold=None).build(tracks, COLORS)
+        self.assertLess(perf_counter() - start, 5, "Failed test: figure many runs\nTime")
+        markers = [trace for trace in figure.data if trace.mode == 'markers']
+        self.assertEqual(len(markers), len(tracks), "Failed test: figure many runs\nTraces")
+        self.assertEqual(sum(len(trace.lat) for trace in markers), sum(map(len, tracks)),
+                         "Failed test: figure many runs\nMarkers")
+        self.assertNotIn("Move status", markers[0].hovertemplate, "Failed test: figure many runs\nHover")
+
+        builder = ShipRadarFigureBuilder(webgl_threshold=None)
+        builder.max_runs = 10 ** 6
+        figure = builder.build(tracks, COLORS)
+        self.assertEqual(len(figure.data), len(tracks) + sum(len(list(runs(track))) for track in tracks),
+                         "Failed test: figure many runs\nTrace per run")
+        figure.update_layout(title="Exported")
+        self.assertEqual(figure.layout.title.text, "Exported", "Failed test: figure many runs\nLayout validated")
+
+    def test_webgl(self):
+        """
+        Test for switching to WebGL traces above the threshold of points
+        :return:
+        """
+        points = sum(map(len, self.tracks))
+        for threshold, expected in [(None, 'scattergeo'), (points, 'scattergeo'), (points - 1, 'scattermapbox'),
+                                    (0, 'scattermapbox')]:
+            with self.subTest(threshold=threshold):
+                figure = ShipRadarFigureBuilder(webgl_threshold=threshold).build(self.tracks, COLORS)
+                self.assertEqual({trace.type for trace in figure.data}, {expected}, "Failed test: figure WebGL")
+        figure = ShipRadarFigureBuilder(webgl_threshold=0).build(self.tracks, COLORS)
+        self.assertGreater(figure.layout.mapbox.zoom, 0, "Failed test: figure WebGL\nZoom")
+        self.assertAlmostEqual(figure.layout.mapbox.center.lat, sum(bounds(self.tracks)[1::2]) / 2, 6,
+                               "Failed test: figure WebGL\nCenter")
+
+    def test_density(self):
+        """
+        Test for counting positions in cells of a grid
+        :return:
+        """
+        longitudes = np.array([0.0, 0.1, 0.9, 1.9, 2.0])
+        latitudes = np.array([0.0, 0.2, 0.1, 0.9, 1.0])
+        lon_cells, lat_cells, counts = density(longitudes, latitudes, (0.0, 0.0, 2.0, 1.0), 2)
+        self.assertEqual(sorted(zip(lon_cells.tolist(), lat_cells.tolist(), counts.tolist())),
+                         [(0.5, 0.5, 3), (1.5, 0.5, 2)], "Failed test: figure density")
+
+        figure = ShipRadarFigureBuilder().build_density(self.tracks)
+        self.assertEqual(len(figure.data), 1, "Failed test: figure density\nTraces")
+        self.assertEqual(figure.data[0].customdata.sum(), sum(map(len, self.tracks)),
+                         "Failed test: figure density\nSum")
+        by_type = ShipRadarFigureBuilder().build_density(self.dataset.tracks(np.arange(len(self.dataset))), True)
+        self.assertEqual({trace.name for trace in by_type.data}, {"Passenger", "Cargo", "N/A"},
+                         "Failed test: figure density\nTypes")
+        self.assertEqual(sum(trace.customdata.sum() for trace in by_type.data), len(self.dataset),
+                         "Failed test: figure density\nTypes sum")
+
+    def test_animation(self):
+        """
+        Test for frames of positions within a time window
+        :return:
+        """
+        window = np.timedelta64(2, 'h')
+        animation = ShipRadarAnimation(self.tracks, window)
+        self.assertTrue((animation.times[:-1] <= animation.times[1:]).all(), "Failed test: figure animation\nSorted")
+        for time in [animation.start, animation.start + window, animation.end, animation.end + window]:
+            with self.subTest(time=time):
+                frame = animation.frame(time)
+                self.assertEqual(len(frame), len(self.tracks), "Failed test: figure animation\nTracks")
+                for track, (longitudes, latitudes) in zip(self.tracks, frame):
+                    times = track["MovementDateTime"].astype('datetime64[ms]')
+                    shown = (times >= time - window) & (times <= time)
+                    self.assertEqual(longitudes.tolist(), track["Longitude"][shown].tolist(),
+                                     "Failed test: figure animation\nLongitudes")
+                    self.assertEqual(latitudes.tolist(), track["Latitude"][shown].tolist(),
+                                     "Failed test: figure animation\nLatitudes")
+
+        figure = ShipRadarFigureBuilder().build_animation(self.tracks, COLORS, animation)
+        self.assertEqual(len(figure.data), len(self.tracks), "Failed test: figure animation\nTraces")
+        animation.show(figure, animation.end)
+        self.assertEqual(len(figure.data[0].lat), len(animation.frame(animation.end)[0][1]),
+                         "Failed test: figure animation\nShow")
@@ -4,8 +4,13 @@ Tests for reader.py module - filters
 
 import unittest
 import ast
+import csv
+import os
+import tempfile
 from datetime import datetime
+import numpy as np
 from src import err
+from src.dataset import ShipRadarDataset
 from src.reader import ShipRadarFilter, ShipRadarCSVReader
 
 
@@ -97,6 +102,114 @@ class TestReadFilters(unittest.TestCase):
                 expected = ast.literal_eval(line)
         self.assertEqual(reader.parse(filters), expected, "Failed test: CSV filter speed")
 
+    def test_ranges(self):
+        """
+        Test for range filters on heading, draught and speed
+        :return:
+        """
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        with open('baza_reduced.csv', encoding='utf-8') as csvfile:
+            rows = list(csv.DictReader(csvfile, delimiter=';'))
+        cases = [
+            (ShipRadarFilter('speed', 15.0, None), lambda row: float(row["Speed"].replace(",", ".")) >= 15.0),
+            (ShipRadarFilter('draught', 2.0, 5.0), lambda row: 2.0 <= float(row["Draught"].replace(",", ".")) <= 5.0),
+            (ShipRadarFilter('heading', 350, 10), lambda row: 350 <= int(row["Heading"]) <= 359 or
+             int(row["Heading"]) <= 10),
+            (ShipRadarFilter('heading', None, 90), lambda row: int(row["Heading"]) <= 90),
+        ]
+        for filter_obj, predicate in cases:
+            with self.subTest(filter=filter_obj.type, bounds=filter_obj.filter):
+                expected = [row for row in rows if predicate(row)]
+                self.assertTrue(expected, "Failed test: CSV filter range\nNo rows in range")
+                self.assertEqual(reader.parse(filter_obj), expected, "Failed test: CSV filter range")
+        # 511 means the heading is not available
+        self.assertFalse(ShipRadarFilter('heading', 350, 10).match({"Heading": "511"}),
+                         "Failed test: CSV filter range\nHeading not available")
+
+    def test_heading_not_available(self):
+        """
+        Test for heading 511 (not available) matching no heading filter, also with an unbounded side
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            with open('baza_reduced.csv', encoding='utf-8') as source, open(file, 'w', encoding='utf-8') as target:
+                target.write(next(source))
+                for heading in ['511', '0', '90', '355']:
+                    target.write(f"9566148;WINDSUPPLIER;Passenger;2012-01-01 00:00:00.000;55.0;8.0;Moored;"
+                                 f"{heading};2;0;ESBJERG;9999-12-31 23:59:59.000\n")
+            dataset = ShipRadarDataset.from_csv(file)
+            reader = ShipRadarCSVReader(file)
+            cases = [
+                (ShipRadarFilter('heading', 300, None), [3]),
+                (ShipRadarFilter('heading', None, 100), [1, 2]),
+                (ShipRadarFilter('heading', 350, 10), [1, 3]),
+                (ShipRadarFilter('heading', 0, 600), [1, 2, 3]),
+            ]
+            for filter_obj, expected in cases:
+                with self.subTest(bounds=filter_obj.filter):
+                    self.assertFalse(filter_obj.match({"Heading": "511"}),
+                                     "Failed test: heading not available\nCSV row matched")
+                    np.testing.assert_array_equal(reader.parse_ids(filter_obj), expected,
+                                                  "Failed test: heading not available\nCSV record matched")
+                    np.testing.assert_array_equal(np.flatnonzero(dataset.mask(filter_obj)), expected,
+                                                  "Failed test: heading not available\nDataset mask")
+                    np.testing.assert_array_equal(dataset.lookup(filter_obj), expected,
+                                                  "Failed test: heading not available\nDataset index")
+            self.assertFalse(dataset.mask(ShipRadarFilter('heading', 511)).any(),
+                             "Failed test: heading not available\nSingle value matched")
+
+    def test_range_without_bounds(self):
+        """
+        Test for range filter with both sides unbounded
+        :return:
+        """
+        with self.assertRaises(err.ShipRadarFilterError) as exc:
+            _ = ShipRadarFilter('speed', None, None)
+        self.assertTrue('No bounds given' in str(exc.exception))
+
+    def test_equality(self):
+        """
+        Test for comparing and hashing filters by value
+        :return:
+        """
+        self.assertEqual(ShipRadarFilter('speed', 15.0, None), ShipRadarFilter('speed', 15.0, None))
+        self.assertEqual(hash(ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0)),
+                         hash(ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0, False)))
+        self.assertNotEqual(ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0),
+                            ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0, True))
+        self.assertNotEqual(ShipRadarFilter('ship_name', 'ESBJERG'), ShipRadarFilter('destination', 'ESBJERG'))
+        self.assertEqual(len({ShipRadarFilter('ship_no', 9295490), ShipRadarFilter('ship_no', 9295490)}), 1)
+
+    def test_narrows(self):
+        """
+        Test for checking if a filter is at least as strict as another one
+        :return:
+        """
+        day = datetime.fromisoformat('2012-01-01 00:00:00.000')
+        night = datetime.fromisoformat('2012-01-01 12:00:00.000')
+        year = datetime.fromisoformat('2013-01-01 00:00:00.000')
+        cases = [
+            (ShipRadarFilter('date', day, night), ShipRadarFilter('date', day, year), True),
+            (ShipRadarFilter('date', day, year), ShipRadarFilter('date', day, night), False),
+            (ShipRadarFilter('coords', 9.0, 55.0, 10.0, 55.5), ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0), True),
+            (ShipRadarFilter('coords', 7.0, 55.0, 10.0, 55.5), ShipRadarFilter('coords', 8.0, 55.0, 11.0, 56.0), False),
+            (ShipRadarFilter('coords', 179.0, 0.0, -179.0, 1.0, True),
+             ShipRadarFilter('coords', 178.0, 0.0, -178.0, 2.0, True), True),
+            (ShipRadarFilter('speed', 20.0, None), ShipRadarFilter('speed', 15.0, None), True),
+            (ShipRadarFilter('speed', 20.0), ShipRadarFilter('speed', 15.0, 25.0), True),
+            (ShipRadarFilter('speed', None, 20.0), ShipRadarFilter('speed', 15.0, None), False),
+            (ShipRadarFilter('heading', 355, 5), ShipRadarFilter('heading', 350, 10), True),
+            (ShipRadarFilter('heading', 0, 5), ShipRadarFilter('heading', 350, 10), True),
+            (ShipRadarFilter('heading', 340, 5), ShipRadarFilter('heading', 350, 10), False),
+            (ShipRadarFilter('ship_name', 'WINDSUPPLIER'), ShipRadarFilter('ship_name', 'WINDSUPPLIER'), True),
+            (ShipRadarFilter('ship_name', 'WINDSUPPLIER'), ShipRadarFilter('ship_name', 'SILUNA ACE'), False),
+            (ShipRadarFilter('ship_name', 'WINDSUPPLIER'), ShipRadarFilter('destination', 'WINDSUPPLIER'), False),
+        ]
+        for narrow, broad, expected in cases:
+            with self.subTest(narrow=narrow, broad=broad):
+                self.assertEqual(narrow.narrows(broad), expected, "Failed test: filter narrows")
+
     def test_destination(self):
         """
         Test for destination filter
@@ -3,9 +3,18 @@ Tests for reader.py module - CSV reader
 """
 
 import ast
+import os
+import shutil
+import tempfile
 import unittest
+from datetime import datetime
+from unittest import mock
+import pandas as pd
 from src import err
-from src.reader import ShipRadarFilter, ShipRadarCSVReader
+from src.cache import file_fingerprint
+from src.dataset import ShipRadarDataset
+from src.reader import HEADER, ShipRadarFilter, ShipRadarCSVReader, intersect_row_ids
+from src.record import ShipRadarRecord
 
 
 class TestCSVReader(unittest.TestCase):
@@ -36,10 +45,213 @@ class TestCSVReader(unittest.TestCase):
             for line in f:
                 expected = ast.literal_eval(line)
         real = reader.and_collectors(collectors)
-        # The order is inconsistent, so we compare the lengths and then the contents
-        self.assertEqual(len(real), len(expected), "Failed test: CSV and_collectors\nLengths do not match")
+        # Rows are matched by position, so duplicated rows in the file are all kept
         for item in real:
             self.assertIn(item, expected, "Failed test: CSV and_collectors\nContents do not match")
+        for item in expected:
+            self.assertIn(item, real, "Failed test: CSV and_collectors\nContents do not match")
+        # Rows are returned in file order
+        self.assertEqual([item.row_id for item in real], sorted(item.row_id for item in real),
+                         "Failed test: CSV and_collectors\nOrder does not match")
+        self.assertEqual(real, reader.parse_many([filters, filters2]),
+                         "Failed test: CSV and_collectors\nResult differs from parse_many")
+
+    def test_parse_ids(self):
+        """
+        Test for parse ids, intersect row ids and read rows methods
+        :return:
+        """
+        filters = ShipRadarFilter('ship_name', 'SILUNA ACE')
+        filters2 = ShipRadarFilter('ship_type', 'Passenger')
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        ids = intersect_row_ids([reader.parse_ids(filters), reader.parse_ids(filters2)])
+        self.assertEqual(reader.read_rows(ids), reader.parse_many([filters, filters2]),
+                         "Failed test: CSV parse_ids")
+
+    def test_parse_many(self):
+        """
+        Test for parse many method, single pass with multiple filters
+        :return:
+        """
+        filters = ShipRadarFilter('ship_name', 'SILUNA ACE')
+        filters2 = ShipRadarFilter('ship_type', 'Passenger')
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        with open('expected/and_collectors_test.txt', encoding='utf-8') as f:
+            for line in f:
+                expected = ast.literal_eval(line)
+        real = reader.parse_many([filters, filters2])
+        # The file contains duplicated rows, which and_collectors merges, so the contents are compared both ways
+        for item in real:
+            self.assertIn(item, expected, "Failed test: CSV parse_many\nContents do not match")
+        for item in expected:
+            self.assertIn(item, real, "Failed test: CSV parse_many\nContents do not match")
+        # Rows are returned in file order, same as with a single filter
+        self.assertEqual(real, [row for row in reader.parse(filters) if row in expected],
+                         "Failed test: CSV parse_many\nOrder does not match")
+
+    def test_parse_many_no_filters(self):
+        """
+        Test for parse many method without any filters
+        :return:
+        """
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        with self.assertRaises(err.ShipRadarFilterError) as exc:
+            reader.parse_many([])
+        self.assertTrue("No filters given" in str(exc.exception), "Failed test: CSV parse_many no filters")
+
+    def test_iter_parse(self):
+        """
+        Test for iter parse method, rows yielded lazily in chunks
+        :return:
+        """
+        filters = ShipRadarFilter('ship_name', 'WINDSUPPLIER')
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        expected = reader.parse(filters)
+        chunks = list(reader.iter_parse(filters, chunk_size=100))
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks), "Failed test: CSV iter_parse\nChunk too big")
+        self.assertEqual([row for chunk in chunks for row in chunk], expected, "Failed test: CSV iter_parse")
+        with self.assertRaises(err.ShipRadarFilterError):
+            next(reader.iter_parse(ShipRadarFilter('ship_name', 'DefinitelyNotTest')))
+
+    def test_and_collectors_streaming(self):
+        """
+        Test for and collectors method with generators as collectors
+        :return:
+        """
+        filters = ShipRadarFilter('ship_name', 'SILUNA ACE')
+        filters2 = ShipRadarFilter('ship_type', 'Passenger')
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        real = reader.and_collectors([reader.iter_parse(filters), reader.iter_parse(filters2)])
+        self.assertEqual(real, reader.parse_many([filters, filters2]), "Failed test: CSV and_collectors streaming")
+
+    def test_parallel(self):
+        """
+        Test for parsing with worker processes, result must be identical to the serial one
+        :return:
+        """
+        filters = ShipRadarFilter('ship_name', 'SILUNA ACE')
+        filters2 = ShipRadarFilter('speed', 0.0)
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        parallel_reader = ShipRadarCSVReader('baza_reduced.csv', workers=2)
+        parallel_reader.PARALLEL_THRESHOLD = 0
+        expected = reader.parse_many([filters, filters2])
+        real = parallel_reader.parse_many([filters, filters2])
+        self.assertEqual(real, expected, "Failed test: CSV parallel")
+        self.assertEqual([row.row_id for row in real], [row.row_id for row in expected],
+                         "Failed test: CSV parallel\nRow ids do not match")
+
+    def test_parallel_empty_file(self):
+        """
+        Test for scanning an empty file with worker processes
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            with open(file, 'w', encoding='utf-8'):
+                pass
+            reader = ShipRadarCSVReader(file, workers=2)
+            reader.PARALLEL_THRESHOLD = 0
+            with self.assertRaises(err.ShipRadarImportError, msg="Failed test: CSV parallel empty file"):
+                reader.parse(ShipRadarFilter('speed', 0.0))
+
+    def test_iter_records(self):
+        """
+        Test for iter records method, rows parsed into typed records
+        :return:
+        """
+        filters = ShipRadarFilter('date',
+                                  datetime.fromisoformat('2011-12-31 10:57:13.000'),
+                                  datetime.fromisoformat('2012-01-01 20:57:14.000'))
+        filters2 = ShipRadarFilter('speed', 0.0)
+        reader = ShipRadarCSVReader('baza_reduced.csv')
+        records = list(reader.iter_records([filters, filters2]))
+        rows = reader.parse_many([filters, filters2])
+        self.assertEqual([record.row_id for record in records], [row.row_id for row in rows],
+                         "Failed test: CSV iter_records")
+        self.assertEqual(records[0]["ShipName"], rows[0]["ShipName"], "Failed test: CSV iter_records\nName")
+        self.assertEqual(records[0].latitude, float(rows[0]["Latitude"]), "Failed test: CSV iter_records\nLatitude")
+        self.assertEqual(records[0].eta, datetime.fromisoformat(rows[0]["ETA"]), "Failed test: CSV iter_records\nETA")
+
+    def test_follow(self):
+        """
+        Test for reading rows appended to a followed file
+        :return:
+        """
+        row = "9566148;WINDSUPPLIER;Passenger;2014-09-01 00:00:00.000;55.4;8.4;Moored;151;2;0;ESBJERG;" \
+              "9999-12-31 23:59:59.000"
+        positions = {column: ind for ind, column in enumerate(HEADER)}
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            shutil.copy('baza_reduced.csv', file)
+            reader = ShipRadarCSVReader(file)
+            reader.follow()
+            self.assertEqual(reader.read_appended(), [], "Failed test: CSV follow\nNothing appended")
+
+            # The file doesn't end with a newline, the line being written is read once it's complete
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write(f"\n{row}\n{row[:20]}")
+            self.assertEqual(reader.read_appended(), [ShipRadarRecord.from_values(0, row.split(';'), positions)],
+                             "Failed test: CSV follow\nAppended")
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write(f"{row[20:]}\n")
+            self.assertEqual(reader.read_appended(), [ShipRadarRecord.from_values(1, row.split(';'), positions)],
+                             "Failed test: CSV follow\nCompleted line")
+            self.assertEqual(reader.offset, os.path.getsize(file), "Failed test: CSV follow\nOffset")
+
+            # A row that can't be parsed leaves all appended lines for the next call
+            offset = reader.offset
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write(f"{row}\n{row.replace('55.4', 'north')}\n")
+            with self.assertRaises(err.ShipRadarImportError, msg="Failed test: CSV follow\nWrong value"):
+                reader.read_appended()
+            self.assertEqual((reader.offset, reader.appended), (offset, 2),
+                             "Failed test: CSV follow\nLines consumed by failed call")
+
+            # Rotated file, a new one with the same name
+            shutil.copy('baza_reduced.csv', os.path.join(directory, 'rotated.csv'))
+            os.replace(os.path.join(directory, 'rotated.csv'), file)
+            self.assertIsNone(reader.read_appended(), "Failed test: CSV follow\nRotation")
+
+            # Truncated file
+            reader.follow()
+            with open(file, 'r+', encoding='utf-8') as csvfile:
+                csvfile.truncate(1000)
+            self.assertIsNone(reader.read_appended(), "Failed test: CSV follow\nTruncation")
+
+    def test_follow_dataset(self):
+        """
+        Test for following a file from the end of its dataset, a line being written is left to the follower, as are
+        rows appended after the file is read
+        :return:
+        """
+        row = "9566148;WINDSUPPLIER;Passenger;2014-09-01 00:00:00.000;55.4;8.4;Moored;151;2;0;ESBJERG;" \
+              "9999-12-31 23:59:59.000"
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'data.csv')
+            shutil.copy('baza_reduced.csv', file)
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write(f"\n{row}\n{row[:20]}")
+            dataset = ShipRadarDataset.from_csv(file, complete_lines=True)
+            self.assertEqual(len(dataset), len(ShipRadarDataset.from_csv('baza_reduced.csv')) + 1,
+                             "Failed test: CSV follow dataset\nRows")
+            self.assertEqual(dataset.offset, os.path.getsize(file) - 20, "Failed test: CSV follow dataset\nOffset")
+            self.assertNotEqual(dataset.fingerprint, file_fingerprint(file),
+                                "Failed test: CSV follow dataset\nFingerprint of the whole file")
+            with mock.patch.object(ShipRadarCSVReader, 'PARALLEL_THRESHOLD', 0):
+                parallel = ShipRadarDataset.from_csv(file, workers=2, complete_lines=True)
+            pd.testing.assert_frame_equal(parallel.frame.astype(str), dataset.frame.astype(str))
+            self.assertEqual(parallel.fingerprint, dataset.fingerprint,
+                             "Failed test: CSV follow dataset\nParallel fingerprint")
+
+            # Rows written between reading the file and following it are not lost
+            with open(file, 'a', encoding='utf-8') as csvfile:
+                csvfile.write(f"{row[20:]}\n{row}\n")
+            reader = ShipRadarCSVReader(file)
+            reader.follow(dataset.offset)
+            dataset.append(reader.read_appended())
+            reloaded = ShipRadarDataset.from_csv(file, complete_lines=True)
+            self.assertEqual(reloaded.offset, os.path.getsize(file), "Failed test: CSV follow dataset\nWhole file")
+            pd.testing.assert_frame_equal(dataset.frame.astype(str), reloaded.frame.astype(str))
 
     def test_divide_collectors(self):
         """
@@ -0,0 +1,122 @@
+"""
+Tests for render.py module
+"""
+
+import os
+import time
+import unittest
+import plotly.graph_objects as go
+from src import err
+from src.render import ShipRadarRenderer
+
+
+def fake_render(figure: str, width: int, height: int, image_format: str) -> bytes:
+    """
+    Stands in for kaleido, returns the size, the format and the process of the render instead of an image
+    """
+    if width == 0:
+        raise err.ShipRadarRenderError("Rendering failed: no width")
+    if width < 0:
+        # Kills the worker, as a crash of kaleido would
+        os._exit(1)
+    if width == 1:
+        # Hangs, as a stuck kaleido would
+        time.sleep(60)
+    return f"{width}x{height}.{image_format}:{os.getpid()}:{len(figure)}".encode()
+
+
+class TestRender(unittest.TestCase):
+    """
+    Tests for ShipRadarRenderer class
+    """
+    def setUp(self):
+        self.renderer = ShipRadarRenderer(workers=2, function=fake_render)
+        self.figure = go.Figure(data=[go.Scattergeo(lat=[55.0, 56.0], lon=[8.0, 9.0])])
+
+    def tearDown(self):
+        self.renderer.close()
+
+    def test_render(self):
+        """
+        Test for rendering figures in worker processes
+        :return:
+        """
+        image = self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        size, pid, _ = image.decode().split(':')
+        self.assertEqual(size, "800x600.png", "Failed test: render")
+        self.assertNotEqual(int(pid), os.getpid(), "Failed test: render\nNot in a worker")
+        with self.assertRaises(err.ShipRadarRenderError, msg="Failed test: render\nFormat"):
+            self.renderer.render(self.figure, 800, 600, 'bmp')
+        with self.assertRaises(err.ShipRadarRenderError, msg="Failed test: render\nFailure"):
+            self.renderer.render(self.figure, 0, 600).result(timeout=30)
+
+    def test_cache(self):
+        """
+        Test for reusing images of the same figure and size
+        :return:
+        """
+        first = self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.assertEqual(self.renderer.render(self.figure, 800, 600).result(timeout=30), first,
+                         "Failed test: render cache")
+        self.assertEqual((self.renderer.hits, self.renderer.misses), (1, 1), "Failed test: render cache\nCounters")
+
+        self.renderer.render(self.figure, 1024, 600).result(timeout=30)
+        self.figure.update_traces(mode='markers')
+        self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.assertEqual((self.renderer.hits, self.renderer.misses), (1, 3), "Failed test: render cache\nKeys")
+        self.assertEqual(len(self.renderer), 3, "Failed test: render cache\nLength")
+
+    def test_cache_eviction(self):
+        """
+        Test for evicting least recently used images over the budget
+        :return:
+        """
+        image = self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.renderer.budget = 2 * len(image)
+        self.renderer.render(self.figure, 801, 600).result(timeout=30)
+        self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.renderer.render(self.figure, 802, 600).result(timeout=30)
+        self.assertEqual(len(self.renderer), 2, "Failed test: render cache eviction")
+        self.assertLessEqual(self.renderer.size, self.renderer.budget, "Failed test: render cache eviction\nSize")
+        self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.assertEqual(self.renderer.hits, 2, "Failed test: render cache eviction\nRecently used kept")
+
+    def test_worker_crash(self):
+        """
+        Test for a worker dying while rendering, the next render starts new workers
+        :return:
+        """
+        with self.assertRaises(err.ShipRadarRenderError, msg="Failed test: render worker crash"):
+            self.renderer.render(self.figure, -1, 600).result(timeout=30)
+        image = self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.assertTrue(image.startswith(b"800x600.png"), "Failed test: render worker crash\nRecovered")
+
+    def test_snapshot(self):
+        """
+        Test for serializing the figure before render returns, changes made right after aren't rendered
+        :return:
+        """
+        future = self.renderer.render(self.figure, 800, 600)
+        expected = len(self.figure.to_json())
+        self.figure.update_traces(mode='markers')
+        self.assertEqual(int(future.result(timeout=30).decode().split(':')[2]), expected,
+                         "Failed test: render snapshot")
+        with self.assertRaises(err.ShipRadarRenderError, msg="Failed test: render snapshot\nInvalid figure"):
+            self.renderer.render({"data": [{"type": "scattergeo", "lat": object()}]}, 800, 600).result(timeout=30)
+
+    def test_terminate(self):
+        """
+        Test for killing workers stuck in a render, the next render starts new workers
+        :return:
+        """
+        future = self.renderer.render(self.figure, 1, 600)
+        self.renderer.start()
+        time.sleep(1)
+        start = time.perf_counter()
+        self.renderer.terminate()
+        with self.assertRaises(err.ShipRadarRenderError, msg="Failed test: render terminate"):
+            future.result(timeout=10)
+        image = self.renderer.render(self.figure, 800, 600).result(timeout=30)
+        self.assertTrue(image.startswith(b"800x600.png"), "Failed test: render terminate\nRecovered")
+        self.renderer.close()
+        self.assertLess(time.perf_counter() - start, 30, "Failed test: render terminate\nWaited for stuck worker")
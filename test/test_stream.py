@@ -0,0 +1,166 @@
+"""
+Tests for stream.py module
+"""
+
+import socket
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from src.dataset import ShipRadarDataset
+from src.reader import HEADER, ShipRadarFilter
+from src.record import ShipRadarRecord
+from src.stream import ShipRadarAISDecoder, ShipRadarStreamReceiver
+
+POSITION = "!AIVDM,1,1,,B,15M67FC000G?ufbE`FepT@3n00Sa,0*5C"
+STATIC = ["!AIVDM,2,1,1,A,55?MbV02;H;s<HtKR20EHE:0@T4@Dn2222222216L961O5Gf0NSQEp6ClRp8,0*1C",
+          "!AIVDM,2,2,1,A,88888888880,2*25"]
+# POSITION with speed and heading not available
+POSITION_NOT_AVAILABLE = "!AIVDM,1,1,,B,15M67FC0?wG?ufbE`FepTOwn00Sa,0*5F"
+# Position report of the ship of STATIC
+STATIC_POSITION = "!AIVDM,1,1,,A,15?MbV?P00PD2wVMdLDRhgvL289?,0*46"
+
+
+class TestStream(unittest.TestCase):
+    """
+    Tests for ShipRadarAISDecoder and ShipRadarStreamReceiver classes
+    """
+    @classmethod
+    def setUpClass(cls):
+        with open('baza_reduced.csv', encoding='utf-8') as csvfile:
+            cls.lines = csvfile.read().splitlines()
+
+    def test_decode_position(self):
+        """
+        Test for decoding a position report
+        :return:
+        """
+        received = datetime(2012, 1, 1, 12, 30, tzinfo=timezone.utc)
+        record = ShipRadarAISDecoder().decode(POSITION, received)
+        self.assertEqual(record.ship_no, 366053209, "Failed test: stream decode position\nMMSI")
+        self.assertEqual(record.movement_date, datetime(2012, 1, 1, 12, 30),
+                         "Failed test: stream decode position\nTime")
+        self.assertAlmostEqual(record.latitude, 37.802118, 5, "Failed test: stream decode position\nLatitude")
+        self.assertAlmostEqual(record.longitude, -122.341618, 5, "Failed test: stream decode position\nLongitude")
+        self.assertEqual(record.move_status, "Restriced manoeuverability",
+                         "Failed test: stream decode position\nStatus")
+
+    def test_decode_not_available(self):
+        """
+        Test for speed and heading not available, kept as in CSV files instead of replaced with other values
+        :return:
+        """
+        record = ShipRadarAISDecoder().decode(POSITION_NOT_AVAILABLE)
+        self.assertEqual(record.heading, 511, "Failed test: stream decode not available\nHeading")
+        self.assertEqual(record.speed, 102.3, "Failed test: stream decode not available\nSpeed")
+        row = self.lines[1].split(';')
+        row[HEADER.index("Heading")], row[HEADER.index("Speed")] = "511", "102,3"
+        expected = ShipRadarRecord.from_values(0, row, {column: ind for ind, column in enumerate(HEADER)})
+        self.assertEqual((record.heading, record.speed), (expected.heading, expected.speed),
+                         "Failed test: stream decode not available\nDifferent from CSV")
+        self.assertFalse(ShipRadarFilter('heading', 300, None).match_record(record),
+                         "Failed test: stream decode not available\nHeading filter matched")
+
+    def test_decode_static(self):
+        """
+        Test for static data of a two sentence message filling rows of the ship
+        :return:
+        """
+        decoder = ShipRadarAISDecoder()
+        received = datetime(2012, 1, 1, 12, 30, tzinfo=timezone.utc)
+        self.assertIsNone(decoder.decode(STATIC[0], received), "Failed test: stream decode static\nFragment")
+        self.assertIsNone(decoder.decode(STATIC[1], received), "Failed test: stream decode static\nNo position")
+        record = decoder.decode(STATIC_POSITION, received)
+        self.assertEqual((record.ship_no, record.ship_name, record.ship_type), (9134270, "EVER DIADEM", "Cargo"),
+                         "Failed test: stream decode static")
+        self.assertEqual(record.draught, 12.2, "Failed test: stream decode static\nDraught")
+        self.assertEqual((record.destination, record.eta), ("NEW YORK", datetime(2012, 5, 15, 14)),
+                         "Failed test: stream decode static\nETA")
+
+    def test_decode_invalid(self):
+        """
+        Test for lines that don't make a row
+        :return:
+        """
+        decoder = ShipRadarAISDecoder()
+        for line in [POSITION[:-2] + "00", "", self.lines[0], "9566148;WINDSUPPLIER;Passenger", STATIC[1],
+                     self.lines[1].replace("55.47", "north")]:
+            with self.subTest(line=line):
+                self.assertIsNone(decoder.decode(line), "Failed test: stream decode invalid")
+        expected = ShipRadarRecord.from_values(0, self.lines[1].split(';'),
+                                               {column: ind for ind, column in enumerate(HEADER)})
+        self.assertEqual(decoder.decode(self.lines[1]), expected, "Failed test: stream decode row")
+
+    def test_tcp(self):
+        """
+        Test for receiving rows from a local TCP replay of a CSV file
+        :return:
+        """
+        server = socket.create_server(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+
+        def replay():
+            connection, _ = server.accept()
+            with connection:
+                connection.sendall("\n".join(self.lines + [POSITION]).encode() + b"\n")
+            server.close()
+
+        threading.Thread(target=replay, daemon=True).start()
+        dataset = ShipRadarDataset.empty()
+        batches = []
+        receiver = ShipRadarStreamReceiver(dataset, '127.0.0.1', port, on_batch=batches.append)
+        receiver.start()
+        # Lines of the file are the header and its rows, plus one AIS sentence
+        self.__wait(lambda: len(dataset) == len(self.lines))
+        receiver.stop()
+
+        expected = ShipRadarDataset.from_csv('baza_reduced.csv')
+        self.assertEqual(len(dataset), len(expected) + 1, "Failed test: stream TCP\nRows")
+        self.assertEqual(sum(len(ids) for ids in batches), len(dataset), "Failed test: stream TCP\nBatches")
+        self.assertEqual(len(dataset.select([ShipRadarFilter('ship_name', 'SILUNA ACE')])),
+                         len(expected.select([ShipRadarFilter('ship_name', 'SILUNA ACE')])),
+                         "Failed test: stream TCP\nFilter")
+
+    def test_udp(self):
+        """
+        Test for receiving AIS sentences over UDP
+        :return:
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        dataset = ShipRadarDataset.empty()
+        receiver = ShipRadarStreamReceiver(dataset, '127.0.0.1', port, protocol='udp')
+        receiver.start()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            sender.sendto("\n".join(STATIC).encode(), ('127.0.0.1', port))
+            sender.sendto(f"{POSITION}\n{STATIC_POSITION}".encode(), ('127.0.0.1', port))
+            self.__wait(lambda: len(dataset) == 2)
+        receiver.stop()
+        self.assertEqual(receiver.lines, 4, "Failed test: stream UDP\nLines")
+        self.assertEqual(dataset.frame["ShipName"].tolist(), ["", "EVER DIADEM"], "Failed test: stream UDP")
+
+    def test_udp_port_in_use(self):
+        """
+        Test for listening on a UDP port that is already in use
+        :return:
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            receiver = ShipRadarStreamReceiver(ShipRadarDataset.empty(), '127.0.0.1', probe.getsockname()[1],
+                                               protocol='udp')
+            with self.assertRaises(OSError, msg="Failed test: stream UDP port in use"):
+                receiver.start()
+        receiver.stop()
+
+    @staticmethod
+    def __wait(condition, timeout: float = 10.0) -> None:
+        """
+        Waits until a condition holds or the timeout passes
+        :param condition: function returning True once done
+        :param timeout: seconds to wait at most
+        :return: None
+        """
+        end = time.monotonic() + timeout
+        while not condition() and time.monotonic() < end:
+            time.sleep(0.05)
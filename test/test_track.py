@@ -0,0 +1,85 @@
+"""
+Tests for track.py module
+"""
+
+import time
+import unittest
+import numpy as np
+from src.dataset import ShipRadarDataset
+from src.reader import ShipRadarFilter
+from src.track import douglas_peucker, time_buckets
+
+
+class TestTrack(unittest.TestCase):
+    """
+    Tests for ShipRadarTrack class and track simplification
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = ShipRadarDataset.from_csv('baza_reduced.csv')
+        cls.tracks = cls.dataset.tracks(cls.dataset.select([ShipRadarFilter('ship_type', 'Passenger')]))
+
+    def test_douglas_peucker(self):
+        """
+        Test for dropping points of straight sections of a line
+        :return:
+        """
+        x = np.arange(7, dtype=float)
+        y = np.array([0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0])
+        self.assertEqual(np.flatnonzero(douglas_peucker(x, y, 0.1)).tolist(), [0, 2, 3, 4, 6],
+                         "Failed test: Douglas-Peucker")
+        self.assertEqual(np.flatnonzero(douglas_peucker(x, y, 2.0)).tolist(), [0, 6],
+                         "Failed test: Douglas-Peucker\nTolerance")
+        # A closed loop starts and ends at the same point
+        self.assertTrue(douglas_peucker(np.array([0.0, 1.0, 0.0]), np.array([0.0, 1.0, 0.0]), 0.1).all(),
+                        "Failed test: Douglas-Peucker\nLoop")
+        self.assertEqual(len(douglas_peucker(np.empty(0), np.empty(0), 0.1)), 0, "Failed test: Douglas-Peucker\nEmpty")
+
+    def test_douglas_peucker_large(self):
+        """
+        Test for simplifying many long tracks in bounded time, every dropped point stays within tolerance
+        :return:
+        """
+        rng = np.random.default_rng(0)
+        lines = [(8.0 + np.cumsum(rng.normal(0.0, 0.0003, 10000)), 55.0 + np.cumsum(rng.normal(0.0, 0.0003, 10000)))
+                 for _ in range(100)]
+        start = time.perf_counter()
+        kept = [douglas_peucker(x, y, 0.0005) for x, y in lines]
+        self.assertLess(time.perf_counter() - start, 3.0, "Failed test: Douglas-Peucker large\nToo slow")
+        x, y = lines[0]
+        self.assertLess(kept[0].sum(), len(x), "Failed test: Douglas-Peucker large\nNothing dropped")
+        ends = np.flatnonzero(kept[0])
+        for first, last in zip(ends[:-1], ends[1:]):
+            dx, dy = x[last] - x[first], y[last] - y[first]
+            px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+            distances = np.abs(dx * py - dy * px) / np.hypot(dx, dy)
+            self.assertTrue((distances <= 0.0005).all(), "Failed test: Douglas-Peucker large\nTolerance")
+
+    def test_time_buckets(self):
+        """
+        Test for keeping the first point of every interval
+        :return:
+        """
+        times = np.array(['2012-01-01T00:00', '2012-01-01T00:04', '2012-01-01T00:05', '2012-01-01T00:09',
+                          '2012-01-01T00:21'], dtype='datetime64[ms]')
+        self.assertEqual(np.flatnonzero(time_buckets(times, np.timedelta64(5, 'm'))).tolist(), [0, 2, 4],
+                         "Failed test: time buckets")
+
+    def test_simplify(self):
+        """
+        Test for simplified tracks keeping their ends and changes of status
+        :return:
+        """
+        for track in self.tracks:
+            for tolerance, minutes in [(0.01, None), (None, 60), (0.01, 60)]:
+                with self.subTest(ship_no=track.ship_no, tolerance=tolerance, minutes=minutes):
+                    simplified = track.simplify(tolerance, minutes)
+                    self.assertLess(len(simplified), len(track), "Failed test: simplify\nNothing dropped")
+                    self.assertTrue(np.isin(simplified.row_ids, track.row_ids).all(), "Failed test: simplify\nRows")
+                    self.assertEqual(simplified.row_ids[[0, -1]].tolist(), track.row_ids[[0, -1]].tolist(),
+                                     "Failed test: simplify\nEnds")
+                    statuses = track["MoveStatus"]
+                    changes = track.row_ids[1:][statuses[1:] != statuses[:-1]]
+                    self.assertTrue(np.isin(changes, simplified.row_ids).all(), "Failed test: simplify\nStatus")
+                    self.assertEqual(set(simplified.columns), set(track.columns), "Failed test: simplify\nColumns")
+            self.assertIs(track.simplify(), track, "Failed test: simplify\nNo simplification")